@@ -2,6 +2,7 @@
 # 这个程序会定期检测BNB 的余额，如果不够0.1 BNB，就自动购买BNB 并转入合约账户
 import time
 from binance.client import Client
+from rate_limiter import rate_limited
 from datetime import datetime
 
 
@@ -9,7 +10,7 @@ from key_config import apikey
 from key_config import apisecret
 
 # Initialize the Binance client
-client = Client(apikey, apisecret)
+client = rate_limited(Client(apikey, apisecret))
 
 
 def get_future_bnb_balance():
@@ -13,9 +13,7 @@ Spot RSI WebSocket Bot (timeframe from argv[1], default 1m)
 
 import time
 import threading
-import requests
 import pandas as pd
-import csv
 import traceback
 import sys
 from datetime import datetime
@@ -23,7 +21,13 @@ from flask import Flask, jsonify
 
 from ta.momentum import RSIIndicator
 from binance.client import Client
+from rate_limiter import rate_limited
 from binance import ThreadedWebsocketManager
+from candle_ring import CandleRing
+from telegram_notifier import TelegramNotifier
+from trade_journal import open_journal
+from order_timers import timers
+from batch_orders import cancel_orders, is_error
 
 from key_config import (
     apikey,
@@ -64,14 +68,13 @@ LOCAL_TZ = "America/Los_Angeles"
 # GLOBAL STATE
 # ============================================================
 
-client = Client(apikey, apisecret)
+client = rate_limited(Client(apikey, apisecret))
 twm = ThreadedWebsocketManager(api_key=apikey, api_secret=apisecret)
 
-klines_history = []
+candles = CandleRing(KL_HISTORY_LIMIT, ("close",))
 
 limit_buy_id = None
 limit_buy_timestamp = None
-cancel_event = None
 tp_id = None
 stoploss_limit_id = None
 stoploss_monitor_attempts = 0
@@ -96,45 +99,32 @@ def now_str():
         return datetime.now(ZoneInfo(LOCAL_TZ)).strftime("%Y-%m-%d %H:%M:%S")
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+notifier = TelegramNotifier(TELEGRAM_TOKEN, CHAT_ID)
+
 def send_telegram(msg):
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": msg})
-    except:
-        pass
+    notifier.send(msg)
 
 def send_exception_to_telegram(exc):
     text = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": f"Exception:\n{text}"})
-    except:
-        pass
+    notifier.send(f"Exception:\n{text}")
 
 
 # ============================================================
 # CSV Logging
 # ============================================================
 
-try:
-    with open(LOG_FILE, "x", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "Timestamp","Event","OrderID",
-            "EntryPrice","ExitPrice","Quantity",
-            "Profit","Notes"
-        ])
-except FileExistsError:
-    pass
+journal = open_journal(LOG_FILE, [
+    "Timestamp","Event","OrderID",
+    "EntryPrice","ExitPrice","Quantity",
+    "Profit","Notes"
+])
 
 def log_trade(event, order_id=None, entry=0, exit_price=0, quantity=0, profit=0, notes=""):
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            now_str(), event, order_id or "",
-            f"{entry:.8f}", f"{exit_price:.8f}",
-            f"{quantity:.8f}", f"{profit:.8f}", notes
-        ])
+    journal.write([
+        now_str(), event, order_id or "",
+        f"{entry:.8f}", f"{exit_price:.8f}",
+        f"{quantity:.8f}", f"{profit:.8f}", notes
+    ])
 
 # ============================================================
 # INIT KLINES
@@ -154,49 +144,38 @@ def timeframe_to_interval(tf):
     return mapping.get(tf, tf)
 
 def initialize_klines_history():
-    global klines_history
     try:
         interval = timeframe_to_interval(TIMEFRAME)
         klines = client.get_klines(symbol=SYMBOL, interval=interval, limit=KL_HISTORY_LIMIT)
-        klines_history = [float(k[4]) for k in klines]
-        print(f"[INIT] Loaded {len(klines_history)} historical closes.")
+        candles.clear()
+        candles.extend(close=[float(k[4]) for k in klines])
+        print(f"[INIT] Loaded {len(candles)} historical closes.")
     except Exception as e:
         print("[INIT ERROR]", e)
-        klines_history = []
+        candles.clear()
 
 # ============================================================
 # LIMIT BUY CANCEL TIMER
 # ============================================================
 
 def start_limit_buy_cancel_timer(order_id, timeout_seconds):
-    global cancel_event
-
-    cancel_event = threading.Event()
-
-    def worker():
-        waited = 0
-        while waited < timeout_seconds:
-            if cancel_event.is_set():
-                return
-            time.sleep(1)
-            waited += 1
-
-        with lock:
-            global limit_buy_id, limit_buy_timestamp, position_open
-            if limit_buy_id == order_id:
-                try:
-                    client.cancel_order(symbol=SYMBOL, orderId=order_id)
-                    send_telegram(f"Cancelled unfilled BUY {order_id}")
-                    log_trade("BUY_CANCELLED_TIMEOUT", order_id)
-                except:
-                    pass
-                limit_buy_id = None
-                limit_buy_timestamp = None
-                position_open = False
-
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return cancel_event
+    timers.schedule(order_id, timeout_seconds, expire_limit_buys)
+
+
+def expire_limit_buys(order_ids):
+    global limit_buy_id, limit_buy_timestamp, position_open
+
+    with lock:
+        due = [oid for oid in order_ids if oid == limit_buy_id]
+        if not due:
+            return
+        for oid, result in zip(due, cancel_orders(client, SYMBOL, due, market="spot")):
+            if not is_error(result):
+                send_telegram(f"Cancelled unfilled BUY {oid}")
+                log_trade("BUY_CANCELLED_TIMEOUT", oid)
+        limit_buy_id = None
+        limit_buy_timestamp = None
+        position_open = False
 
 
 # ============================================================
@@ -292,8 +271,7 @@ def user_data_handler(msg):
             position_open = True
             limit_buy_id = None
 
-            if cancel_event:
-                cancel_event.set()
+            timers.cancel(order_id)
 
             log_trade("BUY_FILLED", order_id, entry=entry_price, quantity=QUANTITY)
             send_telegram(f"Buy filled @ {entry_price}")
@@ -301,6 +279,7 @@ def user_data_handler(msg):
             place_take_profit(entry_price)
 
         elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
+            timers.cancel(order_id)
             limit_buy_id = None
             position_open = False
 
@@ -326,7 +305,7 @@ def user_data_handler(msg):
 # ============================================================
 
 def kline_handler(msg):
-    global klines_history, position_open
+    global position_open
     global limit_buy_id, limit_buy_timestamp
     global stoploss_limit_id, stoploss_monitor_attempts, entry_price
 
@@ -335,16 +314,13 @@ def kline_handler(msg):
         return
 
     close_price = float(k["c"])
-    klines_history.append(close_price)
-
-    if len(klines_history) > KL_HISTORY_LIMIT:
-        klines_history.pop(0)
+    candles.append(close=close_price)
 
     # Need RSI_PERIOD+1 candles
-    if len(klines_history) < RSI_PERIOD + 2:
+    if len(candles) < RSI_PERIOD + 2:
         return
 
-    df = pd.DataFrame({"close": klines_history})
+    df = pd.DataFrame({"close": candles["close"]})
     df["rsi"] = RSIIndicator(df["close"], RSI_PERIOD).rsi()
 
     rsi_prev = df["rsi"].iloc[-2]
@@ -16,9 +16,7 @@ Spot EMA WebSocket Bot (timeframe from argv[1], default 5m)
 
 import time
 import threading
-import requests
 import pandas as pd
-import csv
 import traceback
 import sys
 from datetime import datetime
@@ -29,7 +27,13 @@ except Exception:
 from flask import Flask, jsonify
 from binance import ThreadedWebsocketManager
 from binance.client import Client
+from rate_limiter import rate_limited
 from ta.trend import EMAIndicator
+from candle_ring import CandleRing
+from telegram_notifier import TelegramNotifier
+from trade_journal import open_journal
+from order_timers import timers
+from batch_orders import cancel_orders, is_error
 from key_config import apikey, apisecret, TELEGRAM_TOKEN, CHAT_ID
 
 # -----------------------------
@@ -58,13 +62,12 @@ LOCAL_TZ = "America/Los_Angeles"  # for readable timestamps
 # -----------------------------
 # GLOBAL STATE
 # -----------------------------
-client = Client(apikey, apisecret)
+client = rate_limited(Client(apikey, apisecret))
 twm = ThreadedWebsocketManager(api_key=apikey, api_secret=apisecret)
 
 # order / position tracking
 limit_buy_id = None
 limit_buy_timestamp = None
-cancel_event = None
 tp_id = None
 # stop-loss limit order created when SL triggers
 stoploss_limit_id = None
@@ -78,7 +81,7 @@ total_profit = 0.0
 last_trade = None  # store last trade info dict
 
 # kline history for indicators
-klines_history = []
+candles = CandleRing(KL_HISTORY_LIMIT, ("close",))
 
 # sync lock
 lock = threading.Lock()
@@ -96,37 +99,24 @@ def now_str():
     else:
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+notifier = TelegramNotifier(TELEGRAM_TOKEN, CHAT_ID)
+
 def send_telegram(msg: str):
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": msg}, timeout=10)
-    except Exception as e:
-        print(f"[{now_str()}] [TELEGRAM ERROR] {e}")
+    notifier.send(msg)
 
 def send_exception_to_telegram(exc: BaseException):
     text = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
     payload = f"?? <b>Bot Exception</b>\n<pre>{text}</pre>"
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": payload, "parse_mode": "HTML"}, timeout=10)
-    except Exception as e:
-        print(f"[{now_str()}] [TELEGRAM ERROR] failed to send exception: {e}")
+    notifier.send(payload, parse_mode="HTML")
 
 # -----------------------------
 # CSV Logging
 # -----------------------------
-try:
-    with open(LOG_FILE, "x", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Timestamp", "Event", "OrderID", "EntryPrice", "ExitPrice", "Quantity", "P/L", "Notes"])
-except FileExistsError:
-    pass
+journal = open_journal(LOG_FILE, ["Timestamp", "Event", "OrderID", "EntryPrice", "ExitPrice", "Quantity", "P/L", "Notes"])
 
 def log_trade(event, order_id=None, entry=0.0, exit_price=0.0, quantity=0.0, profit=0.0, notes=""):
     ts = now_str()
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([ts, event, order_id or "", f"{entry:.8f}" if entry else "", f"{exit_price:.8f}" if exit_price else "", f"{quantity:.8f}" if quantity else "", f"{profit:.8f}" if profit else "", notes])
+    journal.write([ts, event, order_id or "", f"{entry:.8f}" if entry else "", f"{exit_price:.8f}" if exit_price else "", f"{quantity:.8f}" if quantity else "", f"{profit:.8f}" if profit else "", notes])
     print(f"[{ts}] [LOG] {event} order={order_id} entry={entry} exit_price={exit_price} profit={profit} notes={notes}")
 
 # -----------------------------
@@ -154,17 +144,17 @@ def timeframe_to_interval(tf: str):
     return mapping.get(tf, tf)
 
 def initialize_klines_history(limit=KL_HISTORY_LIMIT):
-    global klines_history
     try:
         print(f"[{now_str()}] [INIT] Fetching {limit} historical {TIMEFRAME} klines...")
         interval = timeframe_to_interval(TIMEFRAME)
         klines = client.get_klines(symbol=SYMBOL, interval=interval, limit=limit)
-        klines_history = [float(k[4]) for k in klines]  # close prices
-        print(f"[{now_str()}] [INIT] Loaded {len(klines_history)} historical closes.")
+        candles.clear()
+        candles.extend(close=[float(k[4]) for k in klines])  # close prices
+        print(f"[{now_str()}] [INIT] Loaded {len(candles)} historical closes.")
     except Exception as e:
         print(f"[{now_str()}] [INIT ERROR] {e}")
         send_exception_to_telegram(e)
-        klines_history = []
+        candles.clear()
 
 # -----------------------------
 # Reconcile open orders on startup
@@ -198,42 +188,30 @@ def reconcile_open_orders():
         send_exception_to_telegram(e)
 
 # -----------------------------
-# Cancel timer thread for limit buy
+# Cancel timer for limit buy (shared order_timers thread)
 # -----------------------------
 def start_limit_buy_cancel_timer(order_id: int, timeout_seconds: int):
-    global cancel_event
-    cancel_event = threading.Event()
-
-    def worker():
-        print(f"[{now_str()}] [CANCEL-TIMER] Started for order {order_id}. Timeout {timeout_seconds}s")
-        waited = 0
-        while waited < timeout_seconds:
-            if cancel_event.is_set():
-                print(f"[{now_str()}] [CANCEL-TIMER] Event set - not canceling {order_id}")
-                return
-            time.sleep(1)
-            waited += 1
-        # timed out -> cancel if still outstanding
-        with lock:
-            global limit_buy_id, limit_buy_timestamp, position_open
-            if limit_buy_id == order_id:
-                try:
-                    print(f"[{now_str()}] [CANCEL-TIMER] Canceling unfilled limit buy {order_id} ...")
-                    client.cancel_order(symbol=SYMBOL, orderId=order_id)
-                    send_telegram(f" Cancelled unfilled limit buy {order_id} after {timeout_seconds//60} minutes")
-                    log_trade("CANCELLED_UNFILLED_BUY", order_id, notes=f"Timed out {timeout_seconds}s")
-                except Exception as e:
-                    print(f"[{now_str()}] [CANCEL-TIMER ERROR] {e}")
-                    send_exception_to_telegram(e)
-                finally:
-                    limit_buy_id = None
-                    limit_buy_timestamp = None
-                    position_open = False
-        print(f"[{now_str()}] [CANCEL-TIMER] Worker exiting for {order_id}")
+    print(f"[{now_str()}] [CANCEL-TIMER] Started for order {order_id}. Timeout {timeout_seconds}s")
+    timers.schedule(order_id, timeout_seconds, expire_limit_buys)
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return cancel_event
+def expire_limit_buys(order_ids):
+    """Timed out -> cancel the limit buys that are still outstanding, in one batch."""
+    global limit_buy_id, limit_buy_timestamp, position_open
+    with lock:
+        due = [oid for oid in order_ids if oid == limit_buy_id]
+        if not due:
+            return
+        print(f"[{now_str()}] [CANCEL-TIMER] Canceling unfilled limit buys {due} ...")
+        for oid, result in zip(due, cancel_orders(client, SYMBOL, due, market="spot")):
+            if is_error(result):
+                print(f"[{now_str()}] [CANCEL-TIMER ERROR] {oid}: {result.get('msg')}")
+                send_telegram(f"Cancel of unfilled limit buy {oid} failed: {result.get('msg')}")
+            else:
+                send_telegram(f" Cancelled unfilled limit buy {oid} after {CANCEL_AFTER//60} minutes")
+                log_trade("CANCELLED_UNFILLED_BUY", oid, notes=f"Timed out {CANCEL_AFTER}s")
+        limit_buy_id = None
+        limit_buy_timestamp = None
+        position_open = False
 
 # -----------------------------
 # Place take-profit (limit sell)
@@ -322,7 +300,7 @@ def execute_manual_sl(current_price: float):
 # User data handler (executionReport)
 # -----------------------------
 def user_data_handler(msg):
-    global limit_buy_id, limit_buy_timestamp, cancel_event, tp_id, stoploss_limit_id, stoploss_monitor_attempts, entry_price, position_open, successful_trades, total_profit, last_trade
+    global limit_buy_id, limit_buy_timestamp, tp_id, stoploss_limit_id, stoploss_monitor_attempts, entry_price, position_open, successful_trades, total_profit, last_trade
     try:
         if msg.get("e") != "executionReport":
             return
@@ -339,8 +317,7 @@ def user_data_handler(msg):
                     entry_price = last_filled_price
                     print(f"[{now_str()}] [USER EVENT] Limit BUY FILLED at {entry_price} (order {order_id})")
                     send_telegram(f"Limit Buy FILLED at {entry_price} (order {order_id})")
-                    if cancel_event:
-                        cancel_event.set()
+                    timers.cancel(order_id)
                     limit_buy_id = None
                     limit_buy_timestamp = None
                     # Place only TP at entry (NO SL order)
@@ -351,8 +328,7 @@ def user_data_handler(msg):
                 elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
                     print(f"[{now_str()}] [USER EVENT] Limit BUY {order_id} was {status}. Clearing state.")
                     send_telegram(f"Limit Buy {order_id} {status}.")
-                    if cancel_event:
-                        cancel_event.set()
+                    timers.cancel(order_id)
                     limit_buy_id = None
                     limit_buy_timestamp = None
                     position_open = False
@@ -421,7 +397,7 @@ def user_data_handler(msg):
 # Kline handler: compute EMAs, trigger buy on crossover, and monitor SL limit
 # -----------------------------
 def kline_handler(msg):
-    global klines_history, limit_buy_id, limit_buy_timestamp, position_open, entry_price, tp_id, cancel_event
+    global limit_buy_id, limit_buy_timestamp, position_open, entry_price, tp_id
     global stoploss_limit_id, stoploss_monitor_attempts
     try:
         k = msg.get('k', {})
@@ -436,13 +412,11 @@ def kline_handler(msg):
             return
 
         # Append closed candle price
-        klines_history.append(close_price)
-        if len(klines_history) > KL_HISTORY_LIMIT:
-            klines_history.pop(0)
+        candles.append(close=close_price)
 
         # Need at least EMA_SLOW + 1 candles for a valid previous and current EMA
-        if len(klines_history) >= EMA_SLOW + 1:
-            df = pd.DataFrame({'close': klines_history})
+        if len(candles) >= EMA_SLOW + 1:
+            df = pd.DataFrame({'close': candles["close"]})
 
             # Compute EMAs
             df["ema_fast"] = EMAIndicator(df["close"], window=EMA_FAST).ema_indicator()
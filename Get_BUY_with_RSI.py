@@ -1,38 +1,128 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 from binance.client import Client
-import pandas as pd
-import ta
+from rate_limiter import rate_limited
+from requests.adapters import HTTPAdapter
+import numpy as np
 import sys
 import os
 
-if( len(sys.argv) >= 2):
-    interval = sys.argv [1]
-else
+# Usage: python Get_BUY_with_RSI.py [interval] [--watch]
+#   --watch keeps scanning; after the first full scan only the newest
+#   candles of each symbol are fetched.
+
+args = [a for a in sys.argv[1:] if not a.startswith("--")]
+if( len(args) >= 1):
+    interval = args[0]
+else:
     interval = '4h'
+WATCH = "--watch" in sys.argv
 
 print("interval is ", interval)
 
+RSI_WINDOW = 6
+HISTORY = 100           # candles per symbol
+MAX_WORKERS = 16        # concurrent kline requests, the limiter bounds the weight
+WATCH_SECONDS = 60
+
 API_key =os.environ.get("binance_api_key")
 Security_key = os.environ.get("binance_security_key")
-client = Client(API_key, Security_key)
+client = rate_limited(Client(API_key, Security_key))
+client.session.mount("https://", HTTPAdapter(pool_maxsize=MAX_WORKERS))
+
+
+def fetch_all(symbols, limit):
+    """Fetch the last `limit` klines of every symbol concurrently; None where a request failed."""
+    def fetch(symbol):
+        try:
+            return client.get_klines(symbol=symbol, interval=interval, limit=limit)
+        except Exception as e:
+            print(symbol, " failed to get klines: ", e)
+            return None
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return list(pool.map(fetch, symbols))
+
+
+def build_matrix(symbols, bars_list):
+    """Stack the closes into a (symbols x HISTORY) matrix.
+
+    Short histories (new listings) are left-padded with their first close; the
+    zero moves it adds do not change the RSI of the real candles.
+    """
+    kept, open_times = [], []
+    closes = np.empty((len(symbols), HISTORY))
+    for symbol, bars in zip(symbols, bars_list):
+        if not bars:
+            continue
+        row = np.array([float(b[4]) for b in bars[-HISTORY:]])
+        closes[len(kept), :HISTORY - len(row)] = row[0]
+        closes[len(kept), HISTORY - len(row):] = row
+        kept.append(symbol)
+        open_times.append(bars[-1][0])
+    return kept, closes[:len(kept)], np.array(open_times, dtype=np.int64)
+
+
+def update_matrix(closes, open_times, bars_list):
+    """Apply the newest klines (oldest first) of each symbol in place."""
+    for s, bars in enumerate(bars_list):
+        if not bars:
+            continue
+        for b in bars:
+            if b[0] < open_times[s]:
+                continue
+            if b[0] > open_times[s]:
+                # a new candle opened: shift the window left by one
+                closes[s, :-1] = closes[s, 1:]
+                open_times[s] = b[0]
+            closes[s, -1] = float(b[4])
+
+
+def rsi_matrix(closes, window):
+    """Wilder RSI of every row, same values as ta.momentum.RSIIndicator(window=window)."""
+    diff = np.diff(closes, axis=1, prepend=closes[:, :1])
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    alpha = 1.0 / window
+    avg_up = np.empty_like(up)
+    avg_down = np.empty_like(down)
+    avg_up[:, 0] = up[:, 0]
+    avg_down[:, 0] = down[:, 0]
+    for t in range(1, closes.shape[1]):
+        avg_up[:, t] = avg_up[:, t - 1] + alpha * (up[:, t] - avg_up[:, t - 1])
+        avg_down[:, t] = avg_down[:, t - 1] + alpha * (down[:, t] - avg_down[:, t - 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_down == 0, 100.0, 100 - 100 / (1 + avg_up / avg_down))
+    rsi[:, :window - 1] = np.nan
+    return rsi
+
+
+def buy_signals(rsi):
+    """Rows where RSI crossed above 30 within the last 3 candles and stayed there."""
+    r = lambda k: rsi[:, -k]
+    cross_2 = (r(1) >= 30) & (r(2) > 30) & (r(3) < 30) & (r(4) < 30)
+    cross_3 = (r(1) >= 30) & (r(2) > 30) & (r(3) > 30) & (r(4) < 30) & (r(5) < 30)
+    cross_4 = (r(1) >= 30) & (r(2) > 30) & (r(3) > 30) & (r(4) > 30) & (r(5) < 30) & (r(6) < 30)
+    return cross_2 | cross_3 | cross_4
+
+
+def report(symbols, closes):
+    for s in np.flatnonzero(buy_signals(rsi_matrix(closes, RSI_WINDOW))):
+        print(symbols[s], " RSI crossed above 30, Buy signal triggered.")
 
-def get_data_frame(symbol, interval):
-    bars = client.get_historical_klines(symbol, interval, limit=100)
-    for line in bars:
-        # Keep only first 5 columns, "date" "open" "high" "low" "close"
-        del line[5:]
-    df = pd.DataFrame(bars, columns=['date', 'open', 'high', 'low', 'close']) #  2 dimensional tabular data
-    return df
 
 info = client.get_exchange_info()
-for c in info['symbols']:
-    if c['quoteAsset']=='USDT' and c['status']=="TRADING":
-        symbol_df = get_data_frame(c['symbol'],interval)
-        rsi= ta.momentum.RSIIndicator(pd.to_numeric(symbol_df.close), window=6).rsi()
-        if( ( rsi.iloc[-1] >=30 ) and ( rsi.iloc[-2] >30 ) and ( rsi.iloc[-3] < 30)  and ( rsi.iloc[-4] <30 )):
-            print(c['symbol'], " RSI crossed above 30, Buy signal triggered.")
-        elif( ( rsi.iloc[-1] >=30 ) and ( rsi.iloc[-2] >30 ) and ( rsi.iloc[-3] > 30)  and ( rsi.iloc[-4] <30 ) and ( rsi.iloc[-5] <30 )):
-            print(c['symbol'], " RSI crossed above 30, Buy signal triggered.")
-        elif( ( rsi.iloc[-1] >=30 ) and ( rsi.iloc[-2] >30 ) and ( rsi.iloc[-3] > 30)  and ( rsi.iloc[-4] >30 ) and ( rsi.iloc[-5] <30 ) and ( rsi.iloc[-6] <30 )):
-            print(c['symbol'], " RSI crossed above 30, Buy signal triggered.")
-        #time.sleep(1)
\ No newline at end of file
+symbols = [c['symbol'] for c in info['symbols'] if c['quoteAsset']=='USDT' and c['status']=="TRADING"]
+
+start = time.time()
+symbols, closes, open_times = build_matrix(symbols, fetch_all(symbols, HISTORY))
+report(symbols, closes)
+print("scanned %d symbols in %.1fs" % (len(symbols), time.time() - start))
+
+while WATCH:
+    time.sleep(WATCH_SECONDS)
+    start = time.time()
+    # the previous candle may have closed since the last scan, so take two
+    update_matrix(closes, open_times, fetch_all(symbols, 2))
+    print(time.strftime("%Y-%m-%d %H:%M:%S"))
+    report(symbols, closes)
+    print("scanned %d symbols in %.1fs" % (len(symbols), time.time() - start))
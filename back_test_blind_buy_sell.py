@@ -1,12 +1,15 @@
 from binance.client import Client
+from rate_limiter import rate_limited
 import pandas as pd
 import pytz
 from datetime import datetime, timedelta
-import time
 
 from key_config import apikey, apisecret
+from kline_store import KlineStore
+from backtest_engine import run_backtest, summarize, EXPIRED, OPEN, TP
 
-client = Client(apikey, apisecret)
+client = rate_limited(Client(apikey, apisecret))
+store = KlineStore()
 
 # Config
 symbol = "BTCFDUSD"
@@ -17,45 +20,11 @@ TP_MULTIPLIER = 1.0015     # +0.15%
 SL_MULTIPLIER = 0.99       # -1%
 ORDER_EXPIRATION = 10      # 10 candles (150 min)
 tz = pytz.timezone("America/Los_Angeles")
-MAX_LIMIT = 1000           # Binance max candles per request
 
 
 def fetch_historical_ohlcv(symbol, timeframe, days_back=30):
-    """Fetch OHLCV for the past X days, handling pagination due to Binance 1000-candle limit."""
-    all_klines = []
-    end_time = int(time.time() * 1000)  # now in ms
-    start_time = end_time - days_back * 24 * 60 * 60 * 1000  # days_back in ms
-
-    while start_time < end_time:
-        klines = client.get_historical_klines(
-            symbol=symbol,
-            interval=timeframe,
-            start_str=start_time,
-            end_str=end_time,
-            limit=MAX_LIMIT
-        )
-
-        if not klines:
-            break
-
-        all_klines += klines
-
-        last_open_time = klines[-1][0]
-        start_time = last_open_time + 1  # avoid overlap
-
-        if len(klines) < MAX_LIMIT:
-            break
-
-        time.sleep(0.2)  # avoid rate limits
-
-    df = pd.DataFrame(all_klines, columns=[
-        "timestamp","open","high","low","close","volume",
-        "close_time","quote_volume","trades",
-        "taker_base_volume","taker_quote_volume","ignored"
-    ])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms").dt.tz_localize("UTC").dt.tz_convert(tz)
-    df[["open","high","low","close"]] = df[["open","high","low","close"]].astype(float)
-    return df
+    """Fetch OHLCV for the past X days through the local kline store (only missing candles are downloaded)."""
+    return store.fetch_ohlcv(client, symbol, timeframe, days_back=days_back, tz=tz)
 
 
 def backtest():
@@ -64,78 +33,46 @@ def backtest():
         print("No data. Exiting.")
         return
 
-    total_profit = 0
-    successful_trades = 0
-    total_trades = 0
-
-    i = 3  # buffer
-
-    while i < len(df) - ORDER_EXPIRATION - 1:
-
-        attempt_index = i
-        close_price = df["close"].iloc[attempt_index]
-        ts = df["timestamp"].iloc[attempt_index].strftime("%Y-%m-%d %H:%M:%S")
+    # A limit buy is attempted on every candle
+    buy_signal = pd.Series(True, index=df.index)
 
-        limit_buy_price = close_price * BUY_DISCOUNT
-        tp_price = limit_buy_price * TP_MULTIPLIER
-        sl_price = limit_buy_price * SL_MULTIPLIER
+    trades = run_backtest(
+        buy_signal.to_numpy(), df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(),
+        TP_MULTIPLIER, SL_MULTIPLIER, buy_discount=BUY_DISCOUNT,
+        order_expiration=ORDER_EXPIRATION, quantity=quantity, start=3  # buffer
+    )
 
+    # Only format timestamps for candles where something happened
+    for t in trades:
+        ts = df["timestamp"].iloc[t.signal_idx].strftime("%Y-%m-%d %H:%M:%S")
         print(
             f"\nPLACED LIMIT BUY 🔔 | {ts}\n"
-            f"  Limit Buy @ {limit_buy_price:.2f} (-0.20%)\n"
+            f"  Limit Buy @ {t.entry_price:.2f} (-0.20%)\n"
             f"  Expires in {ORDER_EXPIRATION} candles\n"
-            f"  TP = {tp_price:.2f} (+0.15%)\n"
-            f"  SL = {sl_price:.2f} (-1%)\n"
+            f"  TP = {t.tp_price:.2f} (+0.15%)\n"
+            f"  SL = {t.sl_price:.2f} (-1%)\n"
         )
-
-        # Step 1: Check the next ORDER_EXPIRATION candles for buy fill
-        buy_filled = False
-        expiration_index = attempt_index + ORDER_EXPIRATION
-
-        for j in range(attempt_index + 1, min(expiration_index + 1, len(df))):
-            low_ = df["low"].iloc[j]
-            ts_j = df["timestamp"].iloc[j].strftime("%Y-%m-%d %H:%M:%S")
-            if low_ <= limit_buy_price:
-                buy_filled = True
-                fill_index = j
-                print(f"BUY FILLED ✔ | {ts_j} | Fill Price: {limit_buy_price:.2f}")
-                total_trades += 1
-                break
-
-        if not buy_filled:
+        if t.outcome == EXPIRED:
             print("❌ Buy order EXPIRED after 10 candles. Restarting with new price.\n")
-            i = expiration_index
             continue
 
-        # Step 2: After fill, check TP or SL
-        trade_closed = False
-        for k in range(fill_index + 1, len(df)):
-            high2 = df["high"].iloc[k]
-            low2  = df["low"].iloc[k]
-            ts_k  = df["timestamp"].iloc[k].strftime("%Y-%m-%d %H:%M:%S")
-
-            if high2 >= tp_price:
-                profit = (tp_price - limit_buy_price) * quantity
-                total_profit += profit
-                successful_trades += 1
-                print(f"TP HIT ✔ | {ts_k} | Profit: {profit:.4f} USDC\n")
-                i = k
-                trade_closed = True
-                break
-
-            if low2 <= sl_price:
-                profit = (sl_price - limit_buy_price) * quantity
-                total_profit += profit
-                print(f"STOP LOSS ❌ | {ts_k} | Loss: {profit:.4f} USDC\n")
-                i = k
-                trade_closed = True
-                break
-
-        if not trade_closed:
+        ts_j = df["timestamp"].iloc[t.fill_idx].strftime("%Y-%m-%d %H:%M:%S")
+        print(f"BUY FILLED ✔ | {ts_j} | Fill Price: {t.entry_price:.2f}")
+
+        if t.outcome == OPEN:
             print("Trade open at end of data. Stopping.\n")
             break
 
-        i += 1
+        ts_k = df["timestamp"].iloc[t.exit_idx].strftime("%Y-%m-%d %H:%M:%S")
+        if t.outcome == TP:
+            print(f"TP HIT ✔ | {ts_k} | Profit: {t.profit:.4f} USDC\n")
+        else:
+            print(f"STOP LOSS ❌ | {ts_k} | Loss: {t.profit:.4f} USDC\n")
+
+    stats = summarize(trades)
+    total_trades = stats["total_trades"]
+    successful_trades = stats["successful_trades"]
+    total_profit = stats["total_profit"]
 
     # Summary with start/end timestamps and prices
     start_time = df["timestamp"].iloc[0].strftime("%Y-%m-%d %H:%M:%S")
@@ -1,13 +1,15 @@
 from binance.client import Client
+from rate_limiter import rate_limited
 import pandas as pd
 import pytz
 from datetime import datetime
 
 from key_config import apikey
 from key_config import apisecret
+from backtest_engine import run_backtest, summarize, TP, SL
 
 # Binance Futures configuration
-client = Client(apikey, apisecret, testnet=True)
+client = rate_limited(Client(apikey, apisecret, testnet=True))
 
 # Trading parameters
 symbol = 'BTCUSDC'
@@ -45,10 +47,6 @@ def calculate_ema(df, period):
     """Calculate EMA for the given period."""
     return df['close'].ewm(span=period, adjust=False).mean()
 
-def is_negative_candle(row):
-    """Check if a candle is negative (close < open)."""
-    return row['close'] < row['open']
-
 def backtest():
     """Backtest the EMA strategy with profit target and stop loss."""
     # Fetch the most recent 50 candles
@@ -61,61 +59,32 @@ def backtest():
     # Calculate EMA
     df['ema'] = calculate_ema(df, ema_period)
     
-    total_profit = 0.0
-    successful_trades = 0
-    total_trades = 0
-    
-    # Start after enough data for EMA and 2 previous candles
-    i = ema_period + 2
-    while i < len(df) - 1:
-        current_price = df['close'].iloc[i]
-        latest_ema = df['ema'].iloc[i]
-        candle_time = df['timestamp'].iloc[i].tz_convert(tz).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Print price and EMA check
-        print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | {candle_time}: current_price: {current_price}, latest_ema: {latest_ema}")
+    # Buy condition: 3 consecutive negative candles (including current) and price 0.3% below EMA
+    negative = df['close'] < df['open']
+    negative_candles = negative & negative.shift(1, fill_value=False) & negative.shift(2, fill_value=False)
+    buy_signal = negative_candles & (df['close'] < df['ema'] * (1 - buy_threshold))
 
-        # Check for three consecutive negative candles (including current)
-        negative_candles = all(is_negative_candle(df.iloc[j]) for j in range(i-2, i+1))
+    # Market buy at the signal close, then first-touch TP/SL on the following candles
+    trades = run_backtest(
+        buy_signal.to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+        1 + profit_target, 1 - stop_loss_threshold, quantity=quantity,
+        start=ema_period + 2  # Start after enough data for EMA and 2 previous candles
+    )
 
-        # Check buy condition: 3 negative candles and price 0.3% below EMA
-        if negative_candles and current_price < latest_ema * (1 - buy_threshold):
-            buy_price = current_price
-            profit_price = buy_price * (1 + profit_target)  # 0.3% profit
-            stop_loss_price = buy_price * (1 - stop_loss_threshold)  # 1% stop loss
-            total_trades += 1
-            
-            # Simulate trade outcome by checking subsequent candles
-            trade_closed = False
-            for j in range(i + 1, len(df)):
-                high_price = df['high'].iloc[j]
-                low_price = df['low'].iloc[j]
-                
-                # Check if profit target is hit first
-                if high_price >= profit_price:
-                    trade_profit = (profit_price - buy_price) * quantity
-                    total_profit += trade_profit
-                    successful_trades += 1
-                    print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {buy_price}, Take Profit at {profit_price}, Profit: {trade_profit} USDC")
-                    trade_closed = True
-                    i = j  # Move to the candle after the trade closes
-                    break
-                
-                # Check if stop loss is hit first
-                if low_price <= stop_loss_price:
-                    trade_profit = (stop_loss_price - buy_price) * quantity
-                    total_profit += trade_profit
-                    print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {buy_price}, Stop Loss at {stop_loss_price}, Loss: {trade_profit} USDC")
-                    trade_closed = True
-                    i = j  # Move to the candle after the trade closes
-                    break
-            
+    for t in trades:
+        candle_time = df['timestamp'].iloc[t.signal_idx].tz_convert(tz).strftime('%Y-%m-%d %H:%M:%S')
+        if t.outcome == TP:
+            print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {t.entry_price}, Take Profit at {t.exit_price}, Profit: {t.profit} USDC")
+        elif t.outcome == SL:
+            print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {t.entry_price}, Stop Loss at {t.exit_price}, Loss: {t.profit} USDC")
+        else:
             # If trade not closed (end of data), assume it remains open and skip
-            if not trade_closed:
-                print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {buy_price}, Not closed by end of data")
-                break
-        
-        i += 1
+            print(f"{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')} | Trade at {candle_time}: Buy at {t.entry_price}, Not closed by end of data")
+
+    stats = summarize(trades)
+    total_profit = stats["total_profit"]
+    successful_trades = stats["successful_trades"]
+    total_trades = stats["total_trades"]
     
     # Calculate success ratio
     success_ratio = successful_trades / total_trades if total_trades > 0 else 0
@@ -0,0 +1,203 @@
+"""
+NumPy backtest engine shared by the backtest scripts.
+
+Same semantics as the original per-row loops:
+  - a signal on candle i places a limit buy at close[i] * buy_discount
+    (or buys at close[i] when order_expiration is None)
+  - the buy fills on the first of the next `order_expiration` candles whose
+    low touches the limit price, otherwise it expires and the scan resumes at
+    candle i + order_expiration
+  - after the fill, the first candle with high >= TP closes the trade as TP,
+    otherwise the first candle with low <= SL closes it as SL (TP wins ties)
+  - the scan resumes on the candle after the exit
+
+A candle that touches both TP and SL does not say which came first. Pass
+`resolve=IntraCandleResolver(...)` to run_backtest to settle those candles
+on 1s klines instead of the TP-wins rule; only the ambiguous candles are
+looked up, so the rest of the run stays vectorized.
+
+First-touch indices are found with vectorized comparisons over doubling
+windows of the high/low arrays, so only the candles up to the hit are read
+and there is no per-candle Python work between signals.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+
+EXPIRED = "EXPIRED"
+TP = "TP"
+SL = "SL"
+OPEN = "OPEN"
+
+Trade = namedtuple("Trade", [
+    "signal_idx", "fill_idx", "exit_idx", "outcome",
+    "entry_price", "tp_price", "sl_price", "exit_price", "profit",
+])
+
+_FIRST_CHUNK = 64
+
+
+def first_touch(arr, level, start, stop=None, above=True):
+    """Index of the first arr[k] >= level (above) or <= level (below) in [start, stop), else -1."""
+    stop = len(arr) if stop is None else min(stop, len(arr))
+    chunk = _FIRST_CHUNK
+    while start < stop:
+        end = min(start + chunk, stop)
+        seg = arr[start:end]
+        hit = seg >= level if above else seg <= level
+        k = int(hit.argmax())
+        if hit[k]:
+            return start + k
+        start = end
+        chunk *= 2
+    return -1
+
+
+def first_exit(high, low, start, tp_price, sl_price, resolve=None):
+    """Return (index, TP|SL) of the first candle from `start` touching TP or SL, or (-1, None).
+
+    When that candle touches both, resolve(index, tp_price, sl_price) picks the
+    outcome if given, otherwise TP wins.
+    """
+    stop = len(high)
+    chunk = _FIRST_CHUNK
+    while start < stop:
+        end = min(start + chunk, stop)
+        tp_hit = high[start:end] >= tp_price
+        sl_hit = low[start:end] <= sl_price
+        hit = tp_hit | sl_hit
+        k = int(hit.argmax())
+        if hit[k]:
+            if tp_hit[k] and sl_hit[k] and resolve is not None:
+                return start + k, resolve(start + k, tp_price, sl_price)
+            return start + k, (TP if tp_hit[k] else SL)
+        start = end
+        chunk *= 2
+    return -1, None
+
+
+def run_backtest(signal, high, low, close, tp_multiplier, sl_multiplier,
+                 buy_discount=1.0, order_expiration=None, quantity=1.0, start=0, resolve=None):
+    """Simulate one position at a time over boolean `signal` and return a list of Trades.
+
+    Expired limit orders are reported with outcome EXPIRED and a trade still open
+    at the end of the data with outcome OPEN (the simulation stops there).
+    `resolve` settles candles that touch both TP and SL (see first_exit).
+    """
+    signal = np.asarray(signal, dtype=bool)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+
+    n = len(close)
+    stop = n - 1 if order_expiration is None else n - order_expiration - 1
+    signal_idx = np.flatnonzero(signal)
+    trades = []
+
+    i = start
+    while i < stop:
+        # Jump straight to the next signal instead of walking every candle
+        pos = np.searchsorted(signal_idx, i)
+        if pos == len(signal_idx) or signal_idx[pos] >= stop:
+            break
+        i = int(signal_idx[pos])
+
+        entry_price = close[i] * buy_discount
+        tp_price = entry_price * tp_multiplier
+        sl_price = entry_price * sl_multiplier
+
+        if order_expiration is None:
+            fill_idx = i
+        else:
+            expiration_idx = i + order_expiration
+            fill_idx = first_touch(low, entry_price, i + 1, expiration_idx + 1, above=False)
+            if fill_idx < 0:
+                trades.append(Trade(i, -1, -1, EXPIRED, entry_price, tp_price, sl_price, 0.0, 0.0))
+                i = expiration_idx
+                continue
+
+        exit_idx, outcome = first_exit(high, low, fill_idx + 1, tp_price, sl_price, resolve)
+        if exit_idx < 0:
+            trades.append(Trade(i, fill_idx, -1, OPEN, entry_price, tp_price, sl_price, 0.0, 0.0))
+            break
+
+        exit_price = tp_price if outcome == TP else sl_price
+        profit = (exit_price - entry_price) * quantity
+        trades.append(Trade(i, fill_idx, exit_idx, outcome, entry_price, tp_price, sl_price, exit_price, profit))
+        i = exit_idx + 1
+
+    return trades
+
+
+class IntraCandleResolver:
+    """Decide TP vs SL inside an ambiguous candle from finer klines in the local store.
+
+    The finer candles of a bar are loaded (and downloaded once, if `client` is
+    given) only when a trade actually hits such a bar. The first fine candle
+    touching a level decides; if one fine candle touches both, its own shape
+    does (a candle that closed up is taken to have gone O -> L -> H -> C, one
+    that closed down O -> H -> L -> C). Without fine data TP wins, as before.
+
+        resolve = IntraCandleResolver(store, symbol, timeframe, df["close_time"], client)
+        trades = run_backtest(..., resolve=resolve)
+    """
+
+    def __init__(self, store, symbol, interval, close_times, client=None, fine_interval="1s"):
+        self.store = store
+        self.symbol = symbol
+        self.candle_ms = interval_to_milliseconds(interval)
+        self.close_times = np.asarray(close_times, dtype=np.int64)
+        self.client = client
+        self.fine_interval = fine_interval
+        self.resolved = 0       # ambiguous candles settled on fine data
+        self.sl_first = 0       # ... of which SL came first (TP under the old rule)
+        self.missing = 0        # no fine data, left to TP
+
+    def __call__(self, idx, tp_price, sl_price):
+        end_ms = int(self.close_times[idx]) + 1
+        fine = self.store.ensure(self.client, self.symbol, self.fine_interval, end_ms - self.candle_ms, end_ms)
+        if len(fine) == 0:
+            self.missing += 1
+            return TP
+
+        tp_hit = fine["high"] >= tp_price
+        sl_hit = fine["low"] <= sl_price
+        hit = tp_hit | sl_hit
+        k = int(hit.argmax())
+        if not hit[k]:
+            self.missing += 1   # fine data disagrees with the bar; keep the old rule
+            return TP
+        if tp_hit[k] and sl_hit[k]:
+            outcome = SL if fine["close"][k] >= fine["open"][k] else TP
+        else:
+            outcome = TP if tp_hit[k] else SL
+        self.resolved += 1
+        self.sl_first += outcome == SL
+        return outcome
+
+    def report(self):
+        return (f"{self.resolved} resolved on {self.fine_interval} klines "
+                f"({self.sl_first} SL first), {self.missing} without fine data")
+
+
+def summarize(trades):
+    """Aggregate closed trades: count, wins, win rate, total profit and max drawdown."""
+    profits = np.array([t.profit for t in trades if t.outcome in (TP, SL)], dtype=float)
+    total_trades = sum(1 for t in trades if t.outcome != EXPIRED)
+    successful_trades = sum(1 for t in trades if t.outcome == TP)
+
+    max_drawdown = 0.0
+    if len(profits):
+        equity = np.cumsum(profits)
+        peak = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+        max_drawdown = float((peak - equity).max())
+
+    return {
+        "total_trades": total_trades,
+        "successful_trades": successful_trades,
+        "win_rate": successful_trades / total_trades if total_trades else 0,
+        "total_profit": float(profits.sum()),
+        "max_drawdown": max_drawdown,
+    }
@@ -0,0 +1,129 @@
+"""
+Bulk order placement for the grid bots.
+
+Futures orders go out through the batchOrders endpoint, MAX_BATCH_ORDERS per
+request, and independent batches are sent concurrently. Spot has no batch
+endpoint, so spot orders are sent one per request on the same worker pool.
+
+Results are returned in the same order as the input, so callers can map them
+straight back onto their grid nodes. Only the orders that failed are retried.
+Every order carries a fixed newClientOrderId across attempts, so retrying a
+request whose response was lost cannot place the same order twice.
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+MAX_BATCH_ORDERS = 5        # futures batchOrders limit
+MAX_BATCH_CANCELS = 10      # futures cancel-multiple limit
+MAX_WORKERS = 3             # concurrent requests
+MAX_RETRIES = 2             # extra rounds for the orders that failed
+
+DUPLICATE_ORDER_CODE = -4116    # futures: ClientOrderId is duplicated
+
+
+def limit_order(symbol, side, quantity, price):
+    return {"symbol": symbol, "side": side, "type": "LIMIT",
+            "quantity": quantity, "price": price, "timeInForce": "GTC"}
+
+
+def is_error(result):
+    return not result or "orderId" not in result
+
+
+def _error(exc):
+    return {"code": getattr(exc, "code", None), "msg": getattr(exc, "message", str(exc))}
+
+
+def _param(value):
+    # batchOrders wants strings; avoid "1e-05" style floats
+    if isinstance(value, float):
+        return format(Decimal(str(value)), "f")
+    return str(value)
+
+
+def _send(client, market, batch):
+    try:
+        if market == "futures":
+            return client.futures_place_batch_order(
+                batchOrders=[{k: _param(v) for k, v in order.items()} for order in batch])
+        return [client.create_order(**batch[0])]
+    except Exception as e:
+        return [_error(e)] * len(batch)
+
+
+def _lookup(client, market, order):
+    get_order = client.futures_get_order if market == "futures" else client.get_order
+    try:
+        return get_order(symbol=order["symbol"], origClientOrderId=order["newClientOrderId"])
+    except Exception as e:
+        return _error(e)
+
+
+def _is_duplicate(result):
+    return result.get("code") == DUPLICATE_ORDER_CODE or "Duplicate order" in str(result.get("msg"))
+
+
+def _run(requests, send, max_workers):
+    if len(requests) <= 1:
+        return [send(r) for r in requests]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(send, requests))
+
+
+def place_orders(client, orders, market="futures", max_workers=MAX_WORKERS, retries=MAX_RETRIES):
+    """Place `orders` (create_order keyword dicts) and return one result per order.
+
+    A result is the exchange response (with "orderId") or an error dict
+    {"code", "msg"} for an order that still failed after `retries` extra rounds.
+    """
+    orders = [dict(order) for order in orders]
+    for order in orders:
+        order.setdefault("newClientOrderId", uuid.uuid4().hex)
+
+    size = MAX_BATCH_ORDERS if market == "futures" else 1
+    results = [None] * len(orders)
+    pending = list(range(len(orders)))
+
+    for attempt in range(retries + 1):
+        chunks = [pending[k:k + size] for k in range(0, len(pending), size)]
+        replies = _run(chunks, lambda idx: _send(client, market, [orders[i] for i in idx]), max_workers)
+        for idx, reply in zip(chunks, replies):
+            for i, result in zip(idx, reply):
+                results[i] = result
+
+        pending = [i for i in pending if is_error(results[i])]
+        # A duplicate id means an earlier attempt went through; fetch that order
+        for i in [i for i in pending if _is_duplicate(results[i])]:
+            results[i] = _lookup(client, market, orders[i])
+        pending = [i for i in pending if is_error(results[i])]
+        if not pending:
+            break
+
+    return results
+
+
+def cancel_orders(client, symbol, order_ids, market="futures", max_workers=MAX_WORKERS):
+    """Cancel `order_ids` and return one result per id (cancel response or error dict)."""
+    if market == "futures":
+        def send(chunk):
+            try:
+                return client.futures_cancel_orders(symbol=symbol, orderidlist=chunk)
+            except Exception as e:
+                return [_error(e)] * len(chunk)
+        size = MAX_BATCH_CANCELS
+    else:
+        def send(chunk):
+            try:
+                return [client.cancel_order(symbol=symbol, orderId=chunk[0])]
+            except Exception as e:
+                return [_error(e)]
+        size = 1
+
+    order_ids = list(order_ids)
+    chunks = [order_ids[k:k + size] for k in range(0, len(order_ids), size)]
+    results = []
+    for reply in _run(chunks, send, max_workers):
+        results += reply
+    return results
@@ -0,0 +1,66 @@
+"""
+Fixed-size candle history for the live kline handlers.
+
+Replaces the `klines_history.append(...)` / `klines_history.pop(0)` lists,
+where every closed candle shifted the whole window. The ring preallocates one
+float64 row per field and writes each candle twice, at `slot` and
+`slot + capacity`, so the last `capacity` candles are always one contiguous
+slice of the row. Reading a field is a zero-copy, oldest-first NumPy view:
+
+    candles = CandleRing(500, ("close", "high", "low"))
+    candles.append(close=c, high=h, low=l)
+    candles["close"][-1]            # latest close
+    candles["high"][-25:-1].max()   # same lookbacks as the old lists
+
+Memory stays at 2 * capacity floats per field no matter how long the bot
+runs. Views alias the ring storage and are read-only; take a copy if a value
+must survive the next append.
+"""
+
+import numpy as np
+
+
+class CandleRing:
+    def __init__(self, capacity, fields=("close",)):
+        if capacity < 1:
+            raise ValueError(f"capacity must be >= 1, got {capacity}")
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._rows = {name: row for row, name in enumerate(self.fields)}
+        self._buf = np.zeros((len(self.fields), 2 * capacity), dtype=np.float64)
+        self.total = 0          # candles appended since creation
+
+    def append(self, **values):
+        """Add one candle; every field must be given."""
+        slot = self.total % self.capacity
+        for name, row in self._rows.items():
+            value = values[name]
+            self._buf[row, slot] = value
+            self._buf[row, slot + self.capacity] = value
+        self.total += 1
+
+    def extend(self, **columns):
+        """Bulk-load equal-length columns (oldest first), e.g. the REST history at startup."""
+        arrays = [np.asarray(columns[name], dtype=np.float64)[-self.capacity:] for name in self.fields]
+        slots = (self.total + np.arange(len(arrays[0]))) % self.capacity
+        for row, arr in enumerate(arrays):
+            self._buf[row, slots] = arr
+            self._buf[row, slots + self.capacity] = arr
+        self.total += len(arrays[0])
+
+    def clear(self):
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __getitem__(self, name):
+        """Oldest-first read-only view of one field."""
+        n = len(self)
+        end = (self.total - 1) % self.capacity + 1 + self.capacity if n else self.capacity
+        view = self._buf[self._rows[name], end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def __contains__(self, name):
+        return name in self._rows
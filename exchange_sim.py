@@ -0,0 +1,884 @@
+#!/usr/bin/env python3
+"""
+Local exchange simulator: run an unmodified bot offline against stored klines.
+
+Every bot talks straight to binance.client.Client / AsyncClient and the
+websocket managers, so the only way to try one end to end used to be
+testnet or real money. This module stands in for the exchange:
+
+  - a matching engine for LIMIT and MARKET orders on one symbol, with the
+    REST calls the bots use (create/get/cancel, batch place/cancel, open
+    orders, ticker, klines, exchange info) for spot or futures
+  - user-data events (executionReport / ORDER_TRADE_UPDATE), kline and
+    bookTicker events, through stand-ins for ThreadedWebsocketManager and
+    BinanceSocketManager
+  - replay of KlineStore candles, each walked as O -> L -> H -> C when it
+    closed up and O -> H -> L -> C when it closed down; resting limits fill
+    at their price when a leg crosses them, marketable orders at the
+    current price
+  - a virtual clock. time.time/monotonic/sleep, datetime.now, queue waits on
+    the main thread, the asyncio loop and order_timers all read it, and it
+    jumps straight to the next candle point or timer, so a month of 1m
+    candles replays in seconds
+
+    python exchange_sim.py --market futures --symbol BTCUSDC --interval 1m --days 7 \\
+        grid_future.py BTCUSDC Neutral
+    python exchange_sim.py --market spot --symbol BTCFDUSD --interval 1m BTC_Trade_Spot_RSI.py
+    python exchange_sim.py --market futures --symbol BTCUSDC --interval 3m \\
+        long_short_future_btc_trade.py RSI 0.01 3m LONG
+
+The candles must already be in the store (kline_store sync / param_sweep).
+Kline requests and streams may use any multiple of --interval; those are
+built from the replayed candles. The run ends with a fill/PnL report when
+the data runs out.
+"""
+
+import argparse
+import asyncio
+import atexit
+import datetime as _datetime
+import heapq
+import math
+import os
+import queue
+import runpy
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+from binance.client import Client as _Client
+from binance.helpers import interval_to_milliseconds
+
+from backtest_engine import first_touch
+from kline_store import KlineStore
+
+WARMUP_CANDLES = 1000       # candles before the replay start, served as history
+PRICE_PRECISION = 2
+QUANTITY_PRECISION = 3
+PATH_FRACTIONS = (0.0, 1 / 3, 2 / 3, 1.0)   # where O, 1st extreme, 2nd extreme, C sit in a candle
+
+_real_time = time.time
+_real_sleep = time.sleep
+_real_datetime = _datetime.datetime
+
+exchange = None     # the SimExchange installed by install()
+
+
+class SimAPIError(Exception):
+    """Raised where python-binance would raise BinanceAPIException."""
+
+    def __init__(self, code, message):
+        super().__init__(f"APIError(code={code}): {message}")
+        self.code = code
+        self.message = message
+
+
+def _is_driver():
+    return threading.current_thread() is threading.main_thread()
+
+
+def _fmt(value):
+    return format(float(value), "f").rstrip("0").rstrip(".") or "0"
+
+
+# ============================================================
+# MATCHING ENGINE + REPLAY
+# ============================================================
+
+class SimExchange:
+    def __init__(self, symbol, klines, interval, market="futures", warmup=WARMUP_CANDLES, fee=0.0):
+        if len(klines) <= warmup:
+            raise ValueError(f"need more than {warmup} candles, got {len(klines)}")
+        self.symbol = symbol.upper()
+        self.klines = np.asarray(klines)
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.market = market
+        self.fee = fee
+        self.lock = threading.RLock()
+
+        # four path points per candle
+        o, h, l, c = (self.klines[name] for name in ("open", "high", "low", "close"))
+        up = c >= o
+        path = np.stack([o, np.where(up, l, h), np.where(up, h, l), c], axis=1)
+        offsets = np.round(np.array(PATH_FRACTIONS) * (self.interval_ms - 1)).astype(np.int64)
+        self.point_price = path.ravel()
+        self.point_time = (self.klines["open_time"][:, None] + offsets).ravel()
+        self.cursor = warmup * 4            # next point to replay
+        self.first_point = self.cursor
+
+        self.now = int(self.point_time[self.cursor]) / 1000.0
+        self._enter_candle(warmup)
+        self.cursor += 1                    # the open is where we start
+
+        self.orders = {}                    # orderId -> order
+        self.open_ids = []                  # resting orders, in placement order
+        self.client_ids = {}                # clientOrderId -> orderId
+        self.next_id = 1
+        self.events = deque()               # user-data events waiting for delivery
+        self.user_listeners = []
+        self.kline_listeners = {}           # "btcusdc@kline_3m" -> [(callback, wrap)]
+        self.book_listeners = []            # [(callback, wrap)] on "<symbol>@bookTicker"
+        self.book_updates = 0
+        self.position = 0.0
+        self.cash = 0.0
+        self.fees = 0.0
+        self.fills = 0
+        self.volume = 0.0
+        self.finished = False
+        self.on_finish = []                 # callbacks run after the report, before exit
+        self.wall_start = _real_time()
+
+    # ---------------- clock ----------------
+
+    def _enter_candle(self, i):
+        self.candle = i
+        self.price = float(self.klines["open"][i])
+        self.high = self.low = self.price
+        self.point = 0
+
+    def next_time(self):
+        if self.cursor >= len(self.point_time):
+            return math.inf
+        return int(self.point_time[self.cursor]) / 1000.0
+
+    def step(self, until=math.inf):
+        """Advance to the next candle point or due timer, at most to `until`, and deliver its events."""
+        timers = sys.modules.get("order_timers")
+        wheel = timers.timers if timers else None
+        with self.lock:
+            if self.next_time() == math.inf:
+                self.finish()
+            if wheel is not None and wheel.heap:
+                until = min(until, max(wheel.heap[0][0], self.now))
+            if not any(self.kline_listeners.values()):
+                self._skip_quiet(until)
+            target = min(self.next_time(), until)
+            self.now = max(self.now, target)
+            if self.now >= self.next_time():
+                self._replay_point()
+            events = list(self.events)
+            self.events.clear()
+        for deliver in events:
+            self._call(deliver)
+        if wheel is not None:
+            for callback, keys in wheel.pop_due(self.now):
+                self._call(callback, keys)
+
+    @staticmethod
+    def _call(callback, *args):
+        # a failing handler is reported, the replay goes on
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def advance(self, until):
+        while self.now < until:
+            self.step(until)
+
+    def run(self):
+        """Replay to the end of the data (the bot's main thread has nothing else to do)."""
+        while True:
+            self.step()
+
+    def _skip_quiet(self, until):
+        """Jump over the points due by `until` that cross no resting order (nobody sees them)."""
+        stop = int(np.searchsorted(self.point_time, np.int64(until * 1000), side="right"))   # int key: no float copy of the column
+        if stop - self.cursor < 2:
+            return
+        buys = [self.orders[i]["price"] for i in self.open_ids if self.orders[i]["side"] == "BUY"]
+        sells = [self.orders[i]["price"] for i in self.open_ids if self.orders[i]["side"] == "SELL"]
+        end = stop
+        if buys:
+            hit = first_touch(self.point_price, max(buys), self.cursor, end, above=False)
+            end = hit if hit >= 0 else end
+        if sells:
+            hit = first_touch(self.point_price, min(sells), self.cursor, end, above=True)
+            end = hit if hit >= 0 else end
+        last = end - 1
+        if last < self.cursor:
+            return
+        if self.book_listeners:
+            # the skipped stretch reaches the book as its extremes, in path order
+            seg = self.point_price[self.cursor:end]
+            for p in sorted({int(seg.argmin()), int(seg.argmax()), len(seg) - 1}):
+                self._emit_book(float(seg[p]))
+        candle, k = divmod(last, 4)
+        seen = self.point_price[candle * 4:last + 1]     # the candle's path so far
+        self.candle = candle
+        self.high = float(seen.max())
+        self.low = float(seen.min())
+        self.price = float(self.point_price[last])
+        self.point = k
+        self.now = max(self.now, int(self.point_time[last]) / 1000.0)
+        self.cursor = end
+
+    def _replay_point(self):
+        p = self.cursor
+        self.cursor += 1
+        candle, k = divmod(p, 4)
+        if k == 0:
+            self._match(self.price, float(self.point_price[p]))     # gap from the last close
+            self._enter_candle(candle)
+        else:
+            self._match(self.price, float(self.point_price[p]))
+            self.price = float(self.point_price[p])
+            self.high = max(self.high, self.price)
+            self.low = min(self.low, self.price)
+            self.point = k
+        self._emit_klines(closed=(k == 3))
+        if self.book_listeners:
+            self._emit_book(self.price)
+
+    # ---------------- matching ----------------
+
+    def _match(self, start, end):
+        """Fill the resting limits the leg start -> end crosses, in the order it reaches them."""
+        lo, hi = min(start, end), max(start, end)
+        crossed = [self.orders[i] for i in self.open_ids
+                   if lo <= self.orders[i]["price"] <= hi and
+                   (self.orders[i]["side"] == "BUY") == (end < start)]
+        crossed.sort(key=lambda order: abs(order["price"] - start))
+        for order in crossed:
+            self._fill(order, order["price"], maker=True)
+
+    def _fill(self, order, price, maker):
+        qty = order["qty"]
+        notional = price * qty
+        fee = notional * self.fee
+        if order["side"] == "BUY":
+            self.position += qty
+            self.cash -= notional
+        else:
+            self.position -= qty
+            self.cash += notional
+        self.cash -= fee
+        self.fees += fee
+        self.fills += 1
+        self.volume += notional
+        order.update(status="FILLED", executed=qty, fill_price=price, fee=fee, maker=maker, time=self.now_ms())
+        if order["id"] in self.open_ids:
+            self.open_ids.remove(order["id"])
+        self._user_event(order, "TRADE")
+
+    def now_ms(self):
+        return int(self.now * 1000)
+
+    # ---------------- orders ----------------
+
+    def place(self, symbol, side, type, quantity, price=None, newClientOrderId=None, **params):
+        with self.lock:
+            if symbol.upper() != self.symbol:
+                raise SimAPIError(-1121, f"Invalid symbol {symbol}; the simulator replays {self.symbol}.")
+            if type not in ("LIMIT", "MARKET"):
+                raise SimAPIError(-1116, f"Order type {type} is not simulated.")
+            if type == "LIMIT" and price is None:
+                raise SimAPIError(-1102, "Mandatory parameter 'price' was not sent.")
+            client_id = newClientOrderId or f"sim-{self.next_id}"
+            if client_id in self.client_ids:
+                if self.market == "futures":
+                    raise SimAPIError(-4116, "ClientOrderId is duplicated.")
+                raise SimAPIError(-2010, "Duplicate order sent.")
+            order = {"id": self.next_id, "client_id": client_id, "side": side.upper(), "type": type,
+                     "qty": float(quantity), "price": float(price) if price is not None else 0.0,
+                     "status": "NEW", "executed": 0.0, "fill_price": 0.0, "fee": 0.0, "maker": False,
+                     "time": self.now_ms(), "created": self.now_ms()}
+            self.next_id += 1
+            self.orders[order["id"]] = order
+            self.client_ids[client_id] = order["id"]
+            self._user_event(order, "NEW")
+
+            marketable = (type == "MARKET" or
+                          (order["side"] == "BUY" and order["price"] >= self.price) or
+                          (order["side"] == "SELL" and order["price"] <= self.price))
+            if marketable:
+                self._fill(order, self.price, maker=False)
+            else:
+                self.open_ids.append(order["id"])
+            return self._response(order)
+
+    def lookup(self, orderId=None, origClientOrderId=None):
+        with self.lock:
+            if orderId is None and origClientOrderId is not None:
+                orderId = self.client_ids.get(origClientOrderId)
+            order = self.orders.get(int(orderId)) if orderId is not None else None
+            if order is None:
+                raise SimAPIError(-2013, "Order does not exist.")
+            return order
+
+    def cancel(self, orderId=None, origClientOrderId=None):
+        with self.lock:
+            order = self.lookup(orderId, origClientOrderId)
+            if order["status"] != "NEW":
+                raise SimAPIError(-2011, "Unknown order sent.")
+            order.update(status="CANCELED", time=self.now_ms())
+            self.open_ids.remove(order["id"])
+            self._user_event(order, "CANCELED")
+            return self._response(order)
+
+    def open_orders(self):
+        with self.lock:
+            return [self._response(self.orders[i]) for i in self.open_ids]
+
+    def _response(self, order):
+        executed = order["executed"]
+        quote = executed * order["fill_price"]
+        response = {
+            "symbol": self.symbol,
+            "orderId": order["id"],
+            "clientOrderId": order["client_id"],
+            "price": _fmt(order["price"]),
+            "origQty": _fmt(order["qty"]),
+            "executedQty": _fmt(executed),
+            "status": order["status"],
+            "timeInForce": "GTC",
+            "type": order["type"],
+            "side": order["side"],
+            "updateTime": order["time"],
+        }
+        if self.market == "futures":
+            response.update(avgPrice=_fmt(order["fill_price"]), cumQuote=_fmt(quote))
+        else:
+            response.update(transactTime=order["time"], time=order["created"], cummulativeQuoteQty=_fmt(quote))
+        if executed:
+            response["fills"] = [{"price": _fmt(order["fill_price"]), "qty": _fmt(executed),
+                                  "commission": _fmt(order["fee"]), "commissionAsset": "QUOTE"}]
+        return response
+
+    # ---------------- klines ----------------
+
+    def candles(self, interval, limit=500, startTime=None, endTime=None):
+        """REST klines of `interval` up to now; the newest one is still open."""
+        with self.lock:
+            step = interval_to_milliseconds(interval)
+            if step is None or step % self.interval_ms:
+                raise SimAPIError(-1120, f"Interval {interval} is not a multiple of the replayed {self.interval}.")
+            per = step // self.interval_ms
+            limit = int(limit or 500)
+            open_times = self.klines["open_time"]
+            if startTime is not None:
+                lo = int(np.searchsorted(open_times, int(startTime) // step * step))
+            else:
+                lo = max(0, self.candle - (limit + 1) * per)
+            rows = self.klines[lo:self.candle + 1].copy()
+            if len(rows) == 0:
+                return []
+            last = rows[-1:]
+            last["high"] = self.high
+            last["low"] = self.low
+            last["close"] = self.price
+            for name in ("volume", "quote_volume", "taker_base_volume", "taker_quote_volume"):
+                last[name] *= PATH_FRACTIONS[self.point]
+            last["trades"] = int(last["trades"][0] * PATH_FRACTIONS[self.point])
+
+            keys = rows["open_time"] // step
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            ends = np.r_[starts[1:], len(rows)] - 1
+            group_open = keys[starts] * step
+            sums = {name: np.add.reduceat(rows[name], starts)
+                    for name in ("volume", "quote_volume", "trades", "taker_base_volume", "taker_quote_volume")}
+            result = [[int(group_open[g]),
+                       _fmt(rows["open"][starts[g]]),
+                       _fmt(rows["high"][starts[g]:ends[g] + 1].max()),
+                       _fmt(rows["low"][starts[g]:ends[g] + 1].min()),
+                       _fmt(rows["close"][ends[g]]),
+                       _fmt(sums["volume"][g]),
+                       int(group_open[g] + step - 1),
+                       _fmt(sums["quote_volume"][g]),
+                       int(sums["trades"][g]),
+                       _fmt(sums["taker_base_volume"][g]),
+                       _fmt(sums["taker_quote_volume"][g]),
+                       "0"]
+                      for g in range(len(starts))]
+            if endTime is not None:
+                result = [k for k in result if k[0] <= int(endTime)]
+            return result[:limit] if startTime is not None else result[-limit:]
+
+    # ---------------- streams ----------------
+
+    def subscribe_user(self, callback):
+        self.user_listeners.append(callback)
+
+    def subscribe_stream(self, stream, callback, wrap=False):
+        """Kline or bookTicker stream, by its name."""
+        if stream.lower().endswith("@bookticker"):
+            self.subscribe_book_ticker(stream, callback, wrap)
+        else:
+            self.subscribe_klines(stream, callback, wrap)
+
+    def subscribe_book_ticker(self, stream, callback, wrap=False):
+        if stream.split("@")[0].upper() != self.symbol:
+            print(f"[SIM] no data for {stream}, the simulator replays {self.symbol}")
+            return
+        self.book_listeners.append((callback, wrap))
+
+    def subscribe_klines(self, stream, callback, wrap=False):
+        symbol = stream.split("@")[0].upper()
+        if symbol != self.symbol:
+            print(f"[SIM] no data for {stream}, the simulator replays {self.symbol}")
+        self.kline_listeners.setdefault(stream.lower(), []).append((callback, wrap))
+
+    def unsubscribe(self, callback):
+        if callback in self.user_listeners:
+            self.user_listeners.remove(callback)
+        for listeners in self.kline_listeners.values():
+            listeners[:] = [entry for entry in listeners if entry[0] is not callback]
+        self.book_listeners[:] = [entry for entry in self.book_listeners if entry[0] is not callback]
+
+    def _user_event(self, order, execution):
+        now = self.now_ms()
+        last_qty = _fmt(order["executed"]) if execution == "TRADE" else "0"
+        last_price = _fmt(order["fill_price"]) if execution == "TRADE" else "0"
+        if self.market == "futures":
+            msg = {"e": "ORDER_TRADE_UPDATE", "E": now, "T": now, "o": {
+                "s": self.symbol, "c": order["client_id"], "S": order["side"], "o": order["type"],
+                "f": "GTC", "q": _fmt(order["qty"]), "p": _fmt(order["price"]),
+                "ap": _fmt(order["fill_price"]), "sp": "0", "x": execution, "X": order["status"],
+                "i": order["id"], "l": last_qty, "z": _fmt(order["executed"]), "L": last_price,
+                "n": _fmt(order["fee"]), "N": "QUOTE", "T": now, "t": order["id"],
+                "m": order["maker"], "R": False, "rp": "0"}}
+        else:
+            msg = {"e": "executionReport", "E": now, "s": self.symbol, "c": order["client_id"],
+                   "S": order["side"], "o": order["type"], "f": "GTC", "q": _fmt(order["qty"]),
+                   "p": _fmt(order["price"]), "x": execution, "X": order["status"], "r": "NONE",
+                   "i": order["id"], "l": last_qty, "z": _fmt(order["executed"]), "L": last_price,
+                   "n": _fmt(order["fee"]), "N": "QUOTE", "T": now, "t": order["id"],
+                   "m": order["maker"], "Z": _fmt(order["executed"] * order["fill_price"])}
+        for callback in list(self.user_listeners):
+            self.events.append(lambda callback=callback: callback(msg))
+
+    def _emit_klines(self, closed):
+        for stream, listeners in self.kline_listeners.items():
+            if not listeners or stream.split("@")[0].upper() != self.symbol:
+                continue
+            interval = stream.split("_", 1)[1]
+            k = self.candles(interval, limit=1)[-1]
+            is_final = closed and k[6] == int(self.klines["close_time"][self.candle])
+            msg = {"e": "kline", "E": self.now_ms(), "s": self.symbol, "k": {
+                "t": k[0], "T": k[6], "s": self.symbol, "i": interval, "o": k[1], "c": k[4],
+                "h": k[2], "l": k[3], "v": k[5], "n": k[8], "x": bool(is_final), "q": k[7],
+                "V": k[9], "Q": k[10], "B": "0"}}
+            for callback, wrap in list(listeners):
+                payload = {"stream": stream, "data": msg} if wrap else msg
+                self.events.append(lambda callback=callback, payload=payload: callback(payload))
+
+    def _emit_book(self, price):
+        """A bookTicker update with bid = ask = `price` (the replay has no spread)."""
+        self.book_updates += 1
+        now = self.now_ms()
+        msg = {"u": self.book_updates, "s": self.symbol, "b": _fmt(price), "B": "1", "a": _fmt(price), "A": "1"}
+        if self.market == "futures":
+            msg = {"e": "bookTicker", **msg, "T": now, "E": now}
+        stream = f"{self.symbol.lower()}@bookTicker"
+        for callback, wrap in list(self.book_listeners):
+            payload = {"stream": stream, "data": msg} if wrap else msg
+            self.events.append(lambda callback=callback, payload=payload: callback(payload))
+
+    # ---------------- end of data ----------------
+
+    def report(self):
+        span = (self.point_time[min(self.cursor, len(self.point_time)) - 1] - self.point_time[self.first_point]) / 1000.0
+        wall = max(_real_time() - self.wall_start, 1e-9)
+        filled = sum(1 for order in self.orders.values() if order["status"] == "FILLED")
+        out = sys.__stdout__     # the grid bots point sys.stdout at their log
+        print("\n========= EXCHANGE SIM REPORT =========", file=out)
+        print(f"Market:        {self.market} {self.symbol} {self.interval}", file=out)
+        print(f"Candles:       {len(self.klines) - self.first_point // 4} replayed", file=out)
+        print(f"Virtual time:  {span / 86400:.2f} days in {wall:.1f}s ({span / wall:,.0f}x real time)", file=out)
+        print(f"Orders:        {len(self.orders)} placed, {filled} filled, {len(self.open_ids)} still open", file=out)
+        print(f"Volume:        {self.volume:.2f}   fees: {self.fees:.4f}", file=out)
+        print(f"Position:      {self.position:.6f} @ last price {self.price:.2f}", file=out)
+        print(f"PnL:           {self.cash + self.position * self.price:.4f} (marked to last price)", file=out)
+        print("=======================================", file=out)
+
+    def finish(self):
+        """Data exhausted: report, run the bot's exit handlers and stop the process."""
+        if self.finished:
+            return
+        self.finished = True
+        self.report()
+        for callback in self.on_finish:
+            self._call(callback)
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)     # the bots' bare except: clauses would swallow SystemExit
+
+
+# ============================================================
+# CLIENT STAND-INS
+# ============================================================
+
+class SimClient:
+    """The part of binance.client.Client the bots call, served by the simulator."""
+
+    def __init__(self, api_key=None, api_secret=None, *args, sim=None, **kwargs):
+        self.sim = sim or exchange
+        # rate_limiter.rate_limited wraps these; nothing goes through them here
+        self.session = type("Session", (), {"hooks": {"response": []}})()
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        raise SimAPIError(-1000, f"{method} {uri} is not simulated")
+
+    # ---------------- market data ----------------
+
+    def get_server_time(self):
+        return {"serverTime": self.sim.now_ms()}
+
+    def get_symbol_ticker(self, symbol=None, **params):
+        return {"symbol": self.sim.symbol, "price": _fmt(self.sim.price)}
+
+    def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None, **params):
+        return self.sim.candles(interval, limit, startTime, endTime)
+
+    def futures_exchange_info(self):
+        return {"symbols": [{"symbol": self.sim.symbol, "status": "TRADING",
+                             "pricePrecision": PRICE_PRECISION, "quantityPrecision": QUANTITY_PRECISION}]}
+
+    futures_symbol_ticker = get_symbol_ticker
+    futures_klines = get_klines
+
+    # ---------------- orders ----------------
+
+    def create_order(self, **params):
+        return self.sim.place(**params)
+
+    def order_limit_buy(self, **params):
+        return self.sim.place(side="BUY", type="LIMIT", **params)
+
+    def order_limit_sell(self, **params):
+        return self.sim.place(side="SELL", type="LIMIT", **params)
+
+    def order_market_buy(self, **params):
+        return self.sim.place(side="BUY", type="MARKET", **params)
+
+    def order_market_sell(self, **params):
+        return self.sim.place(side="SELL", type="MARKET", **params)
+
+    def get_order(self, symbol=None, orderId=None, origClientOrderId=None, **params):
+        with self.sim.lock:
+            return self.sim._response(self.sim.lookup(orderId, origClientOrderId))
+
+    def cancel_order(self, symbol=None, orderId=None, origClientOrderId=None, **params):
+        return self.sim.cancel(orderId, origClientOrderId)
+
+    def get_open_orders(self, symbol=None, **params):
+        return self.sim.open_orders()
+
+    futures_create_order = create_order
+    futures_get_order = get_order
+    futures_cancel_order = cancel_order
+    futures_get_open_orders = get_open_orders
+
+    def futures_place_batch_order(self, batchOrders, **params):
+        results = []
+        for order in batchOrders:
+            try:
+                results.append(self.sim.place(**order))
+            except SimAPIError as e:
+                results.append({"code": e.code, "msg": e.message})
+        return results
+
+    def futures_cancel_orders(self, symbol=None, orderIdList=None, orderidlist=None, **params):
+        results = []
+        for order_id in orderIdList or orderidlist or []:
+            try:
+                results.append(self.sim.cancel(order_id))
+            except SimAPIError as e:
+                results.append({"code": e.code, "msg": e.message})
+        return results
+
+    def close_connection(self):
+        pass
+
+
+for _name in dir(_Client):
+    if _name.isupper():
+        setattr(SimClient, _name, getattr(_Client, _name))
+
+
+class SimAsyncClient:
+    """AsyncClient stand-in: the SimClient calls as coroutines."""
+
+    def __init__(self, sim=None):
+        self.sync = SimClient(sim=sim)
+        self.response = None
+
+    @classmethod
+    async def create(cls, api_key=None, api_secret=None, *args, **kwargs):
+        return cls()
+
+    async def _request(self, method, uri, signed, force_params=False, **kwargs):
+        return self.sync._request(method, uri, signed, force_params, **kwargs)
+
+    async def close_connection(self):
+        pass
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return attr(*args, **kwargs)
+        return call
+
+
+# ============================================================
+# WEBSOCKET STAND-INS
+# ============================================================
+
+class SimTWM:
+    """ThreadedWebsocketManager stand-in; callbacks run on the replay (main) thread."""
+
+    def __init__(self, *args, **kwargs):
+        self.sim = exchange
+        self.callbacks = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        for callback in self.callbacks:
+            self.sim.unsubscribe(callback)
+
+    def join(self, timeout=None):
+        pass
+
+    def _user(self, callback):
+        self.sim.subscribe_user(callback)
+        self.callbacks.append(callback)
+        return "userData"
+
+    def _streams(self, callback, streams, wrap):
+        for stream in streams:
+            self.sim.subscribe_stream(stream, callback, wrap)
+        self.callbacks.append(callback)
+        return "/".join(streams)
+
+    def start_user_socket(self, callback):
+        return self._user(callback)
+
+    def start_futures_user_socket(self, callback):
+        return self._user(callback)
+
+    def start_kline_socket(self, callback, symbol, interval=_Client.KLINE_INTERVAL_1MINUTE, **kwargs):
+        return self._streams(callback, [f"{symbol.lower()}@kline_{interval}"], wrap=False)
+
+    start_kline_futures_socket = start_kline_socket
+
+    def start_symbol_book_ticker_socket(self, callback, symbol):
+        return self._streams(callback, [f"{symbol.lower()}@bookTicker"], wrap=False)
+
+    def start_multiplex_socket(self, callback, streams):
+        return self._streams(callback, streams, wrap=True)
+
+    start_futures_multiplex_socket = start_multiplex_socket
+
+
+class SimSocket:
+    """One BinanceSocketManager socket: `async with` it, then `await recv()`."""
+
+    def __init__(self, sim, streams=None):
+        self.sim = sim
+        self.streams = streams
+        self.queue = None
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue()
+        if self.streams is None:
+            self.sim.subscribe_user(self.queue.put_nowait)
+        else:
+            for stream in self.streams:
+                self.sim.subscribe_stream(stream, self.queue.put_nowait, wrap=True)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.sim.unsubscribe(self.queue.put_nowait)
+
+    async def recv(self):
+        return await self.queue.get()
+
+
+class SimSocketManager:
+    def __init__(self, client=None, *args, **kwargs):
+        self.sim = exchange
+
+    def user_socket(self):
+        return SimSocket(self.sim)
+
+    futures_user_socket = user_socket
+
+    def multiplex_socket(self, streams):
+        return SimSocket(self.sim, list(streams))
+
+    futures_multiplex_socket = multiplex_socket
+
+    def kline_socket(self, symbol, interval=_Client.KLINE_INTERVAL_1MINUTE):
+        return SimSocket(self.sim, [f"{symbol.lower()}@kline_{interval}"])
+
+    kline_futures_socket = kline_socket
+
+
+# ============================================================
+# VIRTUAL TIME
+# ============================================================
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop on the simulator clock: when nothing is ready it replays up to the next timer."""
+
+    def __init__(self):
+        super().__init__()
+        # the default (~1 ns) is lost in epoch-sized floats, so timers due "now" would never run
+        self._clock_resolution = 0.001
+
+    def time(self):
+        return exchange.now
+
+    def _run_once(self):
+        while not self._ready and not self._stopping:
+            # a cancelled head would stop the replay early and leave select() a real wait
+            while self._scheduled and self._scheduled[0]._cancelled:
+                self._timer_cancelled_count -= 1
+                heapq.heappop(self._scheduled)._scheduled = False
+            deadline = self._scheduled[0]._when if self._scheduled else math.inf
+            if deadline <= exchange.now:
+                break
+            exchange.step(deadline)
+        super()._run_once()
+
+
+class VirtualTimePolicy(asyncio.DefaultEventLoopPolicy):
+    def new_event_loop(self):
+        return VirtualTimeLoop()
+
+
+class SimQueue(queue.Queue):
+    """queue.Queue whose blocking get() on the main thread replays until an item arrives."""
+
+    def get(self, block=True, timeout=None):
+        if not block or not _is_driver():
+            return super().get(block, timeout)
+        deadline = math.inf if timeout is None else exchange.now + timeout
+        while self.empty() and exchange.now < deadline:
+            exchange.step(deadline)
+        return super().get(block=False)
+
+
+class SimDatetime(_real_datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(exchange.now, tz)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.utcfromtimestamp(exchange.now)
+
+
+def _time():
+    return exchange.now
+
+
+def _sleep(seconds):
+    if _is_driver():
+        exchange.advance(exchange.now + max(0.0, seconds))
+    else:
+        _real_sleep(seconds)
+
+
+def _flask_run(app, *args, **kwargs):
+    # the spot bots serve /health on the main thread; replay there instead
+    if _is_driver():
+        exchange.run()
+
+
+def _telegram_send(notifier, text, chat_id=None, parse_mode=None):
+    print(f"[SIM TELEGRAM] {text}")
+
+
+# ============================================================
+# INSTALL
+# ============================================================
+
+def install(sim):
+    """Route binance, the clock and the notifier to `sim`; call before the bot is imported."""
+    global exchange
+    exchange = sim
+
+    import binance
+    import binance.client
+    binance.Client = binance.client.Client = SimClient
+    binance.AsyncClient = binance.client.AsyncClient = SimAsyncClient
+    binance.ThreadedWebsocketManager = SimTWM
+    binance.BinanceSocketManager = SimSocketManager
+    hub_module = sys.modules.get("stream_hub")
+    if hub_module is not None:
+        hub_module.AsyncClient = SimAsyncClient
+        hub_module.BinanceSocketManager = SimSocketManager
+
+    time.time = time.monotonic = _time
+    time.sleep = _sleep
+    _datetime.datetime = SimDatetime
+    queue.Queue = SimQueue
+    asyncio.set_event_loop_policy(VirtualTimePolicy())
+
+    try:
+        import flask
+        flask.Flask.run = _flask_run
+    except ImportError:
+        pass
+    import telegram_notifier
+    telegram_notifier.TelegramNotifier.send = _telegram_send
+
+    # the bots import their keys; nothing leaves the process, so placeholders do
+    import key_config
+    for name in ("apikey", "apisecret", "TELEGRAM_TOKEN", "CHAT_ID"):
+        if not hasattr(key_config, name):
+            setattr(key_config, name, "sim")
+
+
+def load_replay(store, symbol, interval, days, end=None, warmup=WARMUP_CANDLES):
+    """The last `days` of stored candles up to `end` (YYYY-MM-DD, default: the newest), plus `warmup` before."""
+    first, last = store.bounds(symbol, interval)
+    if last is None:
+        return store.load(symbol, interval)
+    interval_ms = interval_to_milliseconds(interval)
+    end_ms = int(np.datetime64(end, "ms").astype(np.int64)) if end else last + interval_ms
+    start_ms = end_ms - int(days * 86400 * 1000) - warmup * interval_ms
+    return store.load(symbol, interval, start_ms, end_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--market", choices=("spot", "futures"), default="futures")
+    parser.add_argument("--symbol", default="BTCUSDC")
+    parser.add_argument("--interval", default="1m", help="stored candles to replay")
+    parser.add_argument("--days", type=float, default=7, help="replay the last N stored days")
+    parser.add_argument("--end", help="replay up to this date (YYYY-MM-DD) instead of the last stored candle")
+    parser.add_argument("--warmup", type=int, default=WARMUP_CANDLES, help="candles of history before the replay")
+    parser.add_argument("--fee", type=float, default=0.0, help="fee rate per fill, e.g. 0.001")
+    parser.add_argument("--store", default=None, help="kline store directory")
+    parser.add_argument("script", help="bot script to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the bot")
+    args = parser.parse_args()
+
+    store = KlineStore(args.store, args.market) if args.store else KlineStore(market=args.market)
+    klines = load_replay(store, args.symbol, args.interval, args.days, args.end, args.warmup)
+    if len(klines) <= args.warmup:
+        print(f"Only {len(klines)} {args.market} {args.symbol} {args.interval} candles in the store "
+              f"for that window; need more than {args.warmup}.")
+        return
+
+    install(SimExchange(args.symbol, klines, args.interval, args.market, args.warmup, args.fee))
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name="__main__")
+    exchange.run()      # the script returned without blocking; replay whatever is left
+
+
+if __name__ == "__main__":
+    main()
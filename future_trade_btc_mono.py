@@ -8,13 +8,11 @@ Futures EMA Bot – BTCUSDC Perpetual
 """
 # Usage filename.py EMA 0.01 1m
 
-import time
 import threading
-import requests
 import pandas as pd
-import csv
 import traceback
 import sys
+import time
 from datetime import datetime
 import pytz
 try:
@@ -22,12 +20,15 @@ try:
 except Exception:
     ZoneInfo = None
 
-from flask import Flask, jsonify
-from binance import ThreadedWebsocketManager
-from binance.client import Client
-from ta.momentum import RSIIndicator
-from ta.trend import MACD, EMAIndicator
-from key_config import apikey, apisecret, TELEGRAM_TOKEN, CHAT_ID
+from flask import Flask, Response, jsonify
+from stream_hub import hub
+from latency_metrics import CANDLE_LATENCY, ORDER_LATENCY, CONTENT_TYPE, render as render_metrics
+from ta.trend import EMAIndicator
+from candle_ring import CandleRing
+from telegram_notifier import TelegramNotifier
+from trade_journal import open_journal
+from indicators import EMA, RSI, MACD, IndicatorFrame
+from key_config import TELEGRAM_TOKEN, CHAT_ID
 
 # =============================
 # USER CONFIG
@@ -68,9 +69,11 @@ elif STRATEGY == "RSI":
 SL_PCT   = 0.006       # 0.6%
 CANCEL_AFTER = 10 * 60
 KL_HISTORY_LIMIT = 500
+INDICATOR_LOOKBACK = 32               # candles of indicator history kept for should_buy
 STOPLOSS_LIMIT_RETRY_MAX = 5
 LOG_FILE = "futures_btcusdc_log.csv"
 LOCAL_TZ = "America/Los_Angeles"
+METRICS_BOT = f"mono_{STRATEGY}_{TIMEFRAME}"     # "bot" label of the latency histograms
 
 
 
@@ -84,17 +87,14 @@ def now_str():
 # =============================
 # GLOBALS
 # =============================
-client = Client(apikey, apisecret)
-twm = ThreadedWebsocketManager(api_key=apikey, api_secret=apisecret)
-
-# Get price precision once
-info = client.futures_exchange_info()
-symbol_info = [s for s in info["symbols"] if s["symbol"] == SYMBOL][0]
-PRICE_PRECISION = symbol_info["pricePrecision"]
+# Everything runs on the hub's event loop: the client is its AsyncClient and
+# handlers are coroutines, so the state below needs no lock.
+client = None
+PRICE_PRECISION = None      # set by load_symbol_info()
 
 # State
 limit_buy_id = None
-cancel_event = None
+cancel_timer = None
 tp_id = None
 stoploss_limit_id = None
 stoploss_monitor_attempts = 0
@@ -103,9 +103,8 @@ position_open = False
 total_profit_usdc = 0.0
 successful_trades = 0
 stop_lossed_trades = 0
-klines_history = []
-volume_history = []
-lock = threading.Lock()
+candles = CandleRing(KL_HISTORY_LIMIT, ("close", "volume"))
+indicators = None
 app = Flask(__name__)
 
 # =============================
@@ -116,63 +115,81 @@ def now_str():
         return datetime.now(ZoneInfo(LOCAL_TZ)).strftime("%Y-%m-%d %H:%M:%S")
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+notifier = TelegramNotifier(TELEGRAM_TOKEN, CHAT_ID)
+
 def send_telegram(msg: str):
-    try:
-        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-                      data={"chat_id": CHAT_ID, "text": msg}, timeout=10)
-    except: pass
+    notifier.send(msg)
 
 def send_exception_to_telegram(exc):
     text = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": f"Exception:\n{text}"})
-    except:
-        pass
+    notifier.send(f"Exception:\n{text}")
+journal = open_journal(LOG_FILE, ["Timestamp","Event","OrderID","Entry","Exit","Qty(BTC)","P/L(USDC)","Notes"])
+
 def log_trade(event, order_id=None, entry=0, exit_p=0, profit=0, notes=""):
     ts = now_str()
-    with open(LOG_FILE, "a", newline="") as f:
-        csv.writer(f).writerow([ts, event, order_id or "", f"{entry:.2f}", f"{exit_p:.2f}", QUANTITY_BTC, f"{profit:+.2f}", notes])
+    journal.write([ts, event, order_id or "", f"{entry:.2f}", f"{exit_p:.2f}", QUANTITY_BTC, f"{profit:+.2f}", notes])
     print(f"[{ts}] {event}: {notes}")
 
 # =============================
-# INIT KLINES
+# INIT
 # =============================
-def init_klines():
-    global klines_history,volume_history
-    klines = client.futures_klines(symbol=SYMBOL, interval=TIMEFRAME, limit=KL_HISTORY_LIMIT)
-    klines_history = [float(k[4]) for k in klines]
-    volume_history = [float(k[5]) for k in klines]      # volume is index 5
-    print(f"[{now_str()}] Loaded {len(klines_history)} klines")
+async def load_symbol_info():
+    """Get price precision once."""
+    global PRICE_PRECISION
+    info = await hub.exchange_info()
+    symbol_info = [s for s in info["symbols"] if s["symbol"] == SYMBOL][0]
+    PRICE_PRECISION = symbol_info["pricePrecision"]
+
+async def init_klines():
+    klines = await hub.history(SYMBOL, TIMEFRAME, KL_HISTORY_LIMIT)
+    candles.clear()
+    candles.extend(
+        close=[float(k[4]) for k in klines],
+        volume=[float(k[5]) for k in klines],      # volume is index 5
+    )
+    seed_indicators()
+    print(f"[{now_str()}] Loaded {len(candles)} klines")
+
+def seed_indicators():
+    """Build the streaming indicators and warm them up from the loaded history."""
+    global indicators
+    indicators = IndicatorFrame({
+        "fast_ema": EMA(EMA_FAST),
+        "slow_ema": EMA(EMA_SLOW),
+        "ema50": EMA(EMA_50),
+        "ema100": EMA(EMA_100),
+        "ema200": EMA(EMA_200),
+        "rsi": RSI(RSI_PERIOD),
+        ("macd_line", "signal_line", "macd_hist"): MACD(MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    }, lookback=INDICATOR_LOOKBACK)
+    indicators.seed(candles["close"])
 
 # =============================
 # CANCEL TIMER
 # =============================
 def start_cancel_timer(order_id: int):
-    global cancel_event
-    cancel_event = threading.Event()
-    def worker():
-        time.sleep(CANCEL_AFTER)
-        if cancel_event.is_set(): return
-        with lock:
-            if limit_buy_id == order_id:
-                try:
-                    client.futures_cancel_order(symbol=SYMBOL, orderId=order_id)
-                    send_telegram(f"[{STRATEGY}] Cancelled unfilled LONG #{order_id}")
-                    log_trade("CANCELLED", order_id, notes="timeout")
-                except Exception as e:
-                    send_exception_to_telegram(e)
-                finally:
-                    globals().update(limit_buy_id=None, position_open=False)
-    threading.Thread(target=worker, daemon=True).start()
+    global cancel_timer
+    cancel_timer = hub.call_later(CANCEL_AFTER, cancel_if_unfilled, order_id)
+
+async def cancel_if_unfilled(order_id: int):
+    global limit_buy_id, position_open
+    if limit_buy_id == order_id:
+        try:
+            await client.futures_cancel_order(symbol=SYMBOL, orderId=order_id)
+            send_telegram(f"[{STRATEGY}] Cancelled unfilled LONG #{order_id}")
+            log_trade("CANCELLED", order_id, notes="timeout")
+        except Exception as e:
+            send_exception_to_telegram(e)
+        finally:
+            limit_buy_id, position_open = None, False
 
 # =============================
 # PLACE TP
 # =============================
-def place_tp(entry: float):
+async def place_tp(entry: float):
     tp_price = round(entry * (1 + TP_PCT), PRICE_PRECISION)
     try:
-        order = client.futures_create_order(
+        order = await client.futures_create_order(
             symbol=SYMBOL,
             side="SELL",
             type="LIMIT",
@@ -181,6 +198,7 @@ def place_tp(entry: float):
             timeInForce="GTC"
         )
         globals()['tp_id'] = order["orderId"]
+        hub.claim_order(order["orderId"], user_data_handler)
         send_telegram(f"[{STRATEGY}]  TP placed @ {tp_price}")
         log_trade("TP_PLACED", order["orderId"], entry=entry, exit_p=tp_price)
     except Exception as e:
@@ -191,7 +209,7 @@ def place_tp(entry: float):
 # =============================
 # USER DATA HANDLER – FUTURES (executionReport)
 # =============================
-def user_data_handler(msg):
+async def user_data_handler(msg):
     global limit_buy_id, tp_id, stoploss_limit_id, stoploss_monitor_attempts
     global entry_price, position_open, total_profit_usdc, successful_trades, last_trade,stop_lossed_trades
 
@@ -228,90 +246,89 @@ def user_data_handler(msg):
         print(f"[{now_str()}] [USER EVENT] {side} {status} #{order_id} | "
               f"filled: {cum_filled_qty}/{orig_qty} @ {last_filled_price or 'N/A'}")
 
-        with lock:
-            # ==================================================================
-            # 1. LIMIT BUY (ENTRY)
-            # ==================================================================
-            if limit_buy_id is not None and order_id == limit_buy_id:
-                if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
-                    entry_price = last_filled_price if last_filled_price else float(o["p"])  # fallback to order price
-                    print(f"[{now_str()}] [USER EVENT] LONG FILLED @ {entry_price} (order {order_id})")
-                    send_telegram(f"[{STRATEGY}] LONG FILLED @ {entry_price:.2f} | {QUANTITY_BTC} BTC")
-                    if cancel_event:
-                        cancel_event.set()
-                    limit_buy_id = None
-                    position_open = True
-                    last_trade = {"type": "LONG_FILLED", "order_id": order_id, "entry": entry_price}
-                    log_trade("LONG_FILLED", order_id, entry=entry_price, notes="Entry filled")
-                    place_tp(entry_price)  # place take-profit
-
-                elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
-                    print(f"[{now_str()}] [USER EVENT] Limit BUY {status} #{order_id}")
-                    send_telegram(f"Limit LONG {status} #{order_id}")
-                    if cancel_event:
-                        cancel_event.set()
-                    limit_buy_id = None
-                    position_open = False
-                    log_trade("LONG_CANCELLED", order_id, notes=f"Status: {status}")
-
-            # ==================================================================
-            # 2. TAKE PROFIT (LIMIT SELL)
-            # ==================================================================
-            elif tp_id is not None and order_id == tp_id:
-                if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
-                    filled_price = last_filled_price if last_filled_price else float(o["p"])
-                    profit = (filled_price - entry_price) * QUANTITY_BTC
-                    total_profit_usdc += profit
-                    successful_trades += 1
-                    position_open = False
-
-                    print(f"[{now_str()}] [USER EVENT] TP FILLED @ {filled_price}")
-                    send_telegram(f"[{STRATEGY}] ====> Taking profit @ {filled_price:.2f} → Profit: {profit:+.2f} successful trades: {successful_trades},stop-loss-trades:{stop_lossed_trades}, Total P/L: {total_profit_usdc:+.2f} USDC")
-                    log_trade("TP_FILLED", order_id, entry=entry_price, exit_p=filled_price,
-                            profit=profit, notes="Take profit")
-                    last_trade = {"type": "TP", "entry": entry_price, "exit": filled_price, "profit": profit}
-                    tp_id = None
-                    entry_price = 0.0
-
-                    # Cancel any pending SL limit if it exists
-                    if stoploss_limit_id:
-                        try:
-                            client.futures_cancel_order(symbol=SYMBOL, orderId=stoploss_limit_id)
-                            send_telegram(f"Canceled SL limit #{stoploss_limit_id} (TP filled)")
-                            log_trade("SL_CANCELLED_BY_TP", stoploss_limit_id)
-                        except Exception:
-                            send_exception_to_telegram
-                        finally:
-                            stoploss_limit_id = None
-                            stoploss_monitor_attempts = 0
-
-                elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
-                    print(f"[{now_str()}] [USER EVENT] TP order {status} #{order_id}")
-                    send_telegram(f"TP order {status} #{order_id}")
-                    tp_id = None
-                    log_trade("TP_CANCELLED", order_id, notes=status)
-
-            # ==================================================================
-            # 3. STOP-LOSS REBOUND LIMIT SELL
-            # ==================================================================
-            elif stoploss_limit_id is not None and order_id == stoploss_limit_id:
-                if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
-                    filled_price = last_filled_price if last_filled_price else float(o["p"])
-                    profit = (filled_price - entry_price) * QUANTITY_BTC
-                    total_profit_usdc += profit
-                    print(f"[{now_str()}] [USER EVENT] SL LIMIT FILLED @ {filled_price}")
-                    send_telegram(f"[{STRATEGY}] ====> SL Limit Filled @ {filled_price:.2f} → P/L: {profit:+.2f} USDC, Total P/L: {total_profit_usdc:+.2f} USDC, successful trades: {successful_trades},stop-loss-trades:{stop_lossed_trades} ")
-                    log_trade("SL_LIMIT_FILLED", order_id, entry=entry_price, exit_p=filled_price, profit=profit)
-                    last_trade = {"type": "SL_LIMIT", "profit": profit}
-                    cleanup_sl_state()
-
-                elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
-                    print(f"[{now_str()}] [USER EVENT] SL limit {status} #{order_id}")
-                    send_telegram(f"SL limit order {status} #{order_id}")
-                    log_trade("SL_LIMIT_CANCELLED", order_id, notes=status)
-                    # Don't reset position_open here — kline handler will trigger market sell
-                    stoploss_limit_id = None
-                    stoploss_monitor_attempts = 0
+        # ==================================================================
+        # 1. LIMIT BUY (ENTRY)
+        # ==================================================================
+        if limit_buy_id is not None and order_id == limit_buy_id:
+            if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
+                entry_price = last_filled_price if last_filled_price else float(o["p"])  # fallback to order price
+                print(f"[{now_str()}] [USER EVENT] LONG FILLED @ {entry_price} (order {order_id})")
+                send_telegram(f"[{STRATEGY}] LONG FILLED @ {entry_price:.2f} | {QUANTITY_BTC} BTC")
+                if cancel_timer:
+                    cancel_timer.cancel()
+                limit_buy_id = None
+                position_open = True
+                last_trade = {"type": "LONG_FILLED", "order_id": order_id, "entry": entry_price}
+                log_trade("LONG_FILLED", order_id, entry=entry_price, notes="Entry filled")
+                await place_tp(entry_price)  # place take-profit
+
+            elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
+                print(f"[{now_str()}] [USER EVENT] Limit BUY {status} #{order_id}")
+                send_telegram(f"Limit LONG {status} #{order_id}")
+                if cancel_timer:
+                    cancel_timer.cancel()
+                limit_buy_id = None
+                position_open = False
+                log_trade("LONG_CANCELLED", order_id, notes=f"Status: {status}")
+
+        # ==================================================================
+        # 2. TAKE PROFIT (LIMIT SELL)
+        # ==================================================================
+        elif tp_id is not None and order_id == tp_id:
+            if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
+                filled_price = last_filled_price if last_filled_price else float(o["p"])
+                profit = (filled_price - entry_price) * QUANTITY_BTC
+                total_profit_usdc += profit
+                successful_trades += 1
+                position_open = False
+
+                print(f"[{now_str()}] [USER EVENT] TP FILLED @ {filled_price}")
+                send_telegram(f"[{STRATEGY}] ====> Taking profit @ {filled_price:.2f} → Profit: {profit:+.2f} successful trades: {successful_trades},stop-loss-trades:{stop_lossed_trades}, Total P/L: {total_profit_usdc:+.2f} USDC")
+                log_trade("TP_FILLED", order_id, entry=entry_price, exit_p=filled_price,
+                        profit=profit, notes="Take profit")
+                last_trade = {"type": "TP", "entry": entry_price, "exit": filled_price, "profit": profit}
+                tp_id = None
+                entry_price = 0.0
+
+                # Cancel any pending SL limit if it exists
+                if stoploss_limit_id:
+                    try:
+                        await client.futures_cancel_order(symbol=SYMBOL, orderId=stoploss_limit_id)
+                        send_telegram(f"Canceled SL limit #{stoploss_limit_id} (TP filled)")
+                        log_trade("SL_CANCELLED_BY_TP", stoploss_limit_id)
+                    except Exception:
+                        send_exception_to_telegram
+                    finally:
+                        stoploss_limit_id = None
+                        stoploss_monitor_attempts = 0
+
+            elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
+                print(f"[{now_str()}] [USER EVENT] TP order {status} #{order_id}")
+                send_telegram(f"TP order {status} #{order_id}")
+                tp_id = None
+                log_trade("TP_CANCELLED", order_id, notes=status)
+
+        # ==================================================================
+        # 3. STOP-LOSS REBOUND LIMIT SELL
+        # ==================================================================
+        elif stoploss_limit_id is not None and order_id == stoploss_limit_id:
+            if status == "FILLED" or (status == "PARTIALLY_FILLED" and cum_filled_qty >= orig_qty * 0.999):
+                filled_price = last_filled_price if last_filled_price else float(o["p"])
+                profit = (filled_price - entry_price) * QUANTITY_BTC
+                total_profit_usdc += profit
+                print(f"[{now_str()}] [USER EVENT] SL LIMIT FILLED @ {filled_price}")
+                send_telegram(f"[{STRATEGY}] ====> SL Limit Filled @ {filled_price:.2f} → P/L: {profit:+.2f} USDC, Total P/L: {total_profit_usdc:+.2f} USDC, successful trades: {successful_trades},stop-loss-trades:{stop_lossed_trades} ")
+                log_trade("SL_LIMIT_FILLED", order_id, entry=entry_price, exit_p=filled_price, profit=profit)
+                last_trade = {"type": "SL_LIMIT", "profit": profit}
+                cleanup_sl_state()
+
+            elif status in ["CANCELED", "EXPIRED", "REJECTED"]:
+                print(f"[{now_str()}] [USER EVENT] SL limit {status} #{order_id}")
+                send_telegram(f"SL limit order {status} #{order_id}")
+                log_trade("SL_LIMIT_CANCELLED", order_id, notes=status)
+                # Don't reset position_open here — kline handler will trigger market sell
+                stoploss_limit_id = None
+                stoploss_monitor_attempts = 0
 
     except Exception as e:
         print(f"[{now_str()}] [USER HANDLER ERROR] {e}")
@@ -326,7 +343,7 @@ def cleanup_sl_state():
     entry_price = 0.0
     position_open = False
 
-def is_htf_trend_bullish(timeframe: str = "1h") -> bool:
+async def is_htf_trend_bullish(timeframe: str = "1h") -> bool:
     """
     Check if EMA50 > EMA200 on the specified higher timeframe.
     
@@ -340,7 +357,7 @@ def is_htf_trend_bullish(timeframe: str = "1h") -> bool:
     try:
         # Pull enough data for EMA50 + some buffer
         limit_needed = 100
-        klines = client.futures_klines(
+        klines = await client.futures_klines(
             symbol=SYMBOL,
             interval=timeframe,
             limit=limit_needed
@@ -364,7 +381,7 @@ def is_htf_trend_bullish(timeframe: str = "1h") -> bool:
 # =============================
 # BUY CONDITION (SEPARATE & EASY TO EXTEND)
 # =============================
-def should_buy(df: pd.DataFrame) -> bool:
+async def should_buy(df: IndicatorFrame) -> bool:
     """Return True if buy signal based on current STRATEGY"""
     
     if len(df) < 200:  # safety
@@ -374,19 +391,19 @@ def should_buy(df: pd.DataFrame) -> bool:
 
 
     # === 1. RSI not overbought ===
-    if "rsi" in df.columns and df["rsi"].iloc[-1] > 70:
+    if "rsi" in df and df["rsi"][-1] > 70:
         return False
     
     # Condition A: Price above EMA50
-    '''if close.iloc[-1] <= df["ema50"].iloc[-1]:
+    '''if close[-1] <= df["ema50"][-1]:
         return False
     # Condition B: EMA50 must be above EMA200 (strong bullish structure)
-    if df["ema50"].iloc[-1] <= df["ema200"].iloc[-1]:
+    if df["ema50"][-1] <= df["ema200"][-1]:
         return False'''
 
     # Slightly smarter – ignores tiny candles during Asian session
     '''avg_vol_20 = df["volume"].iloc[-20:].mean()
-    volume_ratio = df["volume"].iloc[-1] / avg_vol_20 if avg_vol_20 > 0 else 0
+    volume_ratio = df["volume"][-1] / avg_vol_20 if avg_vol_20 > 0 else 0
 
     # London/NY session → require stronger spike
     if 12 <= datetime.now(pytz.utc).hour <= 23:  # 12–23 UTC = London + NY
@@ -397,50 +414,50 @@ def should_buy(df: pd.DataFrame) -> bool:
             return False'''
 
     if STRATEGY == "EMA":
-        if "fast_ema" not in df.columns or "slow_ema" not in df.columns:
+        if "fast_ema" not in df or "slow_ema" not in df:
             return False
         fast = df["fast_ema"]
         slow = df["slow_ema"]
         #1  Golden cross on the just-closed candle
-        if not (fast.iloc[-2] <= slow.iloc[-2] and fast.iloc[-1]  > slow.iloc[-1]):
+        if not (fast[-2] <= slow[-2] and fast[-1]  > slow[-1]):
             return False
-        '''if slow.iloc[-1] <= df["ema50"].iloc[-1]:
+        '''if slow[-1] <= df["ema50"][-1]:
             return False'''
         # 3. confirm HTF trend is bullish
         # is_htf_trend_bullish costs some API calls, so only do it when golden cross detected
-        if not is_htf_trend_bullish("15m"):
+        if not await is_htf_trend_bullish("15m"):
             send_telegram("EMA Golden Cross detected, but HTF trend not bullish")
             return False
         #send_telegram("Buy signal confirmed: EMA Golden Cross + HTF bullish")
         return True
     elif STRATEGY == "RSI":
-        if "rsi" not in df.columns:
+        if "rsi" not in df:
             return False
         rsi = df["rsi"]
         # RSI exits oversold on closed candle
-        if not (rsi.iloc[-2] <= RSI_OVERSOLD and rsi.iloc[-1] > RSI_OVERSOLD):
+        if not (rsi[-2] <= RSI_OVERSOLD and rsi[-1] > RSI_OVERSOLD):
             return False
         # 3. confirm HTF trend is bullish
         # is_htf_trend_bullish costs some API calls, so only do it when golden cross detected
-        if not is_htf_trend_bullish("15m"):
+        if not await is_htf_trend_bullish("15m"):
             send_telegram("RSI buy signal detected, but HTF trend not bullish")
             return False
         send_telegram("Buy signal confirmed: RSI exit oversold + HTF bullish")
         return True
 
     elif STRATEGY == "MACD":
-        if "macd_line" not in df.columns or "signal_line" not in df.columns:
+        if "macd_line" not in df or "signal_line" not in df:
             return False
         macd = df["macd_line"]
         signal = df["signal_line"]
-        hist = macd - signal
+        hist = df["macd_hist"]
         # MACD crosses above signal on closed candle
-        if not (macd.iloc[-2] <= signal.iloc[-2] and macd.iloc[-1] > signal.iloc[-1]):
+        if not (macd[-2] <= signal[-2] and macd[-1] > signal[-1]):
             return False
         
         macd_was_below_for_several_bars = True
         for i in range(2, 9):           # i = 2 → candle -2, i = 7 → candle -7
-            if macd.iloc[-i] > signal.iloc[-i]:
+            if macd[-i] > signal[-i]:
                 macd_was_below_for_several_bars = False
                 break
 
@@ -448,10 +465,10 @@ def should_buy(df: pd.DataFrame) -> bool:
             send_telegram("Good MACD crossover, but MACD was not below signal for several bars")
             return False
         # Optional: even stricter
-        if macd.iloc[-1] >= 0:
+        if macd[-1] >= 0:
             return False
         # 3. confirm HTF trend is bullish
-        if not is_htf_trend_bullish("15m"):
+        if not await is_htf_trend_bullish("15m"):
             send_telegram("[MACD] buy signal detected, but HTF trend not bullish")
             return False
         #send_telegram("Buy signal confirmed: MACD crossover + HTF bullish")
@@ -462,8 +479,8 @@ def should_buy(df: pd.DataFrame) -> bool:
 # =============================
 # KLINE HANDLER – CLEAN & MODULAR
 # =============================
-def kline_handler(msg):
-    global klines_history, position_open, entry_price
+async def kline_handler(msg):
+    global position_open, entry_price
     global stoploss_limit_id, stoploss_monitor_attempts, tp_id,stop_lossed_trades
 
     # Handle multiplex socket wrapper
@@ -478,80 +495,42 @@ def kline_handler(msg):
     close_price = float(k["c"])
     volume_current = float(k["v"])  # volume of this candle
     close_time = k["T"]
+    closed_at = close_time / 1000
+    CANDLE_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="handler")
     if datetime.now().minute % 5 == 0:
         print(f"[{now_str()}] KLINE CLOSED @ {close_price} | Time: {datetime.fromtimestamp(close_time/1000,tz=pytz.timezone('America/Los_Angeles')).strftime('%Y-%m-%d %H:%M:%S')}")
 
-    klines_history.append(close_price)
-    volume_history.append(volume_current)
-    if len(klines_history) > KL_HISTORY_LIMIT:
-        klines_history.pop(0)
-        volume_history.pop(0)
+    candles.append(close=close_price, volume=volume_current)
+    # === Update streaming indicators (O(1) per candle) ===
+    indicators.update(close_price)
+    CANDLE_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="indicators")
 
     # Need enough data
     required_len = max(EMA_SLOW, RSI_PERIOD, MACD_SLOW) + 50
-    if len(klines_history) < required_len:
+    if len(candles) < required_len:
         return
 
-    # === Build DataFrame with all indicators ===
-    df = pd.DataFrame({
-            "close" : klines_history,
-            "volume": volume_history
-        })
-    # Always compute EMA (used in many places)
-    df["fast_ema"] = EMAIndicator(df["close"], window=EMA_FAST).ema_indicator()
-    df["slow_ema"] = EMAIndicator(df["close"], window=EMA_SLOW).ema_indicator()
-    df["ema50"] = EMAIndicator(df["close"], window=EMA_50).ema_indicator()
-    df["ema100"] = EMAIndicator(df["close"], window=EMA_100).ema_indicator()
-    df["ema200"] = EMAIndicator(df["close"], window=EMA_200).ema_indicator()
-    # Conditional indicators (only compute if needed)
-    if STRATEGY in ["RSI", "MACD"] or True:  # or always compute for flexibility
-        df["rsi"] = RSIIndicator(df["close"], window=RSI_PERIOD).rsi()
-
-        macd = MACD(df["close"], window_slow=MACD_SLOW, window_fast=MACD_FAST, window_sign=MACD_SIGNAL)
-        df["macd_line"] = macd.macd()
-        df["signal_line"] = macd.macd_signal()
-        df["macd_hist"] = macd.macd_diff()
-
+    df = indicators
     if datetime.now().minute % 5 == 0:
         print(f"[{now_str()}] Latest indicators | Close: {close_price} | "
-              f"Fast EMA: {df['fast_ema'].iloc[-1]:.2f} | Slow EMA: {df['slow_ema'].iloc[-1]:.2f} | "
-              f"RSI: {df['rsi'].iloc[-1]:.2f} | MACD: {df['macd_line'].iloc[-1]:.2f} | Signal: {df['signal_line'].iloc[-1]:.2f}")
+              f"Fast EMA: {df['fast_ema'][-1]:.2f} | Slow EMA: {df['slow_ema'][-1]:.2f} | "
+              f"RSI: {df['rsi'][-1]:.2f} | MACD: {df['macd_line'][-1]:.2f} | Signal: {df['signal_line'][-1]:.2f}")
     # === BUY SIGNAL ===
-    if not position_open and should_buy(df):
-        buy_price = round(close_price * 0.9995, PRICE_PRECISION)  # slight discount
-
-        try:
-            order = client.futures_create_order(
-                symbol=SYMBOL,
-                side="BUY",
-                type="LIMIT",
-                quantity=QUANTITY_BTC,
-                price=str(buy_price),
-                timeInForce="GTC"
-            )
-            order_id = order["orderId"]
-
-            with lock:
-                globals().update(
-                    limit_buy_id=order_id,
-                    position_open=True
-                )
-
-            send_telegram(f"BUY SIGNAL ({STRATEGY})\nLIMIT LONG @ {buy_price}\nSize: {QUANTITY_BTC} BTC")
-            log_trade("LONG_PLACED", order_id, entry=buy_price)
-            start_cancel_timer(order_id)
-
-        except Exception as e:
-            print(f"[{now_str()}] BUY ORDER FAILED: {e}")
-            send_exception_to_telegram
-            position_open = False
+    if not position_open:
+        buy = await should_buy(df)
+        CANDLE_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="signal")
+        # should_buy may await the HTF check, so the flag is tested again after it
+        if buy and not position_open:
+            buy_price = round(close_price * 0.9995, PRICE_PRECISION)  # slight discount
+            position_open = True    # claimed before the await, so no second entry can start
+            hub.spawn(open_long(buy_price, closed_at))
 
     # === STOP-LOSS LOGIC (unchanged, just cleaned) ===
     if position_open and entry_price and close_price <= entry_price * (1 - SL_PCT):
         if not stoploss_limit_id:
             if tp_id:
                 try:
-                    client.futures_cancel_order(symbol=SYMBOL, orderId=tp_id)
+                    await client.futures_cancel_order(symbol=SYMBOL, orderId=tp_id)
                     send_telegram("TP cancelled due to SL trigger")
                 except Exception as e:
                     send_exception_to_telegram(e)
@@ -560,7 +539,8 @@ def kline_handler(msg):
             limit_sell_price = round(close_price + 20, PRICE_PRECISION)
             stop_lossed_trades += 1
             try:
-                sl_order = client.futures_create_order(
+                ORDER_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="sl_submit")
+                sl_order = await client.futures_create_order(
                     symbol=SYMBOL,
                     side="SELL",
                     type="LIMIT",
@@ -568,8 +548,10 @@ def kline_handler(msg):
                     price=str(limit_sell_price),
                     timeInForce="GTC"
                 )
+                ORDER_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="sl_ack")
                 stoploss_limit_id = sl_order["orderId"]
                 stoploss_monitor_attempts = 0
+                hub.claim_order(stoploss_limit_id, user_data_handler)
                 send_telegram(f"{STRATEGY} SL Triggered → Limit Sell @ {limit_sell_price} Stop-loss trades: {stop_lossed_trades}")
             except Exception as e:
                 print(f"{STRATEGY} SL limit order failed: {e}")
@@ -580,12 +562,12 @@ def kline_handler(msg):
         stoploss_monitor_attempts += 1
         if stoploss_monitor_attempts >= STOPLOSS_LIMIT_RETRY_MAX:
             try:
-                client.futures_cancel_order(symbol=SYMBOL, orderId=stoploss_limit_id)
+                await client.futures_cancel_order(symbol=SYMBOL, orderId=stoploss_limit_id)
             except Exception as e:
                 send_exception_to_telegram(e)
 
             try:
-                market_order = client.futures_create_order(
+                market_order = await client.futures_create_order(
                     symbol=SYMBOL, side="SELL", type="MARKET", quantity=QUANTITY_BTC
                 )
                 fills = market_order.get("fills", [])
@@ -603,65 +585,66 @@ def kline_handler(msg):
                 print(f"{STRATEGY} Market SL failed: {e}")
                 send_exception_to_telegram(e)
 
+async def open_long(buy_price: float, closed_at: float):
+    """Place the entry; runs as its own task so the kline handler does not wait on it."""
+    global limit_buy_id, position_open
+    try:
+        ORDER_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="entry_submit")
+        order = await client.futures_create_order(
+            symbol=SYMBOL,
+            side="BUY",
+            type="LIMIT",
+            quantity=QUANTITY_BTC,
+            price=str(buy_price),
+            timeInForce="GTC"
+        )
+        ORDER_LATENCY.observe(time.time() - closed_at, bot=METRICS_BOT, stage="entry_ack")
+        order_id = order["orderId"]
+        limit_buy_id = order_id
+        hub.claim_order(order_id, user_data_handler)
+
+        send_telegram(f"BUY SIGNAL ({STRATEGY})\nLIMIT LONG @ {buy_price}\nSize: {QUANTITY_BTC} BTC")
+        log_trade("LONG_PLACED", order_id, entry=buy_price)
+        start_cancel_timer(order_id)
+
+    except Exception as e:
+        print(f"[{now_str()}] BUY ORDER FAILED: {e}")
+        send_exception_to_telegram(e)
+        position_open = False
+
 # =============================
 # HEALTH & START
 # =============================
 @app.route("/health")
 def health():
-    with lock:
-        return jsonify({
-            "status": "running",
-            "symbol": SYMBOL,
-            "size_btc": QUANTITY_BTC,
-            "position": position_open,
-            "entry": entry_price,
-            "pnl_usdc": round(total_profit_usdc, 2)
-        })
-
-def keep_alive_listen_key():
-    current_listen_key = None  # Will fetch on first run
-    
-    while True:
-        if current_listen_key is None:
-            current_listen_key = client.futures_stream_get_listen_key()
-            print(f"[{now_str()}] Fresh listenKey fetched: {current_listen_key[-20:]}...")
-        
-        time.sleep(1800)  # 30 minutes
-        try:
-            client.futures_stream_keepalive(listenKey=current_listen_key)
-            print(f"[{now_str()}] User stream listenKey renewed")
-        except Exception as e:
-            print(f"[{now_str()}] Failed to renew listenKey: {e}")
-            send_telegram(f"listenKey renewal failed: {e}")
-            current_listen_key = None  # Reset → will refetch next loop
-
-def start_bot():
+    return jsonify({
+        "status": "running",
+        "symbol": SYMBOL,
+        "size_btc": QUANTITY_BTC,
+        "position": position_open,
+        "entry": entry_price,
+        "pnl_usdc": round(total_profit_usdc, 2)
+    })
+
+@app.route("/metrics")
+def metrics():
+    """Latency histograms for Prometheus."""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+async def attach():
+    global client
+    client = hub.client
+    hub.on_error = send_exception_to_telegram
     print(f"[{now_str()}] Starting {SYMBOL} Futures Trading Bot: {STRATEGY} {QUANTITY_BTC} {TIMEFRAME}  ")
-    init_klines()
+    await load_symbol_info()
+    await init_klines()
+    hub.subscribe_klines(SYMBOL, TIMEFRAME, kline_handler)
+    send_telegram(f"Futures Bot STARTED\n{STRATEGY} {SYMBOL} {TIMEFRAME}\nSize: {QUANTITY_BTC} BTC")
 
+def start_bot():
     # Flask (if any)
     threading.Thread(target=lambda: app.run(host="0.0.0.0", port=5001, use_reloader=False), daemon=True).start()
-
-    twm.start()
-
-    # Start the user data socket
-    twm.start_futures_user_socket(callback=user_data_handler)
-    # ←←← ADD THIS LINE – this is all you need! ←←←
-    threading.Thread(target=keep_alive_listen_key, daemon=True).start()  # ← No args now
-
-    # === KLINE STREAM ===
-    stream_name = f"{SYMBOL.lower()}@kline_{TIMEFRAME}"
-    twm.start_futures_multiplex_socket(callback=kline_handler, streams=[stream_name])
-
-    send_telegram(f"Futures Bot STARTED\n{STRATEGY} {SYMBOL} {TIMEFRAME}\nSize: {QUANTITY_BTC} BTC")
-
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print(f"[{now_str()}] Shutting down gracefully...")
-        twm.stop()
-        time.sleep(2)
+    hub.run(attach())
 
 if __name__ == "__main__":
     start_bot()
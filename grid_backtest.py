@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Backtest grid_future.py / grid_spot.py parameters on stored klines.
+
+A run executes the unmodified grid bot (so its node state machine,
+trail-up/trail-down rebasing and SumBuy*/SumSell* accounting are the live
+ones) against exchange_sim, in a scratch directory so the live
+<name>.state.json / journal / log are never touched. The simulator jumps
+from one price crossing to the next, fills the grid orders a candle's
+path crosses and hands them to the bot as user-stream events, and passes the extremes of
+each skipped stretch to the bot's book ticker so trailing fires where it
+would live; the bot's TICK_SECONDS loop runs on the same virtual clock, so
+a year of 1m candles takes seconds rather than a year.
+
+Each combination runs in its own process (the simulator patches the
+process-wide clock and exits when the data ends), several at a time.
+
+Usage:
+    python grid_backtest.py BTCUSDCNeutral.json --days 365
+    python grid_backtest.py BTCUSDCNeutral.json --set ProfitRate=0.004 --set TrailUp_start_grids=6
+    python grid_backtest.py BTCUSDCLong.json --direction Long \\
+        --sweep ProfitRate=0.003,0.004,0.005 --sweep NumberOfInitialBuyGrids=4,8
+    python grid_backtest.py BTCFDUSD_spot.json --bot spot --interval 1m --days 90
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOTS = {
+    "future": (os.path.join(HERE, "grid_future.py"), "futures"),
+    "spot": (os.path.join(HERE, "grid_spot.py"), "spot"),
+}
+RESULT_PREFIX = "GRID_BACKTEST_RESULT "
+
+
+# =============================
+# ONE RUN (child process)
+# =============================
+def grid_report(bot, sim):
+    """print_profit()'s numbers (grid_table.grid_profit), from the bot's globals at the end of the data."""
+    from grid_table import grid_profit
+
+    g = bot.__dict__
+    p = grid_profit(g, sim.price)
+    return {
+        "realized_pnl": p["realized_pnl"],
+        "unrealized_pnl": p["unrealized_pnl"],
+        "total_pnl": p["realized_pnl"] + p["unrealized_pnl"],
+        "matched_number": p["matched_number"],
+        "trail_up_counter": g["trail_up_counter"],
+        "trail_down_counter": g["trail_down_counter"],
+        "grid_position": p["position"],
+        "fills": sim.fills,
+        "orders": len(sim.orders),
+        "exchange_pnl": sim.cash + sim.position * sim.price,     # marked to market, incl. any initial position
+        "last_price": sim.price,
+    }
+
+
+def run_one(spec):
+    """Run the grid bot once over the stored candles; prints one RESULT_PREFIX json line."""
+    import importlib.util
+    import grid_state
+    from exchange_sim import SimExchange, install, load_replay
+    from kline_store import KlineStore
+
+    script, market = BOTS[spec["bot"]]
+    config = spec["config"]
+    symbol = config["CurrentSymbol"]
+    store = KlineStore(spec["store"], market) if spec["store"] else KlineStore(market=market)
+    klines = load_replay(store, symbol, spec["interval"], spec["days"], spec["end"], warmup=0)
+    if len(klines) == 0:
+        print(f"No {market} {symbol} {spec['interval']} candles in the store.")
+        sys.exit(1)
+
+    os.chdir(spec["workdir"])
+    if spec["bot"] == "future":
+        argv = [symbol, spec["direction"]]
+        config_file = symbol + spec["direction"] + ".json"
+    else:
+        argv = [symbol]
+        config_file = symbol + "_spot.json"
+    with open(config_file, "w") as f:
+        json.dump(config, f, indent=4)
+
+    grid_state.DURABLE = False      # the scratch directory is thrown away
+    sim = SimExchange(symbol, klines, spec["interval"], market, warmup=0, fee=spec["fee"])
+    install(sim)
+
+    bot_spec = importlib.util.spec_from_file_location("grid_bot", script)
+    bot = importlib.util.module_from_spec(bot_spec)
+
+    def emit():
+        result = {**spec["params"], **grid_report(bot, sim)}
+        sys.__stdout__.write(RESULT_PREFIX + json.dumps(result) + "\n")
+
+    sim.on_finish.append(emit)
+    sys.argv = [script] + argv
+    bot_spec.loader.exec_module(bot)
+    bot.run()       # the grid bots loop forever; sim.finish() ends the process
+
+
+# =============================
+# SWEEP (parent process)
+# =============================
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def build_specs(base, args):
+    overrides = dict(item.split("=", 1) for item in args.set)
+    base = {**base, **{k: parse_value(v) for k, v in overrides.items()}}
+    sweeps = [item.split("=", 1) for item in args.sweep]
+    names = [name for name, _ in sweeps]
+    grids = [[parse_value(v) for v in values.split(",")] for _, values in sweeps]
+    for name in names + list(overrides):
+        if name not in base:
+            raise SystemExit(f"{name} is not a key of the grid config")
+
+    specs = []
+    for combo in itertools.product(*grids):
+        params = dict(zip(names, combo))
+        specs.append({
+            "bot": args.bot, "direction": args.direction, "interval": args.interval,
+            "days": args.days, "end": args.end, "store": args.store, "fee": args.fee,
+            "config": {**base, **params}, "params": params,
+        })
+    return specs
+
+
+def launch(spec, logs=None):
+    """Run `spec` in a child process and return its result dict (None if it failed)."""
+    with tempfile.TemporaryDirectory(prefix="grid_backtest_") as scratch:
+        spec = {**spec, "workdir": logs or scratch}
+        os.makedirs(spec["workdir"], exist_ok=True)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", json.dumps(spec)],
+                              capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    print(f"[RUN FAILED] {spec['params']}\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", nargs="?", help="grid config JSON, as the bot reads it")
+    parser.add_argument("--bot", choices=sorted(BOTS), help="default: spot for *_spot.json, else future")
+    parser.add_argument("--direction", default="Neutral", help="grid_future direction: Long, Short or Neutral")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--days", type=float, default=365)
+    parser.add_argument("--end", help="last day to replay (YYYY-MM-DD), default: newest stored candle")
+    parser.add_argument("--fee", type=float, default=0.0, help="fee rate per fill")
+    parser.add_argument("--store", help="kline store directory")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a config value")
+    parser.add_argument("--sweep", action="append", default=[], metavar="KEY=V1,V2,..",
+                        help="try each value; several --sweep run every combination")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--logs", help="keep each run's bot log and state under this directory")
+    parser.add_argument("--out", help="CSV path for the results table")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(json.loads(args.run))
+        return
+    if not args.config:
+        parser.error("config is required")
+
+    with open(args.config) as f:
+        base = json.load(f)
+    args.bot = args.bot or ("spot" if args.config.endswith("_spot.json") else "future")
+    if args.store:
+        args.store = os.path.abspath(args.store)
+    specs = build_specs(base, args)
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        logs = [os.path.abspath(os.path.join(args.logs, f"run_{k}")) if args.logs else None for k in range(len(specs))]
+        results = [r for r in pool.map(launch, specs, logs) if r is not None]
+    elapsed = time.time() - t0
+    if not results:
+        print("No run finished. Exiting.")
+        return
+
+    table = pd.DataFrame(results).sort_values("total_pnl", ascending=False, ignore_index=True)
+    if args.out:
+        table.to_csv(args.out, index=False)
+
+    print(f"\n========= GRID BACKTEST ({args.bot} {base['CurrentSymbol']} {args.interval}, {args.days:g} days) =========")
+    print(f"Runs:         {len(table)} in {elapsed:.1f}s")
+    if args.out:
+        print(f"Results:      {args.out}")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(table.head(20).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Run many grid_future.py grids in one process.
+
+Every grid config in a directory (<CurrentSymbol><Direction>.json, e.g.
+BTCUSDCNeutral.json, ETHUSDCLong.json) becomes one grid. Each grid gets its
+own copy of the bot module, so its node table, SumBuy*/SumSell*
+accounting, state file and log are as isolated as in a separate process,
+and its main loop runs on its own thread. The REST client and rate
+limiter, the websocket manager, the user-data stream and one bookTicker
+multiplex socket come from grid_hub and are opened once for all of them.
+
+The grids load one after the other (each places its initial orders), then
+trade together. The engine's own messages go to grid_engine.txt.
+
+Usage:
+    python grid_engine.py                           # every grid config in the current directory
+    python grid_engine.py --dir /opt/grids
+    python grid_engine.py BTCUSDCNeutral.json ETHUSDCLong.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+
+import grid_hub
+from strategy_runner import load_instance
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grid_future.py")
+DIRECTIONS = ("Long", "Short", "Neutral")
+ENGINE_LOG = "grid_engine.txt"
+
+
+def grid_configs(paths):
+    """(symbol, direction) of every grid config among `paths`; other JSON files are skipped."""
+    grids = []
+    for path in paths:
+        stem = os.path.basename(path)[:-len(".json")]
+        try:
+            with open(path) as f:
+                symbol = json.load(f).get("CurrentSymbol")
+        except (OSError, ValueError, AttributeError):
+            continue
+        if symbol and stem.startswith(symbol) and stem[len(symbol):] in DIRECTIONS:
+            grids.append((symbol, stem[len(symbol):]))
+    return grids
+
+
+def run_grid(bot):
+    grid_hub.log_to(bot.io_file)
+    try:
+        bot.run()
+    except Exception:
+        print(traceback.format_exc())
+        print("[ENGINE] %s stopped" % bot.__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=".", help="directory with the grid configs; state and logs are written there too")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="grid bot module exposing run()")
+    parser.add_argument("configs", nargs="*", help="config files in --dir, default: all of them")
+    args = parser.parse_args()
+
+    script = os.path.abspath(args.script)
+    os.chdir(args.dir)      # the bots read and write their files in the working directory
+    grids = grid_configs(args.configs or sorted(glob.glob("*.json")))
+    if not grids:
+        raise SystemExit("No grid configs in %s" % os.getcwd())
+    print("[ENGINE] %d grids: %s, log in %s"
+          % (len(grids), " | ".join(symbol + " " + direction for symbol, direction in grids), ENGINE_LOG))
+
+    grid_hub.log_to(ENGINE_LOG)
+    grid_hub.defer_market_streams()
+    bots = []
+    for symbol, direction in grids:
+        try:
+            bots.append(load_instance(script, [symbol, direction], "grid_%s%s" % (symbol, direction)))
+        except Exception:
+            print(traceback.format_exc())
+            print("[ENGINE] %s %s failed to start, skipped" % (symbol, direction))
+        grid_hub.log_to(ENGINE_LOG)     # the load pointed this thread at the grid's log
+    grid_hub.open_market_streams()
+
+    threads = [threading.Thread(target=run_grid, args=(bot,), name=bot.__name__, daemon=True) for bot in bots]
+    for thread in threads:
+        thread.start()
+    print("[ENGINE] %d grids running" % len(threads))
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print("[ENGINE] Shutting down")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Process-wide REST client, websockets and log routing for the grid bots.
+
+A grid bot used to own a Client, a ThreadedWebsocketManager and
+sys.stdout, so every grid needed its own process. The bots now take them
+from here instead:
+
+    client = grid_hub.client()          # one rate-limited Client per process
+    twm = grid_hub.websockets()         # same calls as ThreadedWebsocketManager
+    grid_hub.log_to(io_file)            # this thread's print() goes to io_file
+
+Run standalone a bot behaves as before. Run by grid_engine.py, the grids
+in the process share:
+
+  - one REST session behind the shared rate limiter
+  - one ThreadedWebsocketManager with one user-data socket per market;
+    every event goes to every grid's handler, which picks out its own
+    orders
+  - one multiplex socket per market for all the grids' bookTicker streams,
+    once the engine calls open_market_streams() after loading them
+    (standalone, a stream is opened as soon as it is subscribed)
+  - sys.stdout, writing each thread's output to the log its grid chose;
+    threads that chose none write to the first log opened
+"""
+
+import sys
+import threading
+import traceback
+
+from binance import ThreadedWebsocketManager
+from binance.client import Client
+from rate_limiter import rate_limited
+from trade_journal import LogFile
+from key_config import apikey, apisecret
+
+_lock = threading.Lock()
+_client = None
+_twm = None
+_user_handlers = {"spot": [], "futures": []}
+_market_handlers = {"spot": {}, "futures": {}}     # market -> {"btcusdc@bookticker": [callback, ...]}
+_deferred = False
+_logs = {}              # path -> LogFile
+_thread_logs = {}       # thread ident -> LogFile
+
+
+def client():
+    """The process's rate-limited REST client."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = rate_limited(Client(apikey, apisecret))
+        return _client
+
+
+def _manager():
+    global _twm
+    if _twm is None:
+        _twm = ThreadedWebsocketManager(api_key=apikey, api_secret=apisecret)
+        _twm.start()
+    return _twm
+
+
+def _fan_out(callbacks):
+    def dispatch(msg):
+        for callback in list(callbacks):
+            try:
+                callback(msg)
+            except Exception:
+                print(traceback.format_exc())
+    return dispatch
+
+
+def _route(market):
+    def dispatch(msg):
+        stream = msg.get('stream', '').lower()
+        for callback in list(_market_handlers[market].get(stream, ())):
+            try:
+                callback(msg)
+            except Exception:
+                print(traceback.format_exc())
+    return dispatch
+
+
+def _open_market_socket(market, streams):
+    start = _manager().start_futures_multiplex_socket if market == "futures" else _manager().start_multiplex_socket
+    start(callback=_route(market), streams=list(streams))
+
+
+def defer_market_streams():
+    """Collect bookTicker subscriptions until open_market_streams() (grid_engine)."""
+    global _deferred
+    _deferred = True
+
+
+def open_market_streams():
+    """One multiplex socket per market for every stream subscribed so far."""
+    global _deferred
+    with _lock:
+        _deferred = False
+        for market, handlers in _market_handlers.items():
+            if handlers:
+                _open_market_socket(market, handlers)
+
+
+class _Websockets:
+    """The ThreadedWebsocketManager calls a grid bot makes, served by the shared manager."""
+
+    def start(self):
+        with _lock:
+            _manager()
+
+    def _user(self, market, callback):
+        with _lock:
+            first = not _user_handlers[market]
+            _user_handlers[market].append(callback)
+            if first:
+                if market == "futures":
+                    _manager().start_futures_user_socket(callback=_fan_out(_user_handlers[market]))
+                else:
+                    _manager().start_user_socket(callback=_fan_out(_user_handlers[market]))
+
+    def start_user_socket(self, callback):
+        self._user("spot", callback)
+
+    def start_futures_user_socket(self, callback):
+        self._user("futures", callback)
+
+    def _market(self, market, callback, streams):
+        with _lock:
+            new = [s for s in streams if s.lower() not in _market_handlers[market]]
+            for stream in streams:
+                _market_handlers[market].setdefault(stream.lower(), []).append(callback)
+            if new and not _deferred:
+                _open_market_socket(market, new)
+
+    def start_futures_multiplex_socket(self, callback, streams):
+        self._market("futures", callback, streams)
+
+    def start_multiplex_socket(self, callback, streams):
+        self._market("spot", callback, streams)
+
+    def start_symbol_book_ticker_socket(self, callback, symbol):
+        # through the multiplex socket, so messages arrive wrapped with their stream name
+        self._market("spot", callback, [symbol.lower() + "@bookTicker"])
+
+
+def websockets():
+    return _Websockets()
+
+
+class _ThreadLog:
+    """sys.stdout that sends each thread's output to the log it chose."""
+
+    def write(self, message):
+        log = _thread_logs.get(threading.get_ident())
+        if log is None:
+            log = next(iter(_logs.values()), sys.__stdout__)
+        return log.write(message)
+
+    def flush(self):
+        pass
+
+
+def log_to(path):
+    """Send the calling thread's print() output to the LogFile at `path`."""
+    with _lock:
+        if path not in _logs:
+            _logs[path] = LogFile(path)
+        _thread_logs[threading.get_ident()] = _logs[path]
+        if not isinstance(sys.stdout, _ThreadLog):
+            sys.stdout = _ThreadLog()
+    return _logs[path]
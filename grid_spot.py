@@ -1,5 +1,10 @@
 import time
-from binance.client import Client
+import queue
+import threading
+import grid_hub
+from batch_orders import limit_order, place_orders, is_error
+from grid_state import GridState
+from grid_table import GridTable, grid_profit
 #import pandas as pd
 #import ta
 import sys
@@ -8,9 +13,8 @@ from datetime import datetime
 #import importlib
 import traceback
 import json
+import numpy as np
 
-from key_config import apikey
-from key_config import apisecret
 
 # ********** Symbol Specific Setting START >>>>>>>>>>>>
 #  -0.5% *6 = -3%, +0.5%*4 = +2%, range and trigger trail up/down
@@ -101,13 +105,35 @@ OrderStatus_SellOrderFilled = 4
 NODE_STATUS_INACTIVE = 0
 NODE_STATUS_ACTIVE = 1
 
+ORDER_PLACED = (OrderStatus_BuyOrderPlaced, OrderStatus_SellOrderPlaced)
 
+TICK_SECONDS = 180      # price check / trailing interval, fills are handled as they arrive
+RECONCILE_TICKS = 10    # compare the grid with the open orders every N ticks
+PRICE_STALE_SECONDS = 60    # no book ticker update for this long -> REST ticker
+REBALANCE_WARN_SECONDS = 180    # a trailing rebalance order still open after this is reported
 
 
-client = Client(apikey, apisecret)
+
+
+client = grid_hub.client()      # shared by every grid in the process (grid_engine.py)
+twm = grid_hub.websockets()
+
+order_index = {}            # order_id -> index in GridTradeNodeList
+fill_queue = queue.Queue()  # (order_id, fill_price) from the user data stream, (None, price) from the book ticker
+
+last_price = 0              # mid of the best bid/ask, kept by the book ticker stream
+last_price_time = 0
+trigger_pending = threading.Event()     # a (None, price) trailing check is queued
+
+# Grid state survives restarts; a saved grid is resumed instead of building a new one
+state = GridState(CurrentSymbol+"_spot", config)
+saved_state = state.load()
+warm_start = saved_state is not None
 
 CurrentPrice = client.get_symbol_ticker(symbol=CurrentSymbol)
 initial_price= round(float(CurrentPrice['price']) ,PRICE_PRECISION )
+if( warm_start ):
+    initial_price = saved_state["vars"]["initial_price"]
 
 baseline_price = initial_price
 grid_depth = round(initial_price * ProfitRate, PRICE_PRECISION)
@@ -116,6 +142,7 @@ ProfitPerGrid= grid_depth * ProfitRate
 
 
 n_trail_up_or_down = 0
+rebalance_orders = []       # trailing rebalance orders waiting for their fill: {order_id, side, price, placed_at, edge}
 
 SumBuyAmount=0
 SumSellAmount=0
@@ -126,20 +153,7 @@ price_to_buy=0
 price_to_sell=0
 
 
-class Logger(object):
-    def __init__(self, filename="Default.log"):
-        self.terminal = sys.stdout
-        self.output_file = filename
-
-    def write(self, message):
-        #IF you want std out, uncomment this line
-        #self.terminal.write(message)
-        with open(self.output_file, "a") as file:
-            file.write(message)
-
-
-
-sys.stdout = Logger(io_file)
+grid_hub.log_to(io_file)
 print("\n\n %s ======>    Trading bot started @%.4f" %( datetime.now(), initial_price))
 
 CostAtTrailDown=0
@@ -157,442 +171,706 @@ if( Direction == "Long" ):
     print("Loss At Trail Down = %.4f, LowestBuyPrice=%.4f " %(LossAtTrailDown,LowestBuyPrice))
 
 
-class GridTradeNode:
-    def __init__(self):
-        self.price_buy = 0
-        self.price_sell = 0
-        self.order_status = OrderStatus_NotStarted
-        self.order_id = 0
-        self.node_status = NODE_STATUS_INACTIVE
+## 1 Initializing Nodes, one row per grid level in a column table
+GridTradeNodeList = GridTable(NumberOfTotalGrids)
+GridTradeNodeList.price_buy[:] = [round( initial_price-grid_depth* (NumberOfTrailingDownGrids+NumberOfInitialBuyGrids)+ i*grid_depth, PRICE_PRECISION)
+                                  for i in range(NumberOfTotalGrids)]
+GridTradeNodeList.price_sell[:] = [round( price_buy + grid_depth, PRICE_PRECISION) for price_buy in GridTradeNodeList.price_buy.tolist()]
+GridTradeNodeList.order_status[:] = OrderStatus_NotStarted
+GridTradeNodeList.node_status[:] = NODE_STATUS_INACTIVE
 
-## 1 Initializing Nodes
-GridTradeNodeList = []
 
-for i in range(NumberOfTotalGrids):
-    node = GridTradeNode()
-    node.price_buy = round( initial_price-grid_depth* (NumberOfTrailingDownGrids+NumberOfInitialBuyGrids)+ i*grid_depth, PRICE_PRECISION)
-    node.price_sell = round( node.price_buy + grid_depth, PRICE_PRECISION)
 
-    GridTradeNodeList.append(node)
+### 2 Initial POSITION (already held on a warm start), bought alongside the initial BUY grid (3);
+### the initial SELL grid goes out when it fills
+initial_position = None     # {order_id, side, price, amount} of the initial BUY order until it fills
 
 
+## Order tracking
+def track_order(i, order_id):
+    order_index.pop(GridTradeNodeList[i].order_id, None)
+    GridTradeNodeList[i].order_id = order_id
+    order_index[order_id] = i
 
-### 2 Initial POSITION
-price_to_buy = round(initial_price* MARKET_BUY_ADDITIONAL_RATE, PRICE_PRECISION)
-quantity_to_buy= round(NumberOfInitialSellGrids * QtyPerOrder * FIRST_INITIAL_BUY_PERCENTAGE,QTY_PRECISION)
 
+def untrack_order(i):
+    order_index.pop(GridTradeNodeList[i].order_id, None)
 
-order = client.order_limit_buy(symbol=CurrentSymbol, quantity=quantity_to_buy, price=price_to_buy)
-order_id = order['orderId']
 
-for i in range(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids, NumberOfTrailingDownGrids+NumberOfInitialBuyGrids+NumberOfInitialSellGrids):
-    GridTradeNodeList[i].order_status = OrderStatus_BuyOrderPlaced
-    GridTradeNodeList[i].node_status = NODE_STATUS_ACTIVE
+## Persistent state
+def grid_vars():
+    return {"initial_price": initial_price, "baseline_price": baseline_price,
+            "n_trail_up_or_down": n_trail_up_or_down,
+            "trail_up_counter": trail_up_counter, "trail_down_counter": trail_down_counter,
+            "SumBuyAmount": SumBuyAmount, "SumSellAmount": SumSellAmount,
+            "SumBuyValue": SumBuyValue, "SumSellValue": SumSellValue,
+            "rebalance_orders": rebalance_orders, "initial_position": initial_position}
 
 
-while (True):
-    time.sleep(30)
+def save_state(*changed):
+    # Journal the nodes that changed; a whole-grid change (or a long journal) writes a snapshot
     try:
-        order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-        if (order['status'] == 'FILLED'):
-            for i in range(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids, NumberOfTrailingDownGrids+NumberOfInitialBuyGrids+NumberOfInitialSellGrids):
-                GridTradeNodeList[i].order_status = OrderStatus_BuyOrderFilled
-                SumBuyAmount +=QtyPerOrder
-                SumBuyValue+=QtyPerOrder*price_to_buy
-            print("Initial BUY order filled.    Price=%.2f     amount=%.4f    SumBuyValue=%.4f" %(price_to_buy,quantity_to_buy,SumBuyValue) )
-
-            break
+        if not changed or state.due():
+            state.snapshot(GridTradeNodeList.rows(), grid_vars())
         else:
-            print("Order Status is ",order['status'])
+            state.append({i: GridTradeNodeList.row(i) for i in changed}, grid_vars())
     except:
-        print("Exception!!! Exception occured while getting buy order status")
         print(traceback.format_exc())
+        print("Failed to save the grid state.")
 
 
-## 3 Initial Orders
-### 3.1 Placing Initial BUY Orders
-for i in range(NumberOfTrailingDownGrids, NumberOfTrailingDownGrids+NumberOfInitialBuyGrids):
-    GridTradeNodeList[i].node_status = NODE_STATUS_ACTIVE
-    price_to_buy= GridTradeNodeList[i].price_buy
-    order = client.order_limit_buy(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_buy)
-    GridTradeNodeList[i].order_id = order['orderId']
-    GridTradeNodeList[i].order_status = OrderStatus_BuyOrderPlaced
-    time.sleep(1)
+def restore_state(saved):
+    for i, row in enumerate(saved["nodes"]):
+        GridTradeNodeList.set_row(i, row)
+    for i in GridTradeNodeList.where(node_status=NODE_STATUS_ACTIVE, order_status=ORDER_PLACED).tolist():
+        order_index[GridTradeNodeList[i].order_id] = i
+    globals().update(saved["vars"])
 
-### 3.2 Placing Initial SELL Orders
-for i in range(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids, NumberOfTrailingDownGrids + NumberOfInitialBuyGrids + NumberOfInitialSellGrids):
-    price_to_sell = GridTradeNodeList[i].price_sell
-    order = client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_sell)
-    GridTradeNodeList[i].order_id = order['orderId']
-    GridTradeNodeList[i].order_status = OrderStatus_SellOrderPlaced
-    time.sleep(1)
 
-for i in range(NumberOfTotalGrids):
-    print("%d(%d) - node state %d - BUY %.2f - SELL %.2f order id %d - order state %d" %
-       ( i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, GridTradeNodeList[i].node_status,
-       GridTradeNodeList[i].price_buy,GridTradeNodeList[i].price_sell, GridTradeNodeList[i].order_id, GridTradeNodeList[i].order_status ))
+def user_data_handler(msg):
+    # Runs on the websocket thread, only queue the fill; the main loop owns the grid
+    if msg.get('e') != 'executionReport':
+        return
+    if msg['s'] == CurrentSymbol and msg['X'] == 'FILLED':
+        fill_queue.put((int(msg['i']), float(msg['Z'])/float(msg['z'])))    # average over the partial fills
 
-### 3.3 Placing Initial Buying Dip Orders
-for i in range(NumberOfBuyingDipGrids):
-    price_to_buy = round( initial_price * (1 - BuyingDipStartDropPercent - BuyingDipGridDepthPercent* i),PRICE_PRECISION  )
-    order = client.order_limit_buy(symbol=CurrentSymbol, quantity=BuyingDipQtyPerOrder, price=price_to_buy)
-    percent_rate = ((price_to_buy- initial_price)/initial_price )*100
-    #print("Placing a buying dip order, price_to_buy=%.4f  percent_rate %.2f%% " % ( price_to_buy, percent_rate) )
 
-    time.sleep(1)
+def price_handler(msg):
+    # Runs on the websocket thread on every book update; the main loop is only
+    # woken when the price is past a trailing trigger
+    global last_price, last_price_time
+    data = msg.get('data', msg)
+    if 'b' not in data:
+        return
+    last_price = (float(data['b']) + float(data['a'])) / 2
+    last_price_time = time.time()
+    if( (last_price < trail_down_trigger_price or last_price > trail_up_trigger_price) and not trigger_pending.is_set() ):
+        trigger_pending.set()
+        fill_queue.put((None, last_price))
 
 
-###
+def market_price(default):
+    # The streamed price while it is fresh, `default` otherwise
+    if time.time() - last_price_time < PRICE_STALE_SECONDS:
+        return last_price
+    return default
 
-ticks= 0
 
-trail_up_counter  = 0
-trail_down_counter  = 0
+def arm_triggers():
+    # Trailing trigger prices for the current baseline, a trail past its limit is not armed
+    global trail_down_trigger_price, trail_up_trigger_price
+    trail_down_trigger_price = baseline_price - TrailDown_start_grids * grid_depth
+    trail_up_trigger_price = baseline_price + TrailUp_start_grids * grid_depth
+    if( (NumberOfTrailingDownGrids + n_trail_up_or_down) <= 0 ):
+        trail_down_trigger_price = float("-inf")
+    if( n_trail_up_or_down >= NumberOfTrailingUpGrids ):
+        trail_up_trigger_price = float("inf")
 
 
-def print_profit():
-    global SumBuyAmount
-    global SumSellAmount
-    global SumBuyValue
-    global SumSellValue
-    global current_price
-    global trail_up_counter
-    global trail_down_counter
+twm.start()
+twm.start_user_socket(callback=user_data_handler)
+twm.start_symbol_book_ticker_socket(callback=price_handler, symbol=CurrentSymbol)
 
-    average_sell_price=0
-    average_buy_price=0
 
-    if SumBuyAmount != 0 :
-        average_buy_price =SumBuyValue/SumBuyAmount
-    if SumSellAmount != 0 :
-        average_sell_price =SumSellValue/SumSellAmount
+## 3 Initial Orders, sent concurrently (spot has no batch endpoint)
+def place_node_orders(initial_orders, results):
+    for (i, order_status, order), result in zip(initial_orders, results):
+        if is_error(result):
+            print("%d (%d) Failed to place the initial %s order at %.4f: %s"
+                  % (i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, order['side'], order['price'], result))
+            continue
+        track_order(i, result['orderId'])
+        GridTradeNodeList[i].order_status = order_status
+
+
+def place_initial_sells():
+    ### 3.2 Initial SELL Orders, sold from the initial position
+    initial_orders = []
+    for i in range(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids, NumberOfTrailingDownGrids + NumberOfInitialBuyGrids + NumberOfInitialSellGrids):
+        GridTradeNodeList[i].node_status = NODE_STATUS_ACTIVE
+        initial_orders.append((i, OrderStatus_SellOrderPlaced,
+            limit_order(CurrentSymbol, client.SIDE_SELL, QtyPerOrder, GridTradeNodeList[i].price_sell)))
+    place_node_orders(initial_orders, place_orders(client, [order for _, _, order in initial_orders], market="spot"))
+
+
+def place_initial_orders():
+    global initial_position
+    initial_orders = []
+    ### 3.1 Initial BUY Orders, together with the initial position
+    for i in range(NumberOfTrailingDownGrids, NumberOfTrailingDownGrids+NumberOfInitialBuyGrids):
+        GridTradeNodeList[i].node_status = NODE_STATUS_ACTIVE
+        initial_orders.append((i, OrderStatus_BuyOrderPlaced,
+            limit_order(CurrentSymbol, client.SIDE_BUY, QtyPerOrder, GridTradeNodeList[i].price_buy)))
+
+    position = limit_order(CurrentSymbol, client.SIDE_BUY,
+                           round(NumberOfInitialSellGrids * QtyPerOrder * FIRST_INITIAL_BUY_PERCENTAGE, QTY_PRECISION),
+                           round(initial_price * MARKET_BUY_ADDITIONAL_RATE, PRICE_PRECISION))
+    results = place_orders(client, [position] + [order for _, _, order in initial_orders], market="spot")
+    if is_error(results[0]):
+        # nothing to wait for, the SELL grid sells what the account already holds
+        print("Failed to place the initial BUY order at %.4f: %s" % (position['price'], results[0]))
+        place_initial_sells()
+    else:
+        print("Initial BUY order is placed. quantity = %.4f  price =  %.4f " % (position['quantity'], position['price']))
+        initial_position = {"order_id": results[0]['orderId'], "side": position['side'], "price": position['price'],
+                            "amount": NumberOfInitialSellGrids * QtyPerOrder}
+    place_node_orders(initial_orders, results[1:])
 
-    matched_number = min(SumSellAmount,SumBuyAmount) // QtyPerOrder -trail_down_counter -trail_down_counter
+    ### 3.3 Placing Initial Buying Dip Orders
+    dip_orders = []
+    for i in range(NumberOfBuyingDipGrids):
+        price_to_buy = round( initial_price * (1 - BuyingDipStartDropPercent - BuyingDipGridDepthPercent* i),PRICE_PRECISION  )
+        dip_orders.append(limit_order(CurrentSymbol, client.SIDE_BUY, BuyingDipQtyPerOrder, price_to_buy))
+        percent_rate = ((price_to_buy- initial_price)/initial_price )*100
+        #print("Placing a buying dip order, price_to_buy=%.4f  percent_rate %.2f%% " % ( price_to_buy, percent_rate) )
 
-    position = SumBuyAmount- SumSellAmount
-    position_value=position*current_price
+    for order, result in zip(dip_orders, place_orders(client, dip_orders, market="spot")):
+        if is_error(result):
+            print("Failed to place a buying dip order at %.4f: %s" % (order['price'], result))
 
-    if(SumBuyAmount > SumSellAmount):
-        RealizedPNL = (average_sell_price - average_buy_price)*SumSellAmount
-        UnrealizedPNL = position * (current_price - average_buy_price)
-    else:
-        RealizedPNL = (average_sell_price - average_buy_price)*SumBuyAmount
-        UnrealizedPNL = position * (current_price - average_sell_price)   
 
-    print("current_price=%.4f   RealizedPNL=%.4f UnrealizedPNL=%.4f matched_number=%.2f" %(current_price,RealizedPNL,UnrealizedPNL,matched_number)  )
-    print("SumBuyAmount=%.4f   SumBuyValue=%.4f    average_buy_price=%.4f    SumSellAmount=%.4f   SumSellValue=%.4f    average_sell_price=%.4f  position=%.4f   current_position_value =%.4f"
-         % ( SumBuyAmount,SumBuyValue,average_buy_price,SumSellAmount,SumSellValue,average_sell_price,position,position_value))
+if( warm_start ):
+    restore_state(saved_state)
+    print("%s Warm restart: resumed the saved grid, baseline_price=%.4f n_trail_up_or_down=%d"
+          % (datetime.now(), baseline_price, n_trail_up_or_down))
+else:
+    place_initial_orders()
 
+print(GridTradeNodeList.dump(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids))
 
-### Main Loop
-while (True):
-    time.sleep(180)
-    ticks+=1
-    current_time = datetime.now()
+###
 
-    try:
-        CurrentPrice = client.get_symbol_ticker(symbol=CurrentSymbol)
-        current_price = round( float(CurrentPrice['price']),PRICE_PRECISION )
-    except:
-        print(traceback.format_exc())
-        print("Failed to get current price, sleep for 120s.")
-        continue
+ticks= 0
 
-    for i in range(NumberOfTotalGrids):
-        if ( GridTradeNodeList[i].node_status == NODE_STATUS_INACTIVE):
-            continue
+if( not warm_start ):
+    trail_up_counter  = 0
+    trail_down_counter  = 0
 
-        order_id = GridTradeNodeList[i].order_id
-        try:
-            time.sleep(0.1)
-            order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-        except:
-            print("%d : exception occured while getting order status, order_id =%d  " % (i,order_id))
-            print(traceback.format_exc())
-            continue
 
-        if (order['status'] == 'FILLED'):
-            if (GridTradeNodeList[i].order_status == OrderStatus_SellOrderPlaced):
+def print_profit():
+    p = grid_profit(globals(), current_price)
+    position_value = p["position"]*current_price
+
+    print("current_price=%.4f   RealizedPNL=%.4f UnrealizedPNL=%.4f matched_number=%.2f" %(current_price,p["realized_pnl"],p["unrealized_pnl"],p["matched_number"])  )
+    print("SumBuyAmount=%.4f   SumBuyValue=%.4f    average_buy_price=%.4f    SumSellAmount=%.4f   SumSellValue=%.4f    average_sell_price=%.4f  position=%.4f   current_position_value =%.4f"
+         % ( SumBuyAmount,SumBuyValue,p["average_buy_price"],SumSellAmount,SumSellValue,p["average_sell_price"],p["position"],position_value))
 
-                price_to_buy = GridTradeNodeList[i].price_buy
-                if( price_to_buy > current_price):
-                    price_to_buy = current_price
-                    print(" ############## >>>>>>> Special case, that price_to_buy is higher than current price, using %.4f" 
-                          %(current_price)) 
 
-                print("%s %d (%d):   SELL Order Filled at %.2f,  MatchedNumber++    placing a new BUY at --> %.2f "
-                % ( current_time,i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids ,
-                    GridTradeNodeList[i].price_sell, price_to_buy))
+def replacement_client_id(order_id):
+    # The order a fill puts up on its node is named after the filled order, so a warm
+    # start can tell whether it went out before a crash
+    return "grid-%d" % order_id
 
-                try:
-                    order = client.order_limit_buy(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_buy)
-                    GridTradeNodeList[i].order_id = order['orderId']
-                    GridTradeNodeList[i].order_status = OrderStatus_BuyOrderPlaced
-                except:
-                    print(traceback.format_exc())
-                    print("%s  %d (%d) Failed to place a new BUY order at price %.4f .\n"
-                            %(current_time, i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids,price_to_buy))
 
-                SumSellAmount+=QtyPerOrder
-                SumSellValue += QtyPerOrder * GridTradeNodeList[i].price_sell
+def find_replacement(order_id):
+    # The order on_order_filled() put up for the fill of `order_id`, None if it never went out
+    try:
+        order = client.get_order(symbol=CurrentSymbol, origClientOrderId=replacement_client_id(order_id))
+    except Exception as e:
+        if getattr(e, 'code', None) == -2013:       # order does not exist
+            return None
+        raise
+    return order if order['status'] in ('NEW', 'PARTIALLY_FILLED', 'FILLED') else None
 
 
-                print("SumSellAmount+=%.4f   SumSellValue+=%.4f MatchedNumber+=1" %(QtyPerOrder, QtyPerOrder * GridTradeNodeList[i].price_sell))
-                print_profit()
+def on_order_filled(i, fill_price, replacement=None):
+    # `replacement`: the order already put up for this fill (find_replacement), only the
+    # fill is counted then
+    global SumBuyAmount
+    global SumSellAmount
+    global SumBuyValue
+    global SumSellValue
+    global current_price
 
+    current_time = datetime.now()
+    current_price = round(market_price(fill_price), PRICE_PRECISION)
 
-            elif (GridTradeNodeList[i].order_status == OrderStatus_BuyOrderPlaced):
+    if (GridTradeNodeList[i].order_status == OrderStatus_SellOrderPlaced):
 
-                SumBuyAmount+=QtyPerOrder
-                SumBuyValue += QtyPerOrder * GridTradeNodeList[i].price_buy
+        price_to_buy = GridTradeNodeList[i].price_buy
+        if( price_to_buy > current_price):
+            price_to_buy = current_price
+            print(" ############## >>>>>>> Special case, that price_to_buy is higher than current price, using %.4f" 
+                  %(current_price)) 
 
-                price_to_sell = GridTradeNodeList[i].price_sell
-                if( price_to_sell < current_price):
-                    price_to_sell = current_price
-                    print(" ############## >>>>>>> Special case, that price_to_sell is lower than current price, using %.4f" 
-                          %(current_price)) 
+        print("%s %d (%d):   SELL Order Filled at %.2f,  MatchedNumber++    placing a new BUY at --> %.2f "
+        % ( current_time,i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids ,
+            GridTradeNodeList[i].price_sell, price_to_buy))
 
-                print("%s %d (%d):  BUY Order Filled at %.2f, placing a new SELL at --> %.2f ."
-                    % (current_time,  i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids , GridTradeNodeList[i].price_buy, price_to_sell))
+        try:
+            order = replacement or client.order_limit_buy(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_buy,
+                         newClientOrderId=replacement_client_id(GridTradeNodeList[i].order_id))
+            track_order(i, order['orderId'])
+            GridTradeNodeList[i].order_status = OrderStatus_BuyOrderPlaced
+        except:
+            print(traceback.format_exc())
+            print("%s  %d (%d) Failed to place a new BUY order at price %.4f .\n"
+                    %(current_time, i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids,price_to_buy))
 
-                try:
-                    order = client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_sell)
-                    GridTradeNodeList[i].order_id = order['orderId']
-                    GridTradeNodeList[i].order_status = OrderStatus_SellOrderPlaced
-                except:
-                    print(traceback.format_exc())
-                    print("%s  %d (%d) Failed to place a new SELL order at price %.4f \n"
-                           %(current_time, i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids,price_to_sell))
+        SumSellAmount+=QtyPerOrder
+        SumSellValue += QtyPerOrder * GridTradeNodeList[i].price_sell
 
-                print("SumBuyAmount+=%.4f   SumBuyValue+=%.4f" %(SumBuyAmount,SumBuyValue))
-                print_profit()
 
+        print("SumSellAmount+=%.4f   SumSellValue+=%.4f MatchedNumber+=1" %(QtyPerOrder, QtyPerOrder * GridTradeNodeList[i].price_sell))
+        print_profit()
 
-    #Need to trail up or down?
-    trail_down_trigger_price = baseline_price - TrailDown_start_grids * grid_depth
-    trail_up_trigger_price = baseline_price + TrailUp_start_grids * grid_depth
 
-    if ( current_price <  trail_down_trigger_price  and  (NumberOfTrailingDownGrids + n_trail_up_or_down) > 0 ):
-        print("%s, <<<<------- Trailing down! current_price is %.4f, trail_down_trigger_price is %.4f " % (datetime.now(),current_price, trail_down_trigger_price) )
+    elif (GridTradeNodeList[i].order_status == OrderStatus_BuyOrderPlaced):
 
+        SumBuyAmount+=QtyPerOrder
+        SumBuyValue += QtyPerOrder * GridTradeNodeList[i].price_buy
 
-        highest_index= NumberOfTrailingDownGrids+ NumberOfInitialBuyGrids + NumberOfInitialSellGrids + n_trail_up_or_down -1
-        print("Before trailing Down,  highest_index is %d, Node states:" % (highest_index))
-        for i in range(NumberOfTotalGrids):
-            print("%d (%d): note state %d - BUY %.2f - SELL %.2f - order id %d - order state %d\n" %
-                   ( i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, GridTradeNodeList[i].node_status,
-                   GridTradeNodeList[i].price_buy,GridTradeNodeList[i].price_sell, GridTradeNodeList[i].order_id,
-                   GridTradeNodeList[i].order_status ))
+        price_to_sell = GridTradeNodeList[i].price_sell
+        if( price_to_sell < current_price):
+            price_to_sell = current_price
+            print(" ############## >>>>>>> Special case, that price_to_sell is lower than current price, using %.4f" 
+                  %(current_price)) 
 
+        print("%s %d (%d):  BUY Order Filled at %.2f, placing a new SELL at --> %.2f ."
+            % (current_time,  i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids , GridTradeNodeList[i].price_buy, price_to_sell))
 
-        # First Step for trailing down, is to cancel the highest SELL Order
-        need_to_sell_for_trail_down = 0
+        try:
+            order = replacement or client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_sell,
+                         newClientOrderId=replacement_client_id(GridTradeNodeList[i].order_id))
+            track_order(i, order['orderId'])
+            GridTradeNodeList[i].order_status = OrderStatus_SellOrderPlaced
+        except:
+            print(traceback.format_exc())
+            print("%s  %d (%d) Failed to place a new SELL order at price %.4f \n"
+                   %(current_time, i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids,price_to_sell))
 
-        if( GridTradeNodeList[highest_index].order_status == OrderStatus_SellOrderPlaced):
-            order_id = GridTradeNodeList[highest_index].order_id
-            try:
-                order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-                print("Trailing down, highest order status is ", order['status']  )
+        print("SumBuyAmount+=%.4f   SumBuyValue+=%.4f" %(SumBuyAmount,SumBuyValue))
+        print_profit()
+
+    save_state(i)
 
-                if( order['status'] == 'NEW'):
-                    client.cancel_order(symbol=CurrentSymbol, orderId=order_id)
-                    need_to_sell_for_trail_down = 1
-            except:
-                print(traceback.format_exc())
-                print("Fail to cancel the highest SELL Order,  highest_index = %d, order_id = %d " % (highest_index,order_id))
 
-        time.sleep(60)
+def on_initial_position_filled(fill_price):
+    global SumBuyAmount
+    global SumBuyValue
+    global initial_position
 
+    amount = initial_position['amount']
+    SumBuyAmount += amount
+    SumBuyValue += amount * fill_price
+    print("Initial BUY order filled.    Price=%.2f     amount=%.4f    SumBuyValue=%.4f" %(fill_price, amount, SumBuyValue) )
+    initial_position = None
+    place_initial_sells()
+    save_state()
 
 
-        # 4.2 Second step is to sell QtyPerOrder
-        retry_counter = 3
+def on_initial_position_dropped(status):
+    global initial_position
 
-        if( need_to_sell_for_trail_down == 1 ):
+    print("%s initial position order %d is %s, it is not counted" % (datetime.now(), initial_position['order_id'], status))
+    initial_position = None
+    # nothing to wait for, the SELL grid sells what the account already holds
+    place_initial_sells()
+    save_state()
+
+
+## Trailing rebalance orders: placed by a trail, counted when their fill arrives
+def cancel_edge_order(i):
+    # A trail takes the grid edge i out. "canceled" when its order was still open,
+    # "filled" when it filled before the cancel (counted here as the trail's rebalance
+    # trade, its queued fill is ignored), None while it is partly filled or its status
+    # is unknown: the node stays tracked and the trail waits for a final status
+    global SumBuyAmount
+    global SumSellAmount
+    global SumBuyValue
+    global SumSellValue
+
+    node = GridTradeNodeList[i]
+    order_id = node.order_id
+    try:
+        order = client.get_order(symbol=CurrentSymbol, orderId=order_id)
+        if( order['status'] == 'NEW' ):
             try:
-                price_to_sell = round(current_price * MARKET_SELL_ADDITIONAL_RATE, PRICE_PRECISION)
-                order = client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_sell)
-
-                order_id = order['orderId']
-
-                while( retry_counter > 0 ):
-                    time.sleep(60)
-                    order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-                    if( order['status'] == 'FILLED'):
-                        break
-                    elif(retry_counter == 1):
-                        #client.order_market_sell(symbol=CurrentSymbol, quantity=QtyPerOrder)
-                        print("%s Trailing down, the LIMIT-SELL order is not executed after 3 minites, price @ %.4f" 
-                              %(datetime.now(), price_to_sell))
-                    retry_counter -=1
+                client.cancel_order(symbol=CurrentSymbol, orderId=order_id)
+                return "canceled"
             except:
+                # it filled between the two calls
                 print(traceback.format_exc())
-                print("Trailing down, failed to sell at current price for trailing down ")
-
+                order = client.get_order(symbol=CurrentSymbol, orderId=order_id)
+    except:
+        print(traceback.format_exc())
+        print("%s %d (%d): failed to check edge order %d" % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, order_id))
+        return None
+    if order['status'] in ('CANCELED', 'EXPIRED', 'REJECTED'):
+        return "canceled"
+    if order['status'] != 'FILLED':
+        print("%s edge order %d is %s, trailing waits for it" % (datetime.now(), order_id, order['status']))
+        return None
+
+    if( node.order_status == OrderStatus_SellOrderPlaced ):
+        SumSellAmount+=QtyPerOrder
+        SumSellValue+= QtyPerOrder*node.price_sell
+        print("%s Trailing down, the highest SELL order filled at %.4f before its cancel, no LIMIT-SELL needed. SumSellAmount+=%.4f   SumSellValue+=%.4f"
+              %(datetime.now(), node.price_sell, QtyPerOrder, QtyPerOrder*node.price_sell))
+    else:
+        SumBuyAmount+=QtyPerOrder
+        SumBuyValue+= QtyPerOrder*node.price_buy
+        print("%s Trailing UP, the lowest BUY order filled at %.4f before its cancel, no BUY needed. SumBuyAmount+=%.4f   SumBuyValue+=%.4f"
+              %(datetime.now(), node.price_buy, QtyPerOrder, QtyPerOrder*node.price_buy))
+    return "filled"
 
 
-        # TODO  check if it is really sold?
+def track_rebalance(side, order_id, price, edge=None):
+    # `edge` is the trail's new edge order [index, side, price], placed once this one is done
+    rebalance_orders.append({"order_id": order_id, "side": side, "price": price, "placed_at": time.time(), "edge": edge})
 
-        SumSellAmount+=QtyPerOrder
-        SumSellValue+= QtyPerOrder*price_to_sell
 
-        print("SumSellAmount+=%.4f   SumSellValue+=%.4f MatchedNumber+=1" %(QtyPerOrder, QtyPerOrder * price_to_sell))
-        print_profit()
+def find_rebalance(order_id):
+    for r in rebalance_orders:
+        if r['order_id'] == order_id:
+            return r
+    return None
 
-        print("After trailing down->")
-        print_profit()
 
+def place_edge_order(edge):
+    # The new grid edge of a trail. It waits for the trail's rebalance order, as a new
+    # highest SELL needs the coins the rebalance BUY brings
+    i, side, price = edge
+    node = GridTradeNodeList[i]
+    if( node.node_status != NODE_STATUS_ACTIVE or node.order_status != OrderStatus_NotStarted ):
+        return False        # trailed away again, or adopted on a warm start
+    try:
+        if( side == 'BUY' ):
+            order = client.order_limit_buy(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price)
+        else:
+            order = client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price)
+    except:
+        print(traceback.format_exc())
+        print("%s %d (%d): failed to place the new edge %s order at %.4f"
+              % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, side, price))
+        return False
+    order_id = order['orderId']
+    track_order(i, order_id)
+    node.order_status = OrderStatus_BuyOrderPlaced if side == 'BUY' else OrderStatus_SellOrderPlaced
+    print("%s %d (%d): new edge %s order %d placed @ %.4f"
+          % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, side, order_id, price))
+    return True
+
+
+def retry_edge_orders():
+    # An edge order that could not be placed is tried again on every reconcile
+    waiting = [r['edge'][0] for r in rebalance_orders if r.get('edge')]
+    lowest_index = NumberOfTrailingDownGrids + n_trail_up_or_down
+    highest_index = lowest_index + NumberOfInitialBuyGrids + NumberOfInitialSellGrids - 1
+    placed = False
+    for edge in ([lowest_index, 'BUY', round(GridTradeNodeList[lowest_index].price_buy, PRICE_PRECISION)],
+                 [highest_index, 'SELL', round(GridTradeNodeList[highest_index].price_sell, PRICE_PRECISION)]):
+        if( edge[0] not in waiting and place_edge_order(edge) ):
+            placed = True
+    if placed:
+        save_state()
+
+
+def on_rebalance_filled(order_id, fill_price):
+    global SumBuyAmount
+    global SumSellAmount
+    global SumBuyValue
+    global SumSellValue
 
-        GridTradeNodeList[highest_index].node_status = NODE_STATUS_INACTIVE
-        time.sleep(5)
+    r = find_rebalance(order_id)
+    if r is None:
+        return
+    rebalance_orders.remove(r)
 
+    if( r['side'] == 'SELL' ):
+        SumSellAmount+=QtyPerOrder
+        SumSellValue+= QtyPerOrder*fill_price
+        print("%s Trailing down, the LIMIT-SELL order is filled at %.4f. SumSellAmount+=%.4f   SumSellValue+=%.4f MatchedNumber+=1"
+              %(datetime.now(), fill_price, QtyPerOrder, QtyPerOrder*fill_price))
+    else:
+        SumBuyAmount+=QtyPerOrder
+        SumBuyValue+= QtyPerOrder*fill_price
+        print("%s Trailing UP, the BUY order is filled at %.4f. SumBuyAmount+=%.4f   SumBuyValue+=%.4f"
+              %(datetime.now(), fill_price, QtyPerOrder, QtyPerOrder*fill_price))
+    print_profit()
+    if r.get('edge'):
+        place_edge_order(r['edge'])
+    save_state()
+
+
+def check_rebalance_orders():
+    for r in rebalance_orders:
+        if( not r.get('warned') and time.time() - r['placed_at'] > REBALANCE_WARN_SECONDS ):
+            print("%s Trailing, the LIMIT-%s order %d is not executed after %d seconds, need to check manually, price @ %.4f"
+                  %(datetime.now(), r['side'], r['order_id'], REBALANCE_WARN_SECONDS, r['price']))
+            r['warned'] = True
+
+
+def average_price(order):
+    # a FILLED order's average fill price, its limit price can be better than what it got
+    return float(order['cummulativeQuoteQty'])/float(order['executedQty'])
+
+
+def adopt_open_orders(open_orders, open_ids):
+    # Open orders the saved grid does not know (placed just before a crash) go back
+    # onto the node with the same side and price whose own order is gone
+    for o in open_orders:
+        if( o['orderId'] in order_index or find_rebalance(o['orderId']) is not None
+            or (initial_position is not None and o['orderId'] == initial_position['order_id']) ):
+            continue
+        price = float(o['price'])
+        orphaned = GridTradeNodeList.mask(node_status=NODE_STATUS_ACTIVE) & ~np.isin(GridTradeNodeList.order_id, list(open_ids))
+        column = 'price_buy' if o['side'] == 'BUY' else 'price_sell'
+        i = GridTradeNodeList.find_price(column, price)
+        if i < 0 or not orphaned[i]:
+            print("%s open %s order %d at %.4f is not part of the grid, left alone" % (datetime.now(), o['side'], o['orderId'], price))
+            continue
+        GridTradeNodeList[i].order_status = OrderStatus_BuyOrderPlaced if o['side'] == 'BUY' else OrderStatus_SellOrderPlaced
+        track_order(i, o['orderId'])
+        print("%s %d (%d): adopted open %s order %d at %.4f"
+              % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, o['side'], o['orderId'], price))
+
+
+def reconcile_orders(adopt=False):
+    # Safety net for missed stream events: one open-orders call, then a status
+    # check only for the nodes whose order is no longer open
+    open_orders = client.get_open_orders(symbol=CurrentSymbol)
+    open_ids = {o['orderId'] for o in open_orders}
+    gone = (GridTradeNodeList.mask(node_status=NODE_STATUS_ACTIVE, order_status=ORDER_PLACED)
+            & ~np.isin(GridTradeNodeList.order_id, list(open_ids)))
+    replaced = set()
+    for i in np.flatnonzero(gone).tolist():
+        node = GridTradeNodeList[i]
+        order = client.get_order(symbol=CurrentSymbol, orderId=node.order_id)
+        if order['status'] == 'FILLED':
+            print("%s %d (%d): fill of order %d was not seen on the user stream, handling it now"
+                  % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, node.order_id))
+            untrack_order(i)
+            replacement = find_replacement(node.order_id)
+            if replacement is not None:
+                replaced.add(replacement['orderId'])
+                print("%s %d (%d): its replacement order %d went out before the bot stopped, counting the fill only"
+                      % (datetime.now(), i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, replacement['orderId']))
+            on_order_filled(i, average_price(order), replacement)
+    # after the fills, so an order that replaced a fill is not taken for its node's own
+    if adopt:
+        adopt_open_orders(open_orders, open_ids | replaced)
+    if( initial_position is not None and initial_position['order_id'] not in open_ids ):
+        order = client.get_order(symbol=CurrentSymbol, orderId=initial_position['order_id'])
+        if order['status'] == 'FILLED':
+            print("%s fill of the initial position order %d was not seen on the user stream, handling it now" % (datetime.now(), order['orderId']))
+            on_initial_position_filled(average_price(order))
+        elif order['status'] in ('CANCELED', 'EXPIRED', 'REJECTED'):
+            on_initial_position_dropped(order['status'])
+    for r in [r for r in rebalance_orders if r['order_id'] not in open_ids]:
+        order = client.get_order(symbol=CurrentSymbol, orderId=r['order_id'])
+        if order['status'] == 'FILLED':
+            print("%s fill of rebalance order %d was not seen on the user stream, handling it now" % (datetime.now(), r['order_id']))
+            on_rebalance_filled(r['order_id'], average_price(order))
+        elif order['status'] in ('CANCELED', 'EXPIRED', 'REJECTED'):
+            print("%s rebalance %s order %d is %s, it is not counted" % (datetime.now(), r['side'], r['order_id'], order['status']))
+            rebalance_orders.remove(r)
+            if r.get('edge'):
+                place_edge_order(r['edge'])
+            save_state()
+    retry_edge_orders()
+
+
+# A warm start catches up on the fills missed while the bot was down
+if( warm_start ):
+    try:
+        reconcile_orders(adopt=True)
+    except:
+        print(traceback.format_exc())
+        print("Failed to reconcile the saved grid with the open orders.")
+save_state()
+arm_triggers()
 
 
-        # 4.3  Third Step is to add a lowest BUY order
-        lowest_index= NumberOfTrailingDownGrids + n_trail_up_or_down
-        price_to_buy = round( GridTradeNodeList[lowest_index-1].price_buy, PRICE_PRECISION)
+### Main Loop, on the grid's own thread under grid_engine.py
+def run():
+    global current_price, baseline_price, n_trail_up_or_down, trail_up_counter, trail_down_counter, ticks
 
+    next_tick = time.time() + TICK_SECONDS
+    while (True):
+        # Fills are handled as soon as the user stream reports them, trailing as soon
+        # as the book ticker crosses a trigger
         try:
-            order = client.order_limit_buy(symbol=CurrentSymbol, quantity=QtyPerOrder, price=round(price_to_buy,PRICE_PRECISION))
-            order_id = order['orderId']
-            GridTradeNodeList[lowest_index-1].order_id = order_id
-            GridTradeNodeList[lowest_index-1].order_status = OrderStatus_BuyOrderPlaced
-            GridTradeNodeList[lowest_index-1].node_status = NODE_STATUS_ACTIVE
-
-        except:
-            print(traceback.format_exc())
-            print("%s Trailing down, Failed to place a new lowest order at %.4f, index is %d .\n"
-                 %(datetime.now(),price_to_buy, lowest_index-1))
+            order_id, price = fill_queue.get(timeout=max(0, next_tick - time.time()))
+        except queue.Empty:
+            order_id, price = None, None
+
+        if order_id is not None:
+            i = order_index.pop(order_id, None)
+            if i is not None and GridTradeNodeList[i].node_status == NODE_STATUS_ACTIVE:
+                on_order_filled(i, price)
+            elif i is None and initial_position is not None and order_id == initial_position['order_id']:
+                on_initial_position_filled(price)
+            elif i is None:
+                on_rebalance_filled(order_id, price)
+            continue
 
-        baseline_price -= grid_depth
-        n_trail_up_or_down -= 1
-        trail_down_counter += 1
+        if price is not None:
+            trigger_pending.clear()
+            current_price = round(market_price(price), PRICE_PRECISION)
+        else:
+            next_tick = time.time() + TICK_SECONDS
+            ticks+=1
 
+            if time.time() - last_price_time < PRICE_STALE_SECONDS:
+                current_price = round(last_price, PRICE_PRECISION)
+            else:
+                # the book ticker is down or reconnecting
+                try:
+                    CurrentPrice = client.get_symbol_ticker(symbol=CurrentSymbol)
+                    current_price = round( float(CurrentPrice['price']),PRICE_PRECISION )
+                except:
+                    print(traceback.format_exc())
+                    print("Failed to get current price, sleep for 120s.")
+                    continue
 
-        print("After trailing Down, new baseline_price is %.4f, trail_down_counter is %d" % (baseline_price,trail_down_counter))
-        for i in range(NumberOfTotalGrids):
-            print("%d (%d): note state %d - BUY %.2f - SELL %.2f - order id %d - order state %d" %
-                   ( i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, GridTradeNodeList[i].node_status,
-                   GridTradeNodeList[i].price_buy,GridTradeNodeList[i].price_sell, GridTradeNodeList[i].order_id,
-                   GridTradeNodeList[i].order_status ))
+            check_rebalance_orders()
+            if ticks % RECONCILE_TICKS == 0:
+                try:
+                    reconcile_orders()
+                except:
+                    print(traceback.format_exc())
+                    print("Failed to reconcile the grid with the open orders.")
 
 
+        #Need to trail up or down?
+        if ( current_price <  trail_down_trigger_price  and  (NumberOfTrailingDownGrids + n_trail_up_or_down) > 0 ):
+            print("%s, <<<<------- Trailing down! current_price is %.4f, trail_down_trigger_price is %.4f " % (datetime.now(),current_price, trail_down_trigger_price) )
 
 
-    elif ( current_price >  trail_up_trigger_price and n_trail_up_or_down < NumberOfTrailingUpGrids):
-        print("------->>> Trailing UP ! current_price is %.4f, trail_up_trigger_price is %.4f " % (current_price, trail_up_trigger_price) )
+            highest_index= NumberOfTrailingDownGrids+ NumberOfInitialBuyGrids + NumberOfInitialSellGrids + n_trail_up_or_down -1
+            print("Before trailing Down,  highest_index is %d, Node states:" % (highest_index))
+            print(GridTradeNodeList.dump(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids))
 
 
+            # First Step for trailing down, is to cancel the highest SELL Order
+            need_to_sell_for_trail_down = 0
 
-        lowest_index = NumberOfTrailingDownGrids + n_trail_up_or_down
-        print("Before trailing UP,  lowest_index is %d, Node states:" % (lowest_index))
+            if( GridTradeNodeList[highest_index].order_status == OrderStatus_SellOrderPlaced):
+                cancel = cancel_edge_order(highest_index)
+                print("Trailing down, cancel highest order: ", cancel)
+                if cancel is None:
+                    continue
+                if cancel == "canceled":
+                    need_to_sell_for_trail_down = 1
+            elif( GridTradeNodeList[highest_index].order_status == OrderStatus_NotStarted ):
+                # its SELL is still waiting for an earlier trail's rebalance order, the sale is owed all the same
+                need_to_sell_for_trail_down = 1
 
-        for i in range(NumberOfTotalGrids):
-            print("%d (%d) - node state %d - BUY %.2f - SELL %.2f - order id %d - order state %d" %
-              ( i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, GridTradeNodeList[i].node_status,
-               GridTradeNodeList[i].price_buy,GridTradeNodeList[i].price_sell, GridTradeNodeList[i].order_id,
-               GridTradeNodeList[i].order_status ))
 
-        time.sleep(5)
 
-        # 5.1 First Step for trailing UP, is to cancel the lowest BUY Order
-        need_to_buy_for_trail_up = 0
+            untrack_order(highest_index)
+            GridTradeNodeList[highest_index].node_status = NODE_STATUS_INACTIVE
 
-        if( GridTradeNodeList[lowest_index].order_status == OrderStatus_BuyOrderPlaced):
-            order_id = GridTradeNodeList[lowest_index].order_id
-            try:
-                order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-                print("Trailing UP, lowest order status is ", order['status']  )
+            lowest_index= NumberOfTrailingDownGrids + n_trail_up_or_down
+            GridTradeNodeList[lowest_index-1].order_status = OrderStatus_NotStarted
+            GridTradeNodeList[lowest_index-1].node_status = NODE_STATUS_ACTIVE
+            edge = [lowest_index-1, 'BUY', round( GridTradeNodeList[lowest_index-1].price_buy, PRICE_PRECISION)]
 
-                if( order['status'] == 'NEW'):
-                    client.cancel_order(symbol=CurrentSymbol, orderId=order_id)
-                    need_to_buy_for_trail_up = 1
-            except:
-                print(traceback.format_exc())
-                print("Fail to cancel the lowest BUY Order,  highest_index = %d, order_id = %d " % (lowest_index,order_id))
 
-        GridTradeNodeList[lowest_index].node_status = NODE_STATUS_INACTIVE
+            # 4.2 Second step is to sell QtyPerOrder.
+            # The sale is counted when its fill arrives, the grid keeps trading meanwhile
+            if( need_to_sell_for_trail_down == 1 ):
+                try:
+                    price_to_sell = round(current_price * MARKET_SELL_ADDITIONAL_RATE, PRICE_PRECISION)
+                    order = client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=price_to_sell)
+                    track_rebalance('SELL', order['orderId'], price_to_sell, edge)
+                    print("%s Trailing down, LIMIT-SELL order %d placed @ %.4f" % (datetime.now(), order['orderId'], price_to_sell))
+                except:
+                    print(traceback.format_exc())
+                    print("Trailing down, failed to sell at current price for trailing down ")
+                    need_to_sell_for_trail_down = 0
 
-        time.sleep(15)
 
 
-        #5.2 Second step is to BUY QtyPerOrder
-        retry_counter = 3
+            # 4.3  Third Step is to add a lowest BUY order, once the 4.2 sale is done (on_rebalance_filled)
+            if( need_to_sell_for_trail_down == 0 ):
+                place_edge_order(edge)
 
-        if( need_to_buy_for_trail_up == 1 ):
-            try:
-                price_to_buy = round(current_price*MARKET_BUY_ADDITIONAL_RATE, PRICE_PRECISION)
-                order = client.order_limit_buy(symbol=CurrentSymbol, price=price_to_buy, quantity=QtyPerOrder)
+            baseline_price -= grid_depth
+            n_trail_up_or_down -= 1
+            trail_down_counter += 1
+            arm_triggers()
+            save_state()
 
-                order_id = order['orderId']
 
-                while( retry_counter > 0 ):
-                    time.sleep(60)
-                    order = client.get_order(symbol=CurrentSymbol,orderId=order_id)
-                    if( order['status'] == 'FILLED'):
-                        break
-                    elif(retry_counter == 1):
-                        print("%s Trailing UP, the BUY order is not executed after 3 minites, need to check manually, price to buy is %.4f"
-                        %(datetime.now(), price_to_buy))
-                    retry_counter -=1
+            print("After trailing Down, new baseline_price is %.4f, trail_down_counter is %d" % (baseline_price,trail_down_counter))
+            print(GridTradeNodeList.dump(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids))
 
-            except:
-                print(traceback.format_exc())
-                print("Trailing up, failed to buy at current price for trailing up  ")
 
 
 
-        # TODO  check if the Market_BUY is successful
+        elif ( current_price >  trail_up_trigger_price and n_trail_up_or_down < NumberOfTrailingUpGrids):
+            print("------->>> Trailing UP ! current_price is %.4f, trail_up_trigger_price is %.4f " % (current_price, trail_up_trigger_price) )
 
-        SumBuyAmount+=QtyPerOrder
-        SumBuyValue+= QtyPerOrder*price_to_buy
-        print("TrailUP: SumBuyAmount+=%.4f   SumBuyValue+=%.4f" %(QtyPerOrder,QtyPerOrder*price_to_buy))
-        print_profit()
 
 
-        time.sleep(7)
+            lowest_index = NumberOfTrailingDownGrids + n_trail_up_or_down
+            print("Before trailing UP,  lowest_index is %d, Node states:" % (lowest_index))
 
+            print(GridTradeNodeList.dump(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids))
 
+            # 5.1 First Step for trailing UP, is to cancel the lowest BUY Order
+            need_to_buy_for_trail_up = 0
 
-        #5.3  Third Step is to add a highest SELl order
-        highest_index= NumberOfTrailingDownGrids + NumberOfInitialBuyGrids +NumberOfInitialSellGrids+ n_trail_up_or_down -1
-        GridTradeNodeList[highest_index+1].node_status = NODE_STATUS_ACTIVE
+            if( GridTradeNodeList[lowest_index].order_status == OrderStatus_BuyOrderPlaced):
+                cancel = cancel_edge_order(lowest_index)
+                print("Trailing UP, cancel lowest order: ", cancel)
+                if cancel is None:
+                    continue
+                if cancel == "canceled":
+                    need_to_buy_for_trail_up = 1
+            elif( GridTradeNodeList[lowest_index].order_status == OrderStatus_NotStarted ):
+                # its BUY is still waiting for an earlier trail's rebalance order, the purchase is owed all the same
+                need_to_buy_for_trail_up = 1
 
+            untrack_order(lowest_index)
+            GridTradeNodeList[lowest_index].node_status = NODE_STATUS_INACTIVE
 
+            highest_index= NumberOfTrailingDownGrids + NumberOfInitialBuyGrids +NumberOfInitialSellGrids+ n_trail_up_or_down -1
+            GridTradeNodeList[highest_index+1].order_status = OrderStatus_NotStarted
+            GridTradeNodeList[highest_index+1].node_status = NODE_STATUS_ACTIVE
+            edge = [highest_index+1, 'SELL', round( GridTradeNodeList[highest_index+1].price_sell, PRICE_PRECISION)]
 
 
-        price_to_sell = round( GridTradeNodeList[highest_index+1].price_sell, PRICE_PRECISION)
+            #5.2 Second step is to BUY QtyPerOrder.
+            # The purchase is counted when its fill arrives, the grid keeps trading meanwhile
+            if( need_to_buy_for_trail_up == 1 ):
+                try:
+                    price_to_buy = round(current_price*MARKET_BUY_ADDITIONAL_RATE, PRICE_PRECISION)
+                    order = client.order_limit_buy(symbol=CurrentSymbol, price=price_to_buy, quantity=QtyPerOrder)
+                    track_rebalance('BUY', order['orderId'], price_to_buy, edge)
+                    print("%s Trailing UP, BUY order %d placed @ %.4f" % (datetime.now(), order['orderId'], price_to_buy))
+                except:
+                    print(traceback.format_exc())
+                    print("Trailing up, failed to buy at current price for trailing up  ")
+                    need_to_buy_for_trail_up = 0
 
-        try:
-            order=client.order_limit_sell(symbol=CurrentSymbol, quantity=QtyPerOrder, price=round(price_to_sell,PRICE_PRECISION) )
-            order_id = order['orderId']
-            GridTradeNodeList[highest_index+1].order_id = order_id
-            GridTradeNodeList[highest_index+1].order_status = OrderStatus_SellOrderPlaced
 
-        except:
-            print(traceback.format_exc())
-            print("%s Trailing UP, Failed to place a new highest SELL order at %.4f, index is %d .\n"
-                           %(datetime.now(),price_to_sell, highest_index+1))
 
+            #5.3  Third Step is to add a highest SELl order, once the 5.2 purchase is done (on_rebalance_filled),
+            # it sells the coins that purchase brings
+            if( need_to_buy_for_trail_up == 0 ):
+                place_edge_order(edge)
 
-        baseline_price += grid_depth
-        n_trail_up_or_down += 1
-        trail_up_counter += 1
 
-        print("After trailing Up, new baseline_price is %.4f trail_up_counter is %d" % (baseline_price, trail_up_counter))
-        for i in range(NumberOfTotalGrids):
-            print("%d (%d) - node state %d - BUY %.2f - SELL %.2f - order id %d - order state %d" %
-              ( i, i-NumberOfTrailingDownGrids-NumberOfInitialBuyGrids, GridTradeNodeList[i].node_status,
-               GridTradeNodeList[i].price_buy,GridTradeNodeList[i].price_sell, GridTradeNodeList[i].order_id,
-               GridTradeNodeList[i].order_status))
+            baseline_price += grid_depth
+            n_trail_up_or_down += 1
+            trail_up_counter += 1
+            arm_triggers()
+            save_state()
 
-    else:
-        if( n_trail_up_or_down > NumberOfTrailingUpGrids ):
-            if(ticks %10 == 1):
-                print("We have hit the Trail Up limt.  n_trail_up_or_down is %d" % (n_trail_up_or_down))
-        elif( (NumberOfTrailingDownGrids + n_trail_up_or_down) < 0 ):
-            if(ticks %10 == 1):
-                print("We have hit the Trail Down limt.  n_trail_up_or_down is %d" % (n_trail_up_or_down))
+            print("After trailing Up, new baseline_price is %.4f trail_up_counter is %d" % (baseline_price, trail_up_counter))
+            print(GridTradeNodeList.dump(NumberOfTrailingDownGrids+NumberOfInitialBuyGrids))
 
+        else:
+            if( n_trail_up_or_down > NumberOfTrailingUpGrids ):
+                if(ticks %10 == 1):
+                    print("We have hit the Trail Up limt.  n_trail_up_or_down is %d" % (n_trail_up_or_down))
+            elif( (NumberOfTrailingDownGrids + n_trail_up_or_down) < 0 ):
+                if(ticks %10 == 1):
+                    print("We have hit the Trail Down limt.  n_trail_up_or_down is %d" % (n_trail_up_or_down))
 
 
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,100 @@
+"""
+Crash-safe grid state for grid_future.py / grid_spot.py.
+
+The grid (node table, baseline, trail counters and the SumBuy*/SumSell*
+accumulators) used to live only in memory, so a restart built a new grid
+around the current price and left the old orders behind. The bots now
+keep it in two files next to their log:
+
+  <name>.state.json      compact snapshot of the whole grid
+  <name>.journal         append-only JSON lines, one per change since the
+                         snapshot (the nodes that changed + the counters)
+
+Every append is flushed and fsynced before the bot goes on, so a crash
+loses at most the change being written. After SNAPSHOT_EVERY appends the
+snapshot is rewritten (temp file + os.replace, so it is never half
+written) and the journal is truncated. Lines carry a sequence number, so
+a journal left over from a crash between those two steps is skipped.
+
+    store = GridState(CurrentSymbol + Direction, config)
+    saved = store.load()                # None on first start or config change
+    store.append({3: node_row}, counters)
+    store.snapshot(all_node_rows, counters)
+"""
+
+import json
+import os
+
+SNAPSHOT_EVERY = 200    # journal lines before the snapshot is rewritten
+DURABLE = True          # fsync every write; grid_backtest.py turns it off for its throwaway runs
+
+
+class GridState:
+    def __init__(self, name, config=None, snapshot_every=SNAPSHOT_EVERY):
+        self.snapshot_path = name + ".state.json"
+        self.journal_path = name + ".journal"
+        self.config = config
+        self.snapshot_every = snapshot_every
+        self.appended = 0
+        self.seq = 0
+        self.journal = None
+
+    def load(self):
+        """Return {"nodes": [row, ...], "vars": {...}} or None if there is nothing to resume."""
+        try:
+            with open(self.snapshot_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        if self.config is not None and state.get("config") != self.config:
+            print("[STATE] %s was written with a different config, starting a new grid" % self.snapshot_path)
+            return None
+
+        nodes = state["nodes"]
+        variables = state["vars"]
+        self.seq = state.get("seq", 0)
+        try:
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break       # torn last line from a crash mid-write
+                    if entry["seq"] <= self.seq:
+                        continue    # already in the snapshot
+                    self.seq = entry["seq"]
+                    for i, row in entry["nodes"].items():
+                        nodes[int(i)] = row
+                    variables.update(entry["vars"])
+                    self.appended += 1
+        except FileNotFoundError:
+            pass
+        return {"nodes": nodes, "vars": variables}
+
+    def append(self, nodes, variables):
+        """Journal the changed node rows {index: row} and the current counters."""
+        if self.journal is None:
+            self.journal = open(self.journal_path, "a")
+        self.seq += 1
+        self.journal.write(json.dumps({"seq": self.seq, "nodes": nodes, "vars": variables}) + "\n")
+        self.journal.flush()
+        if DURABLE:
+            os.fsync(self.journal.fileno())
+        self.appended += 1
+
+    def snapshot(self, nodes, variables):
+        """Write the whole grid and start an empty journal."""
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"config": self.config, "seq": self.seq, "nodes": nodes, "vars": variables}, f)
+            f.flush()
+            if DURABLE:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, "w")
+        self.appended = 0
+
+    def due(self):
+        return self.appended >= self.snapshot_every
@@ -0,0 +1,137 @@
+"""
+Column-backed node table for the grid bots.
+
+The grid used to be a list of GridTradeNode objects, one Python object per
+level, and every query ("which nodes are active", "which placed orders are
+no longer open", the node dumps) walked it in a Python loop. GridTable
+keeps the five node fields as parallel NumPy columns instead, so those
+queries are single vectorized masks however fine the grid is:
+
+    grid = GridTable(NumberOfTotalGrids)
+    grid[i].order_status = OrderStatus_BuyOrderPlaced      # same as the old node objects
+    grid.where(node_status=NODE_STATUS_ACTIVE,
+               order_status=(OrderStatus_BuyOrderPlaced, OrderStatus_SellOrderPlaced))
+    grid.find_price("price_buy", price)                     # -1 if none
+
+`grid[i]` is a small view onto row i; its attributes read and write the
+columns and hand back plain Python numbers.
+
+grid_profit() is the PnL both bots log (print_profit) and grid_backtest.py
+reports, computed from a bot's SumBuy*/SumSell* globals.
+"""
+
+import numpy as np
+
+COLUMNS = ("price_buy", "price_sell", "order_status", "order_id", "node_status")
+
+
+class GridNode:
+    __slots__ = ("table", "i")
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+
+def _column(name, cast):
+    def get(self):
+        return cast(getattr(self.table, name)[self.i])
+
+    def set(self, value):
+        getattr(self.table, name)[self.i] = value
+
+    return property(get, set)
+
+
+GridNode.price_buy = _column("price_buy", float)
+GridNode.price_sell = _column("price_sell", float)
+GridNode.order_status = _column("order_status", int)
+GridNode.order_id = _column("order_id", int)
+GridNode.node_status = _column("node_status", int)
+
+
+class GridTable:
+    def __init__(self, size):
+        self.size = size
+        self.price_buy = np.zeros(size, dtype=np.float64)
+        self.price_sell = np.zeros(size, dtype=np.float64)
+        self.order_status = np.zeros(size, dtype=np.int8)
+        self.order_id = np.zeros(size, dtype=np.int64)
+        self.node_status = np.zeros(size, dtype=np.int8)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not -self.size <= i < self.size:
+            raise IndexError(i)
+        return GridNode(self, i % self.size)
+
+    def __iter__(self):
+        return (GridNode(self, i) for i in range(self.size))
+
+    # ---------------- rows (state snapshots) ----------------
+
+    def row(self, i):
+        node = GridNode(self, i)
+        return [getattr(node, name) for name in COLUMNS]
+
+    def rows(self):
+        return [self.row(i) for i in range(self.size)]
+
+    def set_row(self, i, row):
+        for name, value in zip(COLUMNS, row):
+            getattr(self, name)[i] = value
+
+    # ---------------- vectorized queries ----------------
+
+    def mask(self, **conditions):
+        """Boolean mask of the nodes matching every column condition; a tuple means "any of"."""
+        mask = np.ones(self.size, dtype=bool)
+        for name, value in conditions.items():
+            column = getattr(self, name)
+            if isinstance(value, (tuple, list, set, frozenset)):
+                mask &= np.isin(column, list(value))
+            else:
+                mask &= column == value
+        return mask
+
+    def where(self, **conditions):
+        """Indices of the matching nodes, lowest price first."""
+        return np.flatnonzero(self.mask(**conditions))
+
+    def find_price(self, column, price, **conditions):
+        """Index of the matching node whose `column` equals `price`, or -1."""
+        found = np.flatnonzero(self.mask(**conditions) & (getattr(self, column) == price))
+        return int(found[0]) if len(found) else -1
+
+    def dump(self, offset=0):
+        """One line per node, as the bots print them; `offset` is the index of level 0."""
+        return "\n".join(
+            "%d (%d) - node state %d - BUY %.2f - SELL %.2f - order id %d - order state %d"
+            % (i, i - offset, self.node_status[i], self.price_buy[i], self.price_sell[i],
+               self.order_id[i], self.order_status[i])
+            for i in range(self.size))
+
+
+def grid_profit(g, current_price):
+    """Realized/unrealized PnL and matched trades from a grid bot's globals `g`."""
+    buy_amount, buy_value = g["SumBuyAmount"], g["SumBuyValue"]
+    sell_amount, sell_value = g["SumSellAmount"], g["SumSellValue"]
+    average_buy_price = buy_value / buy_amount if buy_amount else 0
+    average_sell_price = sell_value / sell_amount if sell_amount else 0
+    position = buy_amount - sell_amount
+    if buy_amount > sell_amount:
+        realized = (average_sell_price - average_buy_price) * sell_amount
+        unrealized = position * (current_price - average_buy_price)
+    else:
+        realized = (average_sell_price - average_buy_price) * buy_amount
+        unrealized = position * (current_price - average_sell_price)
+    return {
+        "realized_pnl": realized,
+        "unrealized_pnl": unrealized,
+        "matched_number": min(sell_amount, buy_amount) // g["QtyPerOrder"] - g["trail_down_counter"] - g["trail_up_counter"],
+        "average_buy_price": average_buy_price,
+        "average_sell_price": average_sell_price,
+        "position": position,
+    }
@@ -0,0 +1,163 @@
+"""
+Streaming indicators for the live kline handlers.
+
+Each indicator updates in O(1) per closed candle instead of rebuilding a
+DataFrame and recomputing the `ta` indicators from scratch. Values follow the
+`ta` library conventions (fillna=False):
+
+  EMA   -> ta.trend.EMAIndicator     (ewm span=n, adjust=False, NaN for the first n-1)
+  RSI   -> ta.momentum.RSIIndicator  (Wilder smoothing alpha=1/n, 100 when avg loss is 0)
+  MACD  -> ta.trend.MACD             (signal is an EMA of the MACD line once it exists)
+
+Seeded with the same candles, the outputs are identical to `ta`. On a sliding
+window `ta` re-seeds at the oldest candle every time, so long EMAs (EMA200 on a
+500-candle window) drift from the streaming value by the ~0.7% weight that
+window start still carries; the streaming value is the true EMA.
+"""
+
+import math
+from collections import deque
+
+NAN = float("nan")
+
+
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2 / (period + 1)
+        self.raw = None         # internal ewm state, defined from the first input
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        self.raw = x if self.raw is None else self.raw + self.alpha * (x - self.raw)
+        self.count += 1
+        if self.count >= self.period:
+            self.value = self.raw
+        return self.value
+
+
+class RSI:
+    """Wilder RSI."""
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 1 / period
+        self.prev_close = None
+        self.avg_up = None
+        self.avg_down = None
+        self.count = 0
+        self.value = NAN
+
+    def update(self, close):
+        if self.prev_close is None:
+            up = down = 0.0     # ta: diff() of the first candle is NaN, mapped to 0
+        else:
+            diff = close - self.prev_close
+            up = diff if diff > 0 else 0.0
+            down = -diff if diff < 0 else 0.0
+        self.prev_close = close
+
+        if self.avg_up is None:
+            self.avg_up, self.avg_down = up, down
+        else:
+            self.avg_up += self.alpha * (up - self.avg_up)
+            self.avg_down += self.alpha * (down - self.avg_down)
+
+        self.count += 1
+        if self.count >= self.period:
+            if self.avg_down == 0:
+                self.value = 100.0
+            else:
+                self.value = 100 - 100 / (1 + self.avg_up / self.avg_down)
+        return self.value
+
+
+class MACD:
+    def __init__(self, fast, slow, signal):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal_ema = EMA(signal)
+        self.macd = NAN
+        self.signal = NAN
+        self.hist = NAN
+
+    def update(self, close):
+        self.fast.update(close)
+        slow = self.slow.update(close)
+        if math.isnan(slow):
+            return self.macd, self.signal, self.hist
+        self.macd = self.fast.raw - slow
+        self.signal = self.signal_ema.update(self.macd)
+        self.hist = self.macd - self.signal
+        return self.macd, self.signal, self.hist
+
+
+class RollingExtreme:
+    """Rolling max (or min) over the last `window` values, amortized O(1) via a monotonic deque."""
+
+    def __init__(self, window, mode="max"):
+        self.window = window
+        self.is_max = mode == "max"
+        self.items = deque()    # (index, value), values monotonic
+        self.index = 0
+
+    def update(self, x):
+        items = self.items
+        if self.is_max:
+            while items and items[-1][1] <= x:
+                items.pop()
+        else:
+            while items and items[-1][1] >= x:
+                items.pop()
+        items.append((self.index, x))
+        self.index += 1
+        if items[0][0] <= self.index - 1 - self.window:
+            items.popleft()
+        return self.value
+
+    @property
+    def value(self):
+        return self.items[0][1] if self.items else NAN
+
+
+class IndicatorFrame:
+    """Streaming replacement for the per-candle indicator DataFrame.
+
+    `frame["rsi"][-1]` is the latest value and `frame["rsi"][-2]` the previous
+    one; each column keeps the last `lookback` values. Multi-output indicators
+    (MACD) are registered under a tuple of column names.
+    """
+
+    def __init__(self, indicators, lookback=32):
+        self.indicators = indicators
+        self.lookback = lookback
+        self.count = 0
+        self.columns = {"close": deque(maxlen=lookback)}
+        for names in indicators:
+            for name in (names if isinstance(names, tuple) else (names,)):
+                self.columns[name] = deque(maxlen=lookback)
+
+    def update(self, close):
+        self.count += 1
+        self.columns["close"].append(close)
+        for names, indicator in self.indicators.items():
+            out = indicator.update(close)
+            if isinstance(names, tuple):
+                for name, value in zip(names, out):
+                    self.columns[name].append(value)
+            else:
+                self.columns[names].append(out)
+
+    def seed(self, closes):
+        for close in closes:
+            self.update(close)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,203 @@
+"""
+Local kline store shared by the backtest scripts.
+
+Klines are kept on disk as one NumPy structured array per
+(market, symbol, interval, month):
+
+    kline_store/<market>/<SYMBOL>/<interval>/<YYYY-MM>.npy
+
+`sync()` only downloads the closed candles that are missing before the first
+or after the last stored open time, so re-running a backtest over a window that
+is already on disk needs no exchange calls. `load()` memory-maps the month
+files and slices the requested range.
+"""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+STORE_DIR = "kline_store"
+MAX_LIMIT = 1000        # Binance max candles per request
+
+KLINE_DTYPE = np.dtype([
+    ("open_time", "i8"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+    ("close_time", "i8"),
+    ("quote_volume", "f8"),
+    ("trades", "i8"),
+    ("taker_base_volume", "f8"),
+    ("taker_quote_volume", "f8"),
+])
+
+
+def klines_to_array(klines):
+    """Convert raw REST klines (lists of strings/ints) into a KLINE_DTYPE array."""
+    arr = np.empty(len(klines), dtype=KLINE_DTYPE)
+    if not klines:
+        return arr
+    for col, name in enumerate(KLINE_DTYPE.names):
+        arr[name] = [k[col] for k in klines]
+    return arr
+
+
+def to_dataframe(arr, tz=None):
+    """Build the DataFrame layout the backtests expect ("timestamp", "open", ...)."""
+    df = pd.DataFrame({name: arr[name] for name in KLINE_DTYPE.names})
+    df.insert(0, "timestamp", pd.to_datetime(df.pop("open_time"), unit="ms").dt.tz_localize("UTC"))
+    if tz is not None:
+        df["timestamp"] = df["timestamp"].dt.tz_convert(tz)
+    return df
+
+
+class KlineStore:
+    def __init__(self, root=STORE_DIR, market="spot"):
+        if market not in ("spot", "futures"):
+            raise ValueError(f"market must be 'spot' or 'futures', got {market!r}")
+        self.root = root
+        self.market = market
+
+    # -----------------------------
+    # Paths
+    # -----------------------------
+    def _series_dir(self, symbol, interval):
+        return os.path.join(self.root, self.market, symbol.upper(), interval)
+
+    def _month_files(self, symbol, interval):
+        folder = self._series_dir(symbol, interval)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".npy"))
+
+    @staticmethod
+    def _month_key(open_time_ms):
+        return str(np.datetime64(int(open_time_ms), "ms").astype("datetime64[M]"))
+
+    # -----------------------------
+    # Read
+    # -----------------------------
+    def bounds(self, symbol, interval):
+        """Return (first_open_time, last_open_time) on disk, or (None, None)."""
+        files = self._month_files(symbol, interval)
+        if not files:
+            return None, None
+        first = np.load(files[0], mmap_mode="r")
+        last = np.load(files[-1], mmap_mode="r")
+        return int(first["open_time"][0]), int(last["open_time"][-1])
+
+    def load(self, symbol, interval, start_ms=None, end_ms=None):
+        """Return stored klines with start_ms <= open_time < end_ms."""
+        parts = []
+        start_key = self._month_key(start_ms) if start_ms is not None else None
+        end_key = self._month_key(end_ms) if end_ms is not None else None
+        for path in self._month_files(symbol, interval):
+            key = os.path.basename(path)[:-4]
+            if (start_key and key < start_key) or (end_key and key > end_key):
+                continue
+            parts.append(np.load(path, mmap_mode="r"))
+        if not parts:
+            return np.empty(0, dtype=KLINE_DTYPE)
+
+        arr = parts[0] if len(parts) == 1 else np.concatenate(parts)   # keep a single month memory-mapped
+        open_times = arr["open_time"]
+        lo = 0 if start_ms is None else np.searchsorted(open_times, start_ms, side="left")
+        hi = len(arr) if end_ms is None else np.searchsorted(open_times, end_ms, side="left")
+        return arr[lo:hi]
+
+    # -----------------------------
+    # Write
+    # -----------------------------
+    def append(self, symbol, interval, arr):
+        """Merge `arr` into the month files, de-duplicating on open_time."""
+        if len(arr) == 0:
+            return
+        folder = self._series_dir(symbol, interval)
+        os.makedirs(folder, exist_ok=True)
+
+        months = arr["open_time"].astype("datetime64[ms]").astype("datetime64[M]")
+        for month in np.unique(months):
+            chunk = arr[months == month]
+            path = os.path.join(folder, f"{month}.npy")
+            if os.path.exists(path):
+                chunk = np.concatenate([np.load(path), chunk])
+            _, keep = np.unique(chunk["open_time"], return_index=True)
+            chunk = chunk[keep]         # np.unique sorts by open_time
+
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, chunk)
+            os.replace(tmp_path, path)
+
+    # -----------------------------
+    # Sync with the exchange
+    # -----------------------------
+    def _fetch_range(self, client, symbol, interval, start_ms, end_ms):
+        fetch = client.futures_klines if self.market == "futures" else client.get_klines
+        all_klines = []
+        while start_ms < end_ms:
+            klines = fetch(symbol=symbol, interval=interval, startTime=start_ms,
+                           endTime=end_ms - 1, limit=MAX_LIMIT)
+            if not klines:
+                break
+            all_klines += klines
+            start_ms = klines[-1][0] + 1
+            if len(klines) < MAX_LIMIT:
+                break
+        return klines_to_array(all_klines)
+
+    def sync(self, client, symbol, interval, start_ms, end_ms=None):
+        """Download the closed candles in [start_ms, end_ms) that are not on disk yet.
+
+        Returns the number of candles added.
+        """
+        step = interval_to_milliseconds(interval)
+        now_ms = int(time.time() * 1000)
+        end_ms = min(end_ms or now_ms, now_ms)
+        # Only closed candles are stored; the one still forming is fetched next time
+        end_ms -= (end_ms % step)
+        start_ms = -(-start_ms // step) * step
+
+        first, last = self.bounds(symbol, interval)
+        ranges = []
+        if first is None:
+            ranges.append((start_ms, end_ms))
+        else:
+            if start_ms < first:
+                ranges.append((start_ms, first))
+            if last + 2 * step <= end_ms:
+                ranges.append((last + step, end_ms))
+
+        added = 0
+        for lo, hi in ranges:
+            arr = self._fetch_range(client, symbol, interval, lo, hi)
+            arr = arr[arr["close_time"] < now_ms]
+            self.append(symbol, interval, arr)
+            added += len(arr)
+        return added
+
+    def ensure(self, client, symbol, interval, start_ms, end_ms):
+        """Return the candles in [start_ms, end_ms), downloading the range first if none are stored.
+
+        Unlike sync() this fills a hole anywhere, for sparse series such as the
+        1s candles of the few bars a backtest has to look inside.
+        """
+        arr = self.load(symbol, interval, start_ms, end_ms)
+        if len(arr) or client is None:
+            return arr
+        arr = self._fetch_range(client, symbol, interval, start_ms, end_ms)
+        arr = arr[arr["close_time"] < int(time.time() * 1000)]
+        self.append(symbol, interval, arr)
+        return arr
+
+    def fetch_ohlcv(self, client, symbol, interval, days_back=30, tz=None):
+        """Sync the last `days_back` days and return them as a DataFrame."""
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - days_back * 24 * 60 * 60 * 1000
+        self.sync(client, symbol, interval, start_ms, end_ms)
+        return to_dataframe(self.load(symbol, interval, start_ms, end_ms), tz)
@@ -0,0 +1,132 @@
+"""
+Latency histograms for the futures bots, in Prometheus text format.
+
+Every stage of the hot path is timed where it happens and kept as a
+cumulative histogram in this process-wide registry:
+
+  bot_candle_latency_seconds{bot,stage}   kline close (k["T"]) -> handler entry,
+                                          indicators updated, entry decision made
+  bot_order_latency_seconds{bot,stage}    kline close -> order submitted, exchange ack
+  bot_ws_lag_seconds{stream}              local receipt - event time ("E") of each
+                                          websocket message (stream_hub)
+  bot_rest_seconds{method,endpoint}       REST round trip, rate-limit wait excluded
+                                          (rate_limiter)
+  bot_rate_limit_wait_seconds{market,lane}  time a request waited for request weight
+  bot_lock_wait_seconds{lock}             time spent acquiring a shared lock
+
+Observations are a bisect and a counter increment under one lock, cheap
+enough for every candle and order. btcusdc_future_trade.py and
+future_trade_btc_mono.py serve `render()` on the /metrics route of their
+Flask app (port 5001). long_short_future_btc_trade.py runs no Flask app
+and calls `serve(9101)`, as strategy_runner.py does with --metrics-port.
+
+    CANDLE_LATENCY.observe(time.time() - k["T"] / 1000, bot="RSI_LONG_3m", stage="handler")
+    with REST_LATENCY.time(method="POST", endpoint="order"):
+        ...
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; upper bounds of the histogram buckets (+Inf is implicit)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_registry = {}      # name -> Histogram, in registration order
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}    # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with _lock:
+            row = self.series.get(key)
+            if row is None:
+                row = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        for key, row in self.series.items():
+            pairs = [f'{name}="{value}"' for name, value in zip(self.labels, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                le = 'le="%s"' % bound
+                out.append(f"{self.name}_bucket{{{','.join(pairs + [le])}}} {cumulative}")
+            suffix = "{" + ",".join(pairs) + "}" if pairs else ""
+            out.append(f"{self.name}_sum{suffix} {row[-1]}")
+            out.append(f"{self.name}_count{suffix} {cumulative}")
+
+
+def histogram(name, help_text, labels=(), buckets=BUCKETS):
+    """The registered histogram `name`, created on first use (bot modules loaded twice share it)."""
+    with _lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, help_text, labels, buckets)
+        return _registry[name]
+
+
+def render():
+    """All histograms in the Prometheus text exposition format."""
+    out = []
+    with _lock:
+        for h in _registry.values():
+            h._render(out)
+    return "\n".join(out) + "\n"
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve render() on http://host:port/metrics from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+CANDLE_LATENCY = histogram("bot_candle_latency_seconds",
+                           "Kline close time to each stage of the candle handler", ("bot", "stage"))
+ORDER_LATENCY = histogram("bot_order_latency_seconds",
+                          "Kline close time to order submission and exchange ack", ("bot", "stage"))
+WS_LAG = histogram("bot_ws_lag_seconds",
+                   "Local receipt time minus the event time of websocket messages", ("stream",))
+REST_LATENCY = histogram("bot_rest_seconds",
+                         "REST round trip per endpoint, rate-limit wait excluded", ("method", "endpoint"))
+RATE_LIMIT_WAIT = histogram("bot_rate_limit_wait_seconds",
+                            "Time a REST request waited for request weight", ("market", "lane"))
+LOCK_WAIT = histogram("bot_lock_wait_seconds", "Time spent acquiring a shared lock", ("lock",))
@@ -0,0 +1,143 @@
+"""
+One scheduler thread for every pending order expiry in the process.
+
+The spot bots used to start a thread per limit buy that slept (or polled
+an Event once a second) until CANCEL_AFTER ran out. Here all expiries sit
+in one binary heap ordered by deadline, with an index from key to heap
+slot, so
+
+  - schedule() and cancel() (on fill) are O(log n)
+  - the thread sleeps until the earliest deadline, not in 1 s steps
+  - orders that expire within BATCH_WINDOW of each other are handed to
+    their callback in one call, so it can cancel them in one batch
+    (see batch_orders.cancel_orders)
+
+    timers.schedule(order_id, CANCEL_AFTER, expire_limit_buys)
+    timers.cancel(order_id)                 # filled or cancelled by the user
+
+    def expire_limit_buys(order_ids):       # runs on the timer thread
+        ...
+
+The asyncio futures bots do not need this: their expiries are already
+entries in the event loop's timer heap (stream_hub.hub.call_later).
+"""
+
+import threading
+import time
+import traceback
+
+BATCH_WINDOW = 1.0      # seconds; later deadlines inside it fire with the first
+
+
+class TimerWheel:
+    def __init__(self, batch_window=BATCH_WINDOW):
+        self.batch_window = batch_window
+        self.heap = []          # [deadline, seq, key, callback]
+        self.index = {}         # key -> position in heap
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    # ---------------- public API ----------------
+
+    def schedule(self, key, seconds, callback):
+        """Call callback([key, ...]) `seconds` from now; rescheduling a key replaces it."""
+        with self.cond:
+            if key in self.index:
+                self._remove(self.index[key])
+            self.seq += 1
+            self.heap.append([time.monotonic() + seconds, self.seq, key, callback])
+            self.index[key] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+            self._ensure_thread()
+            self.cond.notify()
+
+    def cancel(self, key):
+        """Drop a pending expiry; returns False if it already fired or never existed."""
+        with self.cond:
+            pos = self.index.get(key)
+            if pos is None:
+                return False
+            self._remove(pos)
+            return True
+
+    def pop_due(self, now=None):
+        """Remove and return [(callback, [keys])] for everything due by now + batch_window."""
+        now = time.monotonic() if now is None else now
+        groups = {}
+        with self.cond:
+            if not self.heap or self.heap[0][0] > now:
+                return []
+            limit = now + self.batch_window
+            while self.heap and self.heap[0][0] <= limit:
+                _, _, key, callback = self.heap[0]
+                self._remove(0)
+                groups.setdefault(callback, []).append(key)
+        return list(groups.items())
+
+    # ---------------- heap with key index ----------------
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.index[heap[i][2]] = i
+        self.index[heap[j][2]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[parent][:2] <= self.heap[i][:2]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        n = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self.heap[child][:2] < self.heap[smallest][:2]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def _remove(self, pos):
+        last = len(self.heap) - 1
+        if pos != last:
+            self._swap(pos, last)
+        entry = self.heap.pop()
+        del self.index[entry[2]]
+        if pos < len(self.heap):
+            self._sift_up(pos)
+            self._sift_down(pos)
+
+    # ---------------- thread ----------------
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="order-timers", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.cond.wait(timeout)
+            for callback, keys in self.pop_due():
+                try:
+                    callback(keys)
+                except Exception as e:
+                    print(f"[TIMERS] expiry callback failed for {keys}: {e}")
+                    traceback.print_exc()
+
+
+timers = TimerWheel()
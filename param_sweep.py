@@ -0,0 +1,202 @@
+"""
+Parameter sweep for the limit/TP/SL backtests.
+
+Loads the OHLCV once from the local kline store into shared memory and fans
+the parameter combinations out over all cores with ProcessPoolExecutor. Each
+worker attaches to the shared arrays (no pickling of candles per task), builds
+the strategy signal and runs backtest_engine.run_backtest.
+
+Usage:
+    python param_sweep.py rsi --symbol BTCFDUSD --interval 15m --days 30
+    python param_sweep.py ema --interval 5m --samples 500 --out sweep_ema.csv
+"""
+
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import run_backtest, summarize
+from kline_store import KlineStore
+
+# Candidate values per strategy; every combination is a grid point
+PARAM_GRID = {
+    "rsi": {
+        "BUY_DISCOUNT": [0.9990, 0.9985, 0.9980, 0.9970],
+        "TP_MULTIPLIER": [1.0010, 1.0015, 1.0020, 1.0030],
+        "SL_MULTIPLIER": [0.995, 0.99, 0.985],
+        "ORDER_EXPIRATION": [5, 10, 20],
+        "RSI_PERIOD": [7, 14],
+        "RSI_OVERSOLD": [20, 25, 30, 35],
+    },
+    "ema": {
+        "BUY_DISCOUNT": [0.9990, 0.9985, 0.9980, 0.9970],
+        "TP_MULTIPLIER": [1.0010, 1.0015, 1.0020, 1.0030],
+        "SL_MULTIPLIER": [0.995, 0.99, 0.985],
+        "ORDER_EXPIRATION": [5, 10, 20],
+        "EMA_FAST_PERIOD": [5, 9, 12],
+        "EMA_SLOW_PERIOD": [21, 26, 50],
+        "EMA_TREND_PERIOD": [100, 200],
+    },
+    "blind": {
+        "BUY_DISCOUNT": [0.9990, 0.9985, 0.9980, 0.9970, 0.9960],
+        "TP_MULTIPLIER": [1.0010, 1.0015, 1.0020, 1.0030],
+        "SL_MULTIPLIER": [0.995, 0.99, 0.985, 0.98],
+        "ORDER_EXPIRATION": [5, 10, 20, 40],
+    },
+}
+
+QUANTITY = 0.01
+COLUMNS = ("open", "high", "low", "close")
+
+# Per-worker view of the shared OHLCV block
+_shm = None
+_ohlcv = None
+
+
+# =============================
+# SIGNALS
+# =============================
+def ema(close, period):
+    return pd.Series(close).ewm(span=period, adjust=False).mean().to_numpy()
+
+
+def rolling_rsi(close, period):
+    """Same simple-average RSI as back_test_rsi_cross30.compute_rsi."""
+    delta = pd.Series(close).diff()
+    avg_gain = delta.clip(lower=0).rolling(period, min_periods=period).mean()
+    avg_loss = (-delta.clip(upper=0)).rolling(period, min_periods=period).mean()
+    return (100 - (100 / (1 + avg_gain / avg_loss))).to_numpy()
+
+
+def rsi_signal(ohlcv, p):
+    rsi = rolling_rsi(ohlcv["close"], p["RSI_PERIOD"])
+    signal = np.zeros(len(rsi), dtype=bool)
+    signal[1:] = (rsi[:-1] > p["RSI_OVERSOLD"]) & (rsi[1:] <= p["RSI_OVERSOLD"])
+    return signal, p["RSI_PERIOD"]
+
+
+def ema_signal(ohlcv, p):
+    close = ohlcv["close"]
+    fast = ema(close, p["EMA_FAST_PERIOD"])
+    slow = ema(close, p["EMA_SLOW_PERIOD"])
+    trend = ema(close, p["EMA_TREND_PERIOD"])
+    signal = np.zeros(len(close), dtype=bool)
+    signal[1:] = (fast[:-1] < slow[:-1]) & (fast[1:] >= slow[1:])
+    signal &= close > trend
+    return signal, p["EMA_TREND_PERIOD"]
+
+
+def blind_signal(ohlcv, p):
+    return np.ones(len(ohlcv["close"]), dtype=bool), 3
+
+
+SIGNALS = {"rsi": rsi_signal, "ema": ema_signal, "blind": blind_signal}
+
+
+# =============================
+# WORKERS
+# =============================
+def _attach(shm_name, length):
+    global _shm, _ohlcv
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    block = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=_shm.buf)
+    _ohlcv = {name: block[row] for row, name in enumerate(COLUMNS)}
+
+
+def evaluate(task):
+    strategy, params = task
+    signal, start = SIGNALS[strategy](_ohlcv, params)
+    trades = run_backtest(
+        signal, _ohlcv["high"], _ohlcv["low"], _ohlcv["close"],
+        params["TP_MULTIPLIER"], params["SL_MULTIPLIER"],
+        buy_discount=params["BUY_DISCOUNT"], order_expiration=params["ORDER_EXPIRATION"],
+        quantity=QUANTITY, start=start,
+    )
+    stats = summarize(trades)
+    return {**params, **stats}
+
+
+def build_tasks(strategy, samples=None, seed=None):
+    grid = PARAM_GRID[strategy]
+    names = list(grid)
+    combos = list(itertools.product(*(grid[n] for n in names)))
+    if samples and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return [(strategy, dict(zip(names, combo))) for combo in combos]
+
+
+def run_sweep(df, strategy, samples=None, seed=None, workers=None):
+    """Evaluate every (or a random sample of) grid point over `df`, best first."""
+    tasks = build_tasks(strategy, samples, seed)
+    length = len(df)
+
+    shm = shared_memory.SharedMemory(create=True, size=len(COLUMNS) * length * 8)
+    try:
+        block = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=shm.buf)
+        for row, name in enumerate(COLUMNS):
+            block[row] = df[name].to_numpy(dtype=np.float64)
+
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(shm.name, length)) as pool:
+            results = list(pool.map(evaluate, tasks, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    table = pd.DataFrame(results)
+    return table.sort_values(["total_profit", "win_rate"], ascending=False, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Limit/TP/SL backtest parameter sweep")
+    parser.add_argument("strategy", choices=sorted(PARAM_GRID))
+    parser.add_argument("--symbol", default="BTCFDUSD")
+    parser.add_argument("--interval", default="15m")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--samples", type=int, help="random sample size instead of the full grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--offline", action="store_true", help="use only candles already in the store")
+    parser.add_argument("--out", help="CSV path, default sweep_<strategy>_<symbol>_<interval>.csv")
+    args = parser.parse_args()
+
+    store = KlineStore()
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - args.days * 24 * 60 * 60 * 1000
+    if not args.offline:
+        from binance.client import Client
+        from rate_limiter import rate_limited
+        from key_config import apikey, apisecret
+        store.sync(rate_limited(Client(apikey, apisecret)), args.symbol, args.interval, start_ms, end_ms)
+    arr = store.load(args.symbol, args.interval, start_ms, end_ms)
+    if len(arr) == 0:
+        print("No data. Exiting.")
+        return
+    df = pd.DataFrame({name: arr[name] for name in COLUMNS})
+
+    t0 = time.time()
+    table = run_sweep(df, args.strategy, args.samples, args.seed, args.workers)
+    elapsed = time.time() - t0
+
+    out = args.out or f"sweep_{args.strategy}_{args.symbol}_{args.interval}.csv"
+    table.to_csv(out, index=False)
+
+    print(f"\n========= SWEEP RESULTS ({args.strategy}) =========")
+    print(f"Candles:      {len(df)}")
+    print(f"Evaluations:  {len(table)} in {elapsed:.1f}s")
+    print(f"Results:      {out}")
+    print(table.head(10).to_string(index=False))
+    print("==================================================")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Request-weight scheduler shared by every Binance client in the process.
+
+Each market (spot, futures) gets a token bucket sized to its REQUEST_WEIGHT
+limit per minute. A request takes its weight from the bucket before it is
+sent; when the bucket is empty it waits exactly as long as the refill needs,
+so throughput stays at the limit instead of behind fixed sleeps.
+
+The bucket is re-synced from the X-MBX-USED-WEIGHT-1M header of every
+response. That header counts the weight used by the whole IP, so bots
+sharing a key or a machine throttle each other instead of tripping a 429 or
+418 together. A 429/418 reply blocks the market until its Retry-After and
+the request is retried.
+
+Waiting requests are served by lane: order placement and cancels
+(ORDER_LANE) go ahead of klines, tickers and status polls (DATA_LANE).
+
+The wait for weight, the wait for the limiter's lock and each endpoint's
+round trip are recorded in latency_metrics.
+
+    client = rate_limited(Client(apikey, apisecret))
+    client = async_rate_limited(await AsyncClient.create(apikey, apisecret))
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from binance.exceptions import BinanceAPIException
+from latency_metrics import LOCK_WAIT, RATE_LIMIT_WAIT, REST_LATENCY
+
+ORDER_LANE = 0
+DATA_LANE = 1
+LANE_NAMES = {ORDER_LANE: "order", DATA_LANE: "data"}
+
+# REQUEST_WEIGHT per minute; HEADROOM keeps a margin for requests we cannot see
+WEIGHT_LIMITS = {"spot": 6000, "futures": 2400}
+HEADROOM = 0.9
+MAX_RETRIES = 3
+
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+# Request weight per (market, path suffix); anything not listed counts as 1
+# and is corrected by the next used-weight header.
+ENDPOINT_WEIGHTS = {
+    ("spot", "order", "GET"): 4,
+    ("spot", "openOrders"): 6,
+    ("spot", "allOrders"): 20,
+    ("spot", "klines"): 2,
+    ("spot", "ticker/price"): 2,
+    ("spot", "ticker/24hr"): 2,
+    ("spot", "exchangeInfo"): 20,
+    ("spot", "account"): 20,
+    ("futures", "batchOrders", "POST"): 5,
+    ("futures", "account"): 5,
+    ("futures", "balance"): 5,
+    ("futures", "positionRisk"): 5,
+}
+OPEN_ORDERS_ALL_SYMBOLS = {"spot": 80, "futures": 40}
+ORDER_PATHS = ("order", "batchOrders", "allOpenOrders", "order/oco", "orderList")
+
+
+def _market(uri):
+    return "futures" if "/fapi/" in uri else "spot"
+
+
+def _path(uri):
+    for marker in ("/fapi/", "/api/"):
+        if marker in uri:
+            return uri.split(marker, 1)[1].split("/", 1)[1]  # drop the version
+    return uri
+
+
+def _futures_klines_weight(limit):
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def request_cost(method, uri, params):
+    """Return (weight, lane) for one REST request."""
+    market = _market(uri)
+    path = _path(uri)
+    method = method.upper()
+    params = params or {}
+
+    if path in ORDER_PATHS and method in ("POST", "DELETE", "PUT"):
+        lane = ORDER_LANE
+    else:
+        lane = DATA_LANE
+
+    if path == "openOrders" and "symbol" not in params:
+        return OPEN_ORDERS_ALL_SYMBOLS[market], lane
+    if market == "futures" and path in ("klines", "continuousKlines", "markPriceKlines"):
+        return _futures_klines_weight(int(params.get("limit", 500))), lane
+    if path.startswith("ticker") and "symbol" not in params and "symbols" not in params:
+        return 40 if path == "ticker/24hr" else 4, lane
+    weight = ENDPOINT_WEIGHTS.get((market, path, method), ENDPOINT_WEIGHTS.get((market, path), 1))
+    return weight, lane
+
+
+class _Bucket:
+    def __init__(self, limit):
+        self.capacity = limit * HEADROOM
+        self.rate = limit / 60.0
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = []       # heap of (lane, seq)
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+
+class RateLimiter:
+    def __init__(self, limits=WEIGHT_LIMITS):
+        self.cond = threading.Condition()
+        self.buckets = {market: _Bucket(limit) for market, limit in limits.items()}
+        self.seq = itertools.count()
+
+    def acquire(self, market, weight, lane=DATA_LANE):
+        """Block until `weight` can be spent on `market`, serving lower lanes first."""
+        bucket = self.buckets[market]
+        weight = min(weight, bucket.capacity)
+        ticket = (lane, next(self.seq))
+        start = time.monotonic()
+        with self.cond:
+            LOCK_WAIT.observe(time.monotonic() - start, lock="rate_limiter")
+            heapq.heappush(bucket.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    wait = None
+                    if now < bucket.blocked_until:
+                        wait = bucket.blocked_until - now
+                    elif bucket.waiters[0] == ticket:
+                        if bucket.tokens >= weight:
+                            bucket.tokens -= weight
+                            RATE_LIMIT_WAIT.observe(now - start, market=market, lane=LANE_NAMES[lane])
+                            return
+                        wait = (weight - bucket.tokens) / bucket.rate
+                    self.cond.wait(wait)
+            finally:
+                bucket.waiters.remove(ticket)
+                heapq.heapify(bucket.waiters)
+                self.cond.notify_all()
+
+    async def acquire_async(self, market, weight, lane=DATA_LANE):
+        """acquire() for coroutines: sleeps on the event loop instead of blocking it.
+
+        Order-lane coroutines spend as soon as the tokens are there; data-lane
+        ones also give way to threads queued in acquire().
+        """
+        bucket = self.buckets[market]
+        weight = min(weight, bucket.capacity)
+        start = time.monotonic()
+        while True:
+            locking = time.monotonic()
+            with self.cond:
+                now = time.monotonic()
+                LOCK_WAIT.observe(now - locking, lock="rate_limiter")
+                bucket.refill(now)
+                if now < bucket.blocked_until:
+                    wait = bucket.blocked_until - now
+                elif bucket.tokens >= weight and (lane == ORDER_LANE or not bucket.waiters):
+                    bucket.tokens -= weight
+                    RATE_LIMIT_WAIT.observe(now - start, market=market, lane=LANE_NAMES[lane])
+                    return
+                else:
+                    wait = max((weight - bucket.tokens) / bucket.rate, 0.01)
+            await asyncio.sleep(wait)
+
+    def observe(self, response):
+        """Sync the bucket with the exchange's view of the used weight."""
+        self._observe(_market(response.url), response.status_code, response.headers)
+
+    def _observe(self, market, status, headers):
+        bucket = self.buckets[market]
+        with self.cond:
+            used = headers.get(USED_WEIGHT_HEADER)
+            if used is not None:
+                bucket.refill(time.monotonic())
+                bucket.tokens = min(bucket.tokens, bucket.capacity - int(used))
+            if status in (418, 429):
+                retry_after = int(headers.get("Retry-After", 60))
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+                print(f"[RATE LIMIT] {market} HTTP {status}, pausing requests for {retry_after}s")
+            self.cond.notify_all()
+
+
+limiter = RateLimiter()
+
+
+def rate_limited(client, shared=limiter):
+    """Route all REST calls of a python-binance Client through `shared`."""
+    request = client._request
+
+    def _request(method, uri, signed, force_params=False, **kwargs):
+        weight, lane = request_cost(method, uri, kwargs.get("params") or kwargs.get("data"))
+        market = _market(uri)
+        for attempt in range(MAX_RETRIES + 1):
+            shared.acquire(market, weight, lane)
+            attempt_kwargs = dict(kwargs)
+            if isinstance(kwargs.get("data"), dict):
+                attempt_kwargs["data"] = dict(kwargs["data"])  # the client signs it in place
+            try:
+                with REST_LATENCY.time(method=method.upper(), endpoint=_path(uri)):
+                    return request(method, uri, signed, force_params, **attempt_kwargs)
+            except BinanceAPIException as e:
+                # rejected before execution, safe to resend once the ban is over
+                if e.status_code not in (418, 429) or attempt == MAX_RETRIES:
+                    raise
+
+    client.session.hooks["response"].append(lambda response, *args, **kw: shared.observe(response))
+    client._request = _request
+    return client
+
+
+def async_rate_limited(client, shared=limiter):
+    """rate_limited() for a python-binance AsyncClient."""
+    request = client._request
+
+    async def _request(method, uri, signed, force_params=False, **kwargs):
+        weight, lane = request_cost(method, uri, kwargs.get("params") or kwargs.get("data"))
+        market = _market(uri)
+        for attempt in range(MAX_RETRIES + 1):
+            await shared.acquire_async(market, weight, lane)
+            attempt_kwargs = dict(kwargs)
+            if isinstance(kwargs.get("data"), dict):
+                attempt_kwargs["data"] = dict(kwargs["data"])
+            try:
+                with REST_LATENCY.time(method=method.upper(), endpoint=_path(uri)):
+                    return await request(method, uri, signed, force_params, **attempt_kwargs)
+            except BinanceAPIException as e:
+                if e.status_code not in (418, 429) or attempt == MAX_RETRIES:
+                    raise
+            finally:
+                # aiohttp has no response hooks; the client keeps the last response
+                response = getattr(client, "response", None)
+                if response is not None:
+                    shared._observe(market, response.status, response.headers)
+
+    client._request = _request
+    return client
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Run several long_short_future_btc_trade.py instances in one process.
+
+Each instance takes the same arguments as the standalone bot
+(STRATEGY QUANTITY TIMEFRAME DIRECTION EMA_CHECK) and gets its own copy of
+the bot module, so its state is as isolated as in a separate process. The
+REST client, exchange info, kline history, websocket manager and user-data
+stream come from stream_hub and are opened once for all of them; every
+instance's handlers run on the hub's single event loop.
+
+Usage:
+    python strategy_runner.py "RSI 0.01 3m LONG" "RSI 0.01 3m SHORT" "MACD 0.01 5m LONG EMA50"
+    python strategy_runner.py --script other_bot.py "EMA 0.01 1m LONG"
+    python strategy_runner.py --metrics-port 9101 "RSI 0.01 3m LONG" "EMA 0.01 1m SHORT"
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+import latency_metrics
+from stream_hub import hub
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "long_short_future_btc_trade.py")
+
+
+def load_instance(script, argv, name):
+    """Execute `script` as a fresh module `name` with sys.argv set to `argv`."""
+    spec = importlib.util.spec_from_file_location(name, script)
+    module = importlib.util.module_from_spec(spec)
+    saved_argv = sys.argv
+    sys.argv = [script] + argv
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.argv = saved_argv
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="bot module exposing async attach()")
+    parser.add_argument("--metrics-port", type=int, help="serve every instance's latency histograms on /metrics")
+    parser.add_argument("instances", nargs="+", help='bot arguments of one instance, e.g. "RSI 0.01 3m LONG"')
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        latency_metrics.serve(args.metrics_port)
+
+    bots = [load_instance(args.script, spec.split(), f"strategy_{n}")
+            for n, spec in enumerate(args.instances)]
+    print(f"[RUNNER] {len(bots)} instances: " + " | ".join(args.instances))
+    hub.run(*[bot.attach() for bot in bots])
+
+
+if __name__ == "__main__":
+    main()
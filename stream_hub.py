@@ -0,0 +1,227 @@
+"""
+asyncio core shared by the futures bots.
+
+One event loop runs everything: the kline and user-data websockets
+(BinanceSocketManager), REST calls (AsyncClient behind the shared rate
+limiter), order expiry timers and any order placement a handler spawns.
+Handlers are coroutines on that loop, so bot state needs no lock: nothing
+else runs between two awaits. Timers are loop callbacks, not sleeping
+threads.
+
+A bot that gets its client, exchange info, kline history and streams from
+`hub` can also run many times in one process (see strategy_runner.py). The
+process then keeps:
+
+  - one AsyncClient and one futures_exchange_info call
+  - one kline history fetch per (symbol, interval, limit) at startup
+  - one multiplexed kline socket for every (symbol, interval), each closed
+    candle fanned out to the subscribers as concurrent tasks
+  - one futures user-data stream (its listen key is kept alive by the
+    socket manager); ORDER_TRADE_UPDATE events go only to the instance
+    that claimed the order id, in arrival order
+
+Every message's lag behind its event time ("E") is recorded in
+latency_metrics.WS_LAG.
+
+Usage in a bot:
+
+    async def attach():
+        global client
+        client = hub.client
+        hub.subscribe_klines(SYMBOL, TIMEFRAME, kline_handler)   # async handlers
+
+    order = await client.futures_create_order(...)
+    hub.claim_order(order["orderId"], user_data_handler)
+    timer = hub.call_later(CANCEL_AFTER, cancel_if_unfilled, order["orderId"])
+
+    hub.run(attach())
+"""
+
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+
+from binance import AsyncClient, BinanceSocketManager
+from binance.helpers import interval_to_milliseconds
+from rate_limiter import async_rate_limited
+from latency_metrics import WS_LAG
+from key_config import apikey, apisecret
+
+UNCLAIMED_EVENTS = 200      # order events kept for ids not claimed yet
+FINAL_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "REJECTED", "EXPIRED_IN_MATCH")
+RECONNECT_SECONDS = 5
+
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class StreamHub:
+    def __init__(self):
+        self.client = None              # AsyncClient, created by open()
+        self.bsm = None
+        self.loop = None
+        self.kline_handlers = {}        # "btcusdc@kline_3m" -> [async callback, ...]
+        self.order_owners = {}          # order id -> async callback
+        self.unclaimed = OrderedDict()  # order id -> [msg, ...], events that beat claim_order
+        self.history_cache = {}         # (symbol, interval, limit) -> klines
+        self._exchange_info = None
+        self.tasks = set()
+        self.started = False
+        self.on_error = None            # optional callback(exc), e.g. send_exception_to_telegram
+
+    async def open(self):
+        if self.client is None:
+            self.loop = asyncio.get_running_loop()
+            self.client = async_rate_limited(await AsyncClient.create(apikey, apisecret))
+            self.bsm = BinanceSocketManager(self.client)
+
+    # ---------------- REST, fetched once per process ----------------
+
+    async def exchange_info(self):
+        if self._exchange_info is None:
+            self._exchange_info = await self.client.futures_exchange_info()
+        return self._exchange_info
+
+    async def history(self, symbol, interval, limit):
+        """Startup klines; instances on the same stream share one fetch per candle."""
+        key = (symbol, interval, limit)
+        klines = self.history_cache.get(key)
+        # still current while the newest (open) candle has not closed
+        if klines and time.time() * 1000 < klines[-1][0] + interval_to_milliseconds(interval):
+            return klines
+        klines = await self.client.futures_klines(symbol=symbol, interval=interval, limit=limit)
+        self.history_cache[key] = klines
+        return klines
+
+    # ---------------- tasks and timers ----------------
+
+    def spawn(self, coro):
+        """Run `coro` concurrently; errors are printed and passed to on_error."""
+        task = self.loop.create_task(self._guard(coro))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def call_later(self, seconds, coro_fn, *args):
+        """Spawn coro_fn(*args) after `seconds`; returns a handle with cancel()."""
+        return self.loop.call_later(seconds, lambda: self.spawn(coro_fn(*args)))
+
+    async def _guard(self, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{now_str()}] [HUB] task error: {e}")
+            traceback.print_exc()
+            if self.on_error:
+                self.on_error(e)
+
+    # ---------------- subscriptions ----------------
+
+    def subscribe_klines(self, symbol, interval, callback):
+        stream = f"{symbol.lower()}@kline_{interval}"
+        new_stream = stream not in self.kline_handlers
+        self.kline_handlers.setdefault(stream, []).append(callback)
+        if self.started and new_stream:
+            self.spawn(self._listen(lambda: self.bsm.futures_multiplex_socket([stream]), self._on_kline))
+
+    def claim_order(self, order_id, callback):
+        """Route the user-stream events of `order_id` to `callback`."""
+        order_id = int(order_id)
+        self.order_owners[order_id] = callback
+        early = self.unclaimed.pop(order_id, [])
+        if early:
+            self.spawn(self._replay(order_id, callback, early))
+
+    async def _replay(self, order_id, callback, msgs):
+        for msg in msgs:
+            await self._deliver(order_id, callback, msg)
+
+    # ---------------- dispatch ----------------
+
+    async def _listen(self, open_socket, dispatch):
+        while True:
+            try:
+                async with open_socket() as socket:
+                    while True:
+                        msg = await socket.recv()
+                        if msg:
+                            await dispatch(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{now_str()}] [HUB] socket error: {e}, reconnecting in {RECONNECT_SECONDS}s")
+                await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _on_kline(self, msg):
+        stream = msg.get("stream")
+        data = msg.get("data", msg)
+        if stream is None:
+            k = msg.get("k", {})
+            stream = f"{k.get('s', '').lower()}@kline_{k.get('i')}"
+        if "E" in data:
+            WS_LAG.observe(time.time() - data["E"] / 1000, stream=stream)
+        for callback in self.kline_handlers.get(stream, ()):
+            self.spawn(callback(msg))
+
+    async def _on_user(self, msg):
+        if "E" in msg:
+            WS_LAG.observe(time.time() - msg["E"] / 1000, stream="user")
+        if msg.get("e") != "ORDER_TRADE_UPDATE":
+            print(f"[USER STREAM] Ignored event type: {msg.get('e')}")
+            return
+        order_id = int(msg["o"]["i"])
+        callback = self.order_owners.get(order_id)
+        if callback is None:
+            self.unclaimed.setdefault(order_id, []).append(msg)
+            while len(self.unclaimed) > UNCLAIMED_EVENTS:
+                self.unclaimed.popitem(last=False)
+            return
+        await self._deliver(order_id, callback, msg)
+
+    async def _deliver(self, order_id, callback, msg):
+        if msg["o"]["X"] in FINAL_STATUSES:
+            self.order_owners.pop(order_id, None)
+        try:
+            await callback(msg)
+        except Exception as e:
+            print(f"[{now_str()}] [HUB] user handler error: {e}")
+            if self.on_error:
+                self.on_error(e)
+
+    # ---------------- lifecycle ----------------
+
+    def start(self):
+        """Open the shared sockets; later subscriptions get their own socket."""
+        if self.started:
+            return
+        self.started = True
+        self.spawn(self._listen(self.bsm.futures_user_socket, self._on_user))
+        if self.kline_handlers:
+            streams = list(self.kline_handlers)
+            self.spawn(self._listen(lambda: self.bsm.futures_multiplex_socket(streams), self._on_kline))
+        print(f"[{now_str()}] [HUB] streams: {', '.join(self.kline_handlers)} + user data")
+
+    async def _main(self, setups):
+        await self.open()
+        try:
+            for setup in setups:
+                await setup
+            self.start()
+            await asyncio.Event().wait()    # until cancelled
+        finally:
+            await self.client.close_connection()
+
+    def run(self, *setups):
+        """Run the loop: await each setup coroutine, open the streams, serve until Ctrl-C."""
+        try:
+            asyncio.run(self._main(setups))
+        except KeyboardInterrupt:
+            print(f"[{now_str()}] Shutting down gracefully...")
+
+
+hub = StreamHub()
@@ -0,0 +1,153 @@
+"""
+Background Telegram notifications for the trading bots.
+
+`send()` only puts the message on a bounded queue and returns; a daemon thread
+does the HTTP work over one keep-alive requests.Session. Trading threads never
+wait on the Telegram API, even when they notify while holding `lock`.
+
+Messages queued while the worker waits for a chat's send slot are coalesced
+into one message (up to Telegram's 4096 characters). Each chat gets at most
+one message per MIN_INTERVAL seconds, and a 429 reply pauses that chat for
+its retry_after. When the queue is full new messages are dropped and counted,
+and the count is reported with the next message that goes out.
+
+    notifier = TelegramNotifier(TELEGRAM_TOKEN, CHAT_ID)
+    notifier.send("Filled")                                 # never blocks
+    notifier.send("<b>Crash</b>", parse_mode="HTML")
+"""
+
+import atexit
+import queue
+import threading
+import time
+
+import requests
+
+MAX_QUEUE = 200         # messages waiting to be picked up by the worker
+MAX_CHARS = 4096        # Telegram message limit
+MIN_INTERVAL = 1.0      # seconds between messages to the same chat
+REQUEST_TIMEOUT = 10
+CLOSE_TIMEOUT = 5       # seconds granted at exit to flush what is queued
+
+
+class TelegramNotifier:
+    def __init__(self, token, chat_id, max_queue=MAX_QUEUE, min_interval=MIN_INTERVAL):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_pending = max_queue
+        self.session = requests.Session()
+        self.pending = {}       # (chat_id, parse_mode) -> [text, ...], oldest first
+        self.next_send = {}     # chat_id -> monotonic time of its next slot
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.closing = False
+        self.thread = threading.Thread(target=self._run, name="telegram", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def send(self, text, chat_id=None, parse_mode=None):
+        """Queue `text` for delivery; drops it if the queue is full."""
+        try:
+            self.queue.put_nowait((chat_id or self.chat_id, parse_mode, str(text)))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Give the worker up to `timeout` seconds to deliver what is queued."""
+        self.closing = True
+        try:
+            self.queue.put_nowait(None)     # wake the worker if it is idle
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    # ---------------- worker ----------------
+
+    def _pending_count(self):
+        return sum(len(texts) for texts in self.pending.values())
+
+    def _take(self, item):
+        if item is None:
+            return
+        chat_id, parse_mode, text = item
+        self.pending.setdefault((chat_id, parse_mode), []).append(text)
+
+    def _drain(self, timeout):
+        """Move queued messages into `pending`, waiting up to `timeout` for the first one."""
+        try:
+            self._take(self.queue.get(timeout=timeout))
+            while self._pending_count() < self.max_pending:
+                self._take(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+
+    def _next_key(self):
+        keys = [key for key, texts in self.pending.items() if texts]
+        if not keys:
+            return None, None
+        key = min(keys, key=lambda k: self.next_send.get(k[0], 0.0))
+        return key, self.next_send.get(key[0], 0.0) - time.monotonic()
+
+    def _compose(self, key):
+        texts = self.pending[key]
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        parts = [f"({dropped} notifications dropped)"] if dropped else []
+        size = len(parts[0]) if parts else 0
+        while texts and (not parts or size + 1 + len(texts[0]) <= MAX_CHARS):
+            text = texts.pop(0)
+            parts.append(text)
+            size += len(text) + 1
+        if not texts:
+            del self.pending[key]
+        return "\n".join(parts)[:MAX_CHARS]
+
+    def _post(self, chat_id, parse_mode, text):
+        data = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        try:
+            r = self.session.post(self.url, data=data, timeout=REQUEST_TIMEOUT)
+            if r.status_code == 429:
+                retry_after = r.json().get("parameters", {}).get("retry_after", 5)
+                self.next_send[chat_id] = time.monotonic() + retry_after
+                print(f"[TELEGRAM] rate limited, retrying in {retry_after}s")
+                return False
+        except Exception as e:
+            print(f"[TELEGRAM ERROR] {e}")
+        return True
+
+    def _run(self):
+        while True:
+            key, wait = self._next_key()
+            if key is None:
+                if self.closing and self.queue.empty():
+                    return
+                self._drain(None)
+                continue
+            if wait > 0:
+                self._drain(wait)   # keep collecting while the chat's slot is not free
+                continue
+            self._drain(0)
+            chat_id, parse_mode = key
+            text = self._compose(key)
+            if not self._post(chat_id, parse_mode, text):
+                # put it back in front and wait for the chat's retry_after
+                self.pending.setdefault(key, []).insert(0, text)
+                continue
+            self.next_send[chat_id] = time.monotonic() + self.min_interval
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_notifier(token, chat_id):
+    """One notifier per bot token in the process, so bots hosted together share the chat limit."""
+    with _shared_lock:
+        if token not in _shared:
+            _shared[token] = TelegramNotifier(token, chat_id)
+        return _shared[token]
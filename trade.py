@@ -1,6 +1,7 @@
 #!/home/ruanrongbin/.local/bin/python3
 import time
 from binance.client import Client
+from rate_limiter import rate_limited
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt   # needs pip install
@@ -12,7 +13,7 @@ import key_config
 fd=open("log.txt", "a")
 
 
-client = Client(key_config.API_KEY, key_config.SECURITY_KEY)
+client = rate_limited(Client(key_config.API_KEY, key_config.SECURITY_KEY))
 
 total_profit = 0
 
@@ -46,8 +47,6 @@ def execute_buy_and_take_profit_or_stoploss():
             print("execute_buy_and_take_profit_or_stoploss: except occured while running get_symbol_ticker and placing buy order.");
             time.sleep(60)
 
-    time.sleep(60)
-
     # 300 seconds count down for the buy order
     time_out_buy_order = 320
     while (True):
@@ -68,7 +67,6 @@ def execute_buy_and_take_profit_or_stoploss():
             print("Buy-Order Timed Out, waiting for next buy-signal.")
             fd.write("Buy-Order Timed Out, waiting for next buy-signal.")
             return
-    time.sleep(10)
     price_to_sell = price_to_buy + 100
     quantity_to_sell = quantity_to_buy
 
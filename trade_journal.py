@@ -0,0 +1,189 @@
+"""
+Buffered trade journal and log file for the bots.
+
+`write()` hands the row to a writer thread and returns at once, so the
+websocket callbacks never touch the disk. The writer keeps the file open,
+collects rows into a batch and writes it when FLUSH_ROWS rows are waiting or
+FLUSH_SECONDS after the first row of the batch, whichever comes first. On
+close (registered with atexit) it writes what is left and fsyncs.
+
+Backend is picked by the journal path:
+
+  *.csv               CSV, one row per trade, header written once for a new file
+  *.db / *.sqlite     SQLite in WAL mode, table `trades` with one column per
+                      header name, e.g.
+                      sqlite3 trades.db "select event, sum(p_l_usdc) from trades group by event"
+
+    journal = open_journal(LOG_FILE, ["Timestamp", "Event", "OrderID", ...])
+    journal.write([ts, event, order_id, ...])
+
+`LogFile` is the same writer for free text; the grid bots use it in place
+of stdout.
+"""
+
+import atexit
+import csv
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+FLUSH_ROWS = 100
+FLUSH_SECONDS = 1.0
+CLOSE_TIMEOUT = 10
+
+_CLOSE = object()
+
+
+class _BackgroundWriter:
+    def __init__(self, path, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"journal:{path}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Write what is queued, fsync and stop the writer."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_CLOSE)
+        self.thread.join(timeout)
+
+    def _run(self):
+        self._open()
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None     # batch is due
+            if item is _CLOSE:
+                self._flush(batch)
+                self._sync()
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(item)
+                if len(batch) < self.flush_rows:
+                    continue
+            self._flush(batch)
+            batch = []
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            self._write(batch)
+        except Exception as e:
+            # not print(): stdout may be this writer
+            sys.__stderr__.write(f"[JOURNAL ERROR] {self.path}: {e}\n")
+
+
+class CsvJournal(_BackgroundWriter):
+    def __init__(self, path, header=None, **kwargs):
+        self.header = header
+        super().__init__(path, **kwargs)
+
+    def write(self, row):
+        self.queue.put(list(row))
+
+    def _open(self):
+        self.file = open(self.path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if self.header and self.file.tell() == 0:
+            self.writer.writerow(self.header)
+            self.file.flush()
+
+    def _write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def column_name(header):
+    """SQL column for a CSV header, e.g. "P/L(USDC)" -> "p_l_usdc"."""
+    return re.sub(r"\W+", "_", header).strip("_").lower()
+
+
+class SqliteJournal(_BackgroundWriter):
+    def __init__(self, path, header, **kwargs):
+        self.columns = [column_name(h) for h in header]
+        super().__init__(path, **kwargs)
+
+    def write(self, row):
+        self.queue.put(tuple(row))
+
+    def _open(self):
+        # the connection belongs to the writer thread
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # NUMERIC affinity stores the formatted prices as numbers, text stays text
+        columns = ", ".join(f"{c} NUMERIC" for c in self.columns)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS trades ({columns})")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS trades_{self.columns[0]} ON trades ({self.columns[0]})")
+        self.db.commit()
+        marks = ", ".join("?" * len(self.columns))
+        self.insert = f"INSERT INTO trades ({', '.join(self.columns)}) VALUES ({marks})"
+
+    def _write(self, rows):
+        self.db.executemany(self.insert, rows)
+        self.db.commit()
+
+    def _sync(self):
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.db.close()
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def open_journal(path, header, **kwargs):
+    """Journal for `path`; bots in the same process share one writer per file."""
+    with _journals_lock:
+        if path not in _journals:
+            if path.endswith((".db", ".sqlite")):
+                _journals[path] = SqliteJournal(path, header, **kwargs)
+            else:
+                _journals[path] = CsvJournal(path, header, **kwargs)
+        return _journals[path]
+
+
+class LogFile(_BackgroundWriter):
+    """File-like text log; `sys.stdout = LogFile(path)` keeps print() off the disk path."""
+
+    def write(self, message):
+        if message:
+            self.queue.put(message)
+        return len(message)
+
+    def flush(self):
+        pass    # the writer thread flushes on its own schedule
+
+    def _open(self):
+        self.file = open(self.path, "a")
+
+    def _write(self, messages):
+        self.file.write("".join(messages))
+        self.file.flush()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
@@ -1,6 +1,7 @@
 import time
 import logging
 from binance.client import Client
+from rate_limiter import rate_limited
 from binance.enums import *
 import pandas as pd
 import numpy as np
@@ -16,7 +17,7 @@ API_KEY = 'your_api_key_here'
 API_SECRET = 'your_api_secret_here'
 
 # Initialize Binance client
-client = Client(API_KEY, API_SECRET)
+client = rate_limited(Client(API_KEY, API_SECRET))
 
 # Trading parameters
 SYMBOL = 'BTCUSDT'
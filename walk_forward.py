@@ -0,0 +1,366 @@
+"""
+Walk-forward optimizer for the long_short_future_btc_trade.py thresholds.
+
+The bot's entry filters (RSI_OVERSOLD / RSI_OVERBOUGHT, the MACD and EMA
+periods, TP_PCT / SL_PCT and the spread/range margins in should_enter) were
+hand-picked once. This slides a train window and the test window after it
+over the local kline store:
+
+    |---- train ----|-- test --|
+               |---- train ----|-- test --|
+                          |---- train ----|-- test --|       ...    |---- live ----|
+
+Each train window is grid-searched and its best combination is scored on
+the following test window only, so the stitched test results are
+out-of-sample. The last window ends at the newest candle; its winner is
+written to the file the bot loads at start
+(long_short_<SYMBOL>_<STRATEGY>_<DIRECTION>_<TIMEFRAME>.json).
+
+should_enter is evaluated for every candle of a window at once: the
+indicators are computed once per period over the whole series (same values
+as indicators.py), the conditions are array comparisons on lagged views,
+and the trades go through backtest_engine.run_backtest. Shorts run through
+the same engine on the mirrored series (high -> -low, low -> -high). As in
+the other backtests the stop-loss exits at SL_PCT when a candle's low
+(high) reaches it, where the bot waits for the close and then works a limit.
+
+Windows run in parallel processes attached to one shared-memory OHLCV block.
+
+Usage:
+    python walk_forward.py RSI LONG --timeframe 3m --days 180
+    python walk_forward.py MACD SHORT --timeframe 5m --train-days 30 --test-days 7 --ema-check EMA50
+    python walk_forward.py EMA LONG --timeframe 1m --offline --report wf_ema.csv
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+from backtest_engine import run_backtest, summarize
+from kline_store import KlineStore
+
+# Candidate values; the bot's hardcoded value is in every list
+COMMON_GRID = {
+    "TP_PCT": [0.0015, 0.002, 0.003, 0.0045],
+    "SL_PCT": [0.005, 0.008, 0.01, 0.015],
+}
+PARAM_GRID = {
+    "RSI": {
+        "RSI_PERIOD": [7, 9, 14],
+        "RSI_OVERSOLD": [18, 22, 26, 30],           # LONG only
+        "RSI_OVERBOUGHT": [70, 74, 78, 82],         # SHORT only
+    },
+    "MACD": {
+        "MACD_FAST": [6, 8, 12],
+        "MACD_SLOW": [21, 26],
+        "MACD_SIGNAL": [5, 9],
+        "MACD_MIN_SPREAD": [2.0, 4.0, 8.0],
+        "TP_RANGE_MARGIN": [50, 100, 200],
+    },
+    "EMA": {
+        "EMA_FAST": [5, 9, 12],
+        "EMA_SLOW": [21, 26, 34],
+        "EMA_MIN_GAP": [5, 10, 15],
+        "EMA_MIN_CROSS": [4, 7, 10],
+        "TP_RANGE_MARGIN": [50, 100, 200],
+    },
+}
+# Kept at the bot's values
+FIXED = {"RSI_FILTER_PERIOD": 14, "EMA_TREND": 50, "MACD_TREND_BARS": 7, "RECENT_RANGE_BARS": 24}
+
+ENTRY_OFFSET = 0.0005       # the bot's limit entry is 0.05% inside the close
+CANCEL_AFTER = 10 * 60      # seconds before the bot cancels an unfilled entry
+MIN_HISTORY = 200           # should_enter() returns None on shorter frames
+COLUMNS = ("high", "low", "close")
+
+# Per-worker view of the shared OHLCV block and the indicators computed on it
+_shm = None
+_ohlcv = None
+_cache = {}
+
+
+# =============================
+# INDICATORS (whole series, same values as indicators.py)
+# =============================
+def _ewm(x, **kw):
+    return pd.Series(x).ewm(adjust=False, **kw).mean().to_numpy(copy=True)
+
+
+def ema(close, period):
+    out = _ewm(close, span=period)
+    out[:period - 1] = np.nan
+    return out
+
+
+def rsi(close, period):
+    diff = np.diff(close, prepend=close[0])
+    avg_up = _ewm(np.clip(diff, 0, None), alpha=1 / period)
+    avg_down = _ewm(np.clip(-diff, 0, None), alpha=1 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(avg_down == 0, 100.0, 100 - 100 / (1 + avg_up / avg_down))
+    out[:period - 1] = np.nan
+    return out
+
+
+def macd(close, fast, slow, signal):
+    line = _ewm(close, span=fast) - _ewm(close, span=slow)
+    line[:slow - 1] = np.nan
+    sig = np.full(len(close), np.nan)
+    sig[slow - 1:] = ema(line[slow - 1:], signal)
+    return line, sig
+
+
+def indicator(name, *args):
+    """Memoized whole-series indicator of the shared close prices."""
+    key = (name, *args)
+    if key not in _cache:
+        close = _ohlcv["close"]
+        if name == "ema":
+            _cache[key] = ema(close, *args)
+        elif name == "rsi":
+            _cache[key] = rsi(close, *args)
+        elif name == "macd":
+            _cache[key] = macd(close, *args)
+        elif name == "prev_high":
+            _cache[key] = pd.Series(_ohlcv["high"]).rolling(*args).max().shift(1).to_numpy()
+        elif name == "prev_low":
+            _cache[key] = pd.Series(_ohlcv["low"]).rolling(*args).min().shift(1).to_numpy()
+    return _cache[key]
+
+
+# =============================
+# SIGNAL (should_enter for a whole window)
+# =============================
+def entry_signal(strategy, direction, ema_check, p, lo, hi):
+    """Boolean should_enter(...) == direction for each candle in [lo, hi); needs lo >= 15."""
+    def at(values, k=1):        # values[-k] as seen from each candle of the window
+        return values[lo - k + 1:hi - k + 1]
+
+    close = at(_ohlcv["close"])
+    long = direction == "LONG"
+    rsi14 = at(indicator("rsi", FIXED["RSI_FILTER_PERIOD"]))
+    ok = ~(rsi14 > 70) if long else ~(rsi14 < 30)
+    if ema_check == "EMA50" and strategy != "RSI":      # the bot turns EMA_CHECK off for RSI
+        ema50 = at(indicator("ema", FIXED["EMA_TREND"]))
+        ok &= close > ema50 if long else close < ema50
+
+    if strategy in ("MACD", "EMA"):
+        if long:
+            target = close * (1 + p["TP_PCT"]) - p["TP_RANGE_MARGIN"]
+            ok &= ~(target > at(indicator("prev_high", FIXED["RECENT_RANGE_BARS"])))
+        else:
+            target = close * (1 - p["TP_PCT"]) + p["TP_RANGE_MARGIN"]
+            ok &= ~(target < at(indicator("prev_low", FIXED["RECENT_RANGE_BARS"])))
+
+    if strategy == "RSI":
+        r = indicator("rsi", p["RSI_PERIOD"])
+        if long:
+            return ok & (at(r, 2) <= p["RSI_OVERSOLD"]) & (at(r, 1) > p["RSI_OVERSOLD"])
+        return ok & (at(r, 2) >= p["RSI_OVERBOUGHT"]) & (at(r, 1) < p["RSI_OVERBOUGHT"])
+
+    if strategy == "MACD":
+        line, sig = indicator("macd", p["MACD_FAST"], p["MACD_SLOW"], p["MACD_SIGNAL"])
+        # gap[k] = signal - macd (LONG) or macd - signal (SHORT) k candles back
+        gap = {k: (at(sig, k) - at(line, k)) if long else (at(line, k) - at(sig, k)) for k in range(1, 16)}
+        spread = p["MACD_MIN_SPREAD"]
+        ok &= (gap[2] >= 0) & (gap[1] < 0)
+        ok &= (-gap[1] > spread) | (gap[2] > spread) | (gap[3] > spread) | (gap[4] > spread)
+        trend = sum((gap[k] > 0).astype(np.int8) for k in range(2, 16))
+        return ok & (trend > FIXED["MACD_TREND_BARS"])
+
+    fast = indicator("ema", p["EMA_FAST"])
+    slow = indicator("ema", p["EMA_SLOW"])
+    gap = {k: (at(slow, k) - at(fast, k)) if long else (at(fast, k) - at(slow, k)) for k in range(1, 6)}
+    ok &= (gap[4] >= 0) & (gap[3] >= 0) & (gap[2] >= 0) & (gap[1] < 0)
+    wide = -gap[1] >= p["EMA_MIN_CROSS"] if long else -gap[1] > p["EMA_MIN_CROSS"]
+    for k in range(2, 6):
+        wide |= gap[k] >= p["EMA_MIN_GAP"]
+    return ok & wide
+
+
+def backtest(signal, direction, p, lo, hi, expiration, quantity):
+    """Trades of the bot over candles [lo, hi) on entry `signal` with exits from `p`."""
+    high, low, close = (_ohlcv[name][lo:hi] for name in COLUMNS)
+    if direction == "LONG":
+        return run_backtest(signal, high, low, close, 1 + p["TP_PCT"], 1 - p["SL_PCT"],
+                            buy_discount=1 - ENTRY_OFFSET, order_expiration=expiration, quantity=quantity)
+    # a short is a long on the mirrored series
+    return run_backtest(signal, -low, -high, -close, 1 - p["TP_PCT"], 1 + p["SL_PCT"],
+                        buy_discount=1 + ENTRY_OFFSET, order_expiration=expiration, quantity=quantity)
+
+
+# =============================
+# WORKERS
+# =============================
+def _attach(shm_name, length):
+    global _shm, _ohlcv
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    block = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=_shm.buf)
+    _ohlcv = {name: block[row] for row, name in enumerate(COLUMNS)}
+
+
+def build_combos(strategy, direction):
+    """Every grid point; SL_PCT varies fastest since it does not change the entry signal."""
+    grid = {**COMMON_GRID, **PARAM_GRID[strategy]}
+    grid.pop("RSI_OVERBOUGHT" if direction == "LONG" else "RSI_OVERSOLD", None)
+    grid["SL_PCT"] = grid.pop("SL_PCT")
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+
+
+def optimize_window(task):
+    """Grid-search the train range, then score the winner on the test range (if any)."""
+    (strategy, direction, ema_check, combos, expiration, quantity, min_trades,
+     train_lo, train_hi, test_hi) = task
+    best, best_key = None, None
+    signal_key = signal = None
+    for p in combos:
+        key = tuple(v for k, v in p.items() if k != "SL_PCT")
+        if key != signal_key:
+            signal_key, signal = key, entry_signal(strategy, direction, ema_check, p, train_lo, train_hi)
+        stats = summarize(backtest(signal, direction, p, train_lo, train_hi, expiration, quantity))
+        key = (stats["total_trades"] >= min_trades, stats["total_profit"], stats["win_rate"])
+        if best_key is None or key > best_key:
+            best, best_key = (p, stats), key
+
+    params, train = best
+    test_trades = []
+    if test_hi > train_hi:
+        signal = entry_signal(strategy, direction, ema_check, params, train_hi, test_hi)
+        test_trades = backtest(signal, direction, params, train_hi, test_hi, expiration, quantity)
+    return params, train, test_trades
+
+
+def walk_forward(ohlcv, strategy, direction, ema_check, train_len, test_len, expiration,
+                 quantity=0.01, min_trades=10, workers=None):
+    """Optimize every window; returns [(train_lo, train_hi, test_hi, params, train_stats, test_trades)].
+
+    The last entry is the live window (train ending at the newest candle, no test).
+    """
+    length = len(ohlcv["close"])
+    first = max(MIN_HISTORY - 1, 15)
+    bounds = []
+    train_lo = first
+    while train_lo + train_len + test_len <= length:
+        bounds.append((train_lo, train_lo + train_len, train_lo + train_len + test_len))
+        train_lo += test_len
+    bounds.append((max(first, length - train_len), length, length))
+
+    combos = build_combos(strategy, direction)
+    tasks = [(strategy, direction, ema_check, combos, expiration, quantity, min_trades, *b) for b in bounds]
+
+    shm = shared_memory.SharedMemory(create=True, size=len(COLUMNS) * length * 8)
+    try:
+        block = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=shm.buf)
+        for row, name in enumerate(COLUMNS):
+            block[row] = ohlcv[name]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach,
+                                 initargs=(shm.name, length)) as pool:
+            results = list(pool.map(optimize_window, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+    return [(*b, *r) for b, r in zip(bounds, results)]
+
+
+def tuned_file(symbol, strategy, direction, timeframe):
+    """The file long_short_future_btc_trade.py loads its tuned thresholds from."""
+    return f"long_short_{symbol}_{strategy}_{direction}_{timeframe}.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("strategy", type=str.upper, choices=sorted(PARAM_GRID))
+    parser.add_argument("direction", type=str.upper, choices=("LONG", "SHORT"))
+    parser.add_argument("--symbol", default="BTCUSDC")
+    parser.add_argument("--timeframe", default="3m")
+    parser.add_argument("--ema-check", type=str.upper, default="EMA50", help="the bot's 5th argument")
+    parser.add_argument("--quantity", type=float, default=0.01)
+    parser.add_argument("--days", type=float, default=180, help="history to walk over")
+    parser.add_argument("--train-days", type=float, default=30)
+    parser.add_argument("--test-days", type=float, default=7)
+    parser.add_argument("--min-trades", type=int, default=10, help="fewer train trades rank below any that have enough")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--store", help="kline store directory")
+    parser.add_argument("--offline", action="store_true", help="use only candles already in the store")
+    parser.add_argument("--report", help="CSV path for the per-window table")
+    parser.add_argument("--out", help="tuned config path, default the file the bot loads")
+    args = parser.parse_args()
+
+    store = KlineStore(args.store, "futures") if args.store else KlineStore(market="futures")
+    step = interval_to_milliseconds(args.timeframe)
+    span_ms = int(args.days * 86400 * 1000) + MIN_HISTORY * step
+    if not args.offline:
+        from binance.client import Client
+        from rate_limiter import rate_limited
+        from key_config import apikey, apisecret
+        end_ms = int(time.time() * 1000)
+        store.sync(rate_limited(Client(apikey, apisecret)), args.symbol, args.timeframe, end_ms - span_ms, end_ms)
+    _, last = store.bounds(args.symbol, args.timeframe)
+    end_ms = last + step if last is not None else int(time.time() * 1000)   # up to the newest stored candle
+    arr = store.load(args.symbol, args.timeframe, end_ms - span_ms, end_ms)
+    train_len = int(args.train_days * 86400 * 1000 // step)
+    test_len = int(args.test_days * 86400 * 1000 // step)
+    if len(arr) < MIN_HISTORY + train_len:
+        print(f"Only {len(arr)} {args.symbol} {args.timeframe} candles; need {MIN_HISTORY + train_len}. Exiting.")
+        return
+    ohlcv = {name: np.asarray(arr[name], dtype=np.float64) for name in COLUMNS}
+    expiration = -(-CANCEL_AFTER * 1000 // step)
+
+    t0 = time.time()
+    windows = walk_forward(ohlcv, args.strategy, args.direction, args.ema_check, train_len, test_len,
+                           expiration, args.quantity, args.min_trades, args.workers)
+    elapsed = time.time() - t0
+
+    def day(idx):
+        return str(np.datetime64(int(arr["open_time"][min(idx, len(arr) - 1)]), "ms").astype("datetime64[D]"))
+
+    rows, oos_trades = [], []
+    for train_lo, train_hi, test_hi, params, train, test_trades in windows[:-1]:
+        test = summarize(test_trades)
+        oos_trades += test_trades
+        rows.append({"train_from": day(train_lo), "test_from": day(train_hi), "test_to": day(test_hi - 1),
+                     **params, "train_profit": train["total_profit"], "train_trades": train["total_trades"],
+                     "test_profit": test["total_profit"], "test_trades": test["total_trades"],
+                     "test_win_rate": test["win_rate"]})
+    table = pd.DataFrame(rows)
+    if args.report and rows:
+        table.to_csv(args.report, index=False)
+    oos = summarize(oos_trades)
+
+    train_lo, train_hi, _, params, train, _ = windows[-1]
+    out = args.out or tuned_file(args.symbol, args.strategy, args.direction, args.timeframe)
+    with open(out, "w") as f:
+        json.dump({
+            "symbol": args.symbol, "strategy": args.strategy, "direction": args.direction,
+            "timeframe": args.timeframe, "ema_check": args.ema_check,
+            "train_from": day(train_lo), "train_to": day(train_hi - 1),
+            "params": params,
+            "train": train,
+            "out_of_sample": {**oos, "windows": len(rows)},
+        }, f, indent=4)
+
+    print(f"\n========= WALK-FORWARD ({args.strategy} {args.direction} {args.symbol} {args.timeframe}) =========")
+    print(f"Candles:      {len(arr)}, {len(windows) - 1} windows of {args.train_days:g}d train / {args.test_days:g}d test")
+    print(f"Combinations: {len(build_combos(args.strategy, args.direction))} per window, {elapsed:.1f}s")
+    if rows:
+        with pd.option_context("display.width", 200, "display.max_columns", None):
+            print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(f"Out-of-sample: {oos['total_trades']} trades, win rate {oos['win_rate']:.2%}, "
+              f"profit {oos['total_profit']:+.2f}, max drawdown {oos['max_drawdown']:.2f}")
+    print(f"Live params ({day(train_lo)} .. {day(train_hi - 1)}): {params}")
+    print(f"Train:        {train['total_trades']} trades, profit {train['total_profit']:+.2f}")
+    print(f"Config:       {out}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()